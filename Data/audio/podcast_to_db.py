@@ -1,28 +1,35 @@
 import json
 import os
-from typing import List
+import sys
+from typing import Iterator, List, Tuple
 from langchain_core.documents import Document
-from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 import datetime
 
+# Корень проекта в sys.path, чтобы импортировать общие модули (sharded_store и т.д.)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from sharded_store import BACKEND_PATHS, VECTOR_BACKEND, ShardedVectorStore
+from metadata_index import canonicalize_metadata, normalize_source_type
+from bulk_load import BULK_BATCH_SIZE, bulk_load
+from index_versions import publish_version, stage_version
+from token_chunker import TokenChunker, print_reports
+
 # --- НАСТРОЙКИ ПУТЕЙ ---
 # Папка, куда ты сложил JSON-файлы подкастов
 PODCASTS_DIR = os.path.join("Data/audio", "jsons")
 # Путь к ТЕКУЩЕЙ базе данных (где уже лежат таблицы)
-CHROMA_PATH = "Data/chroma_db" 
+DB_PATH = BACKEND_PATHS[VECTOR_BACKEND]  # База до появления версий (index_versions.py): из нее копируется первая версия
 
-def create_documents_from_podcasts(directory: str) -> List[Document]:
+def iter_podcast_segments(directory: str) -> Iterator[Tuple[str, str, dict]]:
     """
-    Читает JSON-файлы подкастов и превращает их в объекты Document
-    с богатым контекстом и метаданными.
+    Читает JSON-файлы подкастов по одному и отдает сегменты: (шапка с контекстом, текст, метаданные).
+    Генератор: в памяти только текущий файл (так же читает ingest_pipeline.py).
     """
     if not os.path.exists(directory):
         print(f"❌ Ошибка: Папка {directory} не найдена!")
-        return []
+        return
 
     files = [f for f in os.listdir(directory) if f.endswith('.json')]
-    documents = []
     print(f"🎙️ Найдено файлов подкастов: {len(files)}. Начинаем обработку...")
 
     for filename in files:
@@ -42,6 +49,7 @@ def create_documents_from_podcasts(directory: str) -> List[Document]:
                 speaker = podcast.get('speaker', 'Эксперт')
                 role = podcast.get('role', 'Сотрудник вуза')
                 url = podcast.get('url', '')
+                source_type = normalize_source_type(podcast.get('source_type', 'Подкаст'))
 
                 # 2. Проходим по сегментам (смысловым кускам)
                 for segment in podcast.get('segments', []):
@@ -61,18 +69,18 @@ def create_documents_from_podcasts(directory: str) -> List[Document]:
                     # --- ФОРМИРОВАНИЕ ТЕКСТА (RICH CONTENT) ---
                     # Мы "вшиваем" контекст прямо в текст, чтобы нейросеть понимала, 
                     # о чем речь, даже если найдет маленький кусочек.
-                    page_content = f"""
-Источник: Подкаст о направлении {prog_code} "{prog_name}".
+                    # Шапка повторяется в каждом чанке сегмента
+                    prefix = f"""Источник: Подкаст о направлении {prog_code} "{prog_name}".
 Спикер: {speaker} ({role}).
 Тип информации: {"Обзор направления" if seg_type == 'summary' else "Детали и ответы на вопросы"}
 Ключевые темы: {keywords_str}
 Текст:
-{text}
-""".strip()
+"""
 
                     # --- МЕТАДАННЫЕ (ДЛЯ ФИЛЬТРОВ) ---
-                    metadata = {
-                        "source_type": "podcast",      # Маркер источника (ВАЖНО!)
+                    # canonicalize_metadata: одно написание кода/типа источника во всей базе
+                    metadata = canonicalize_metadata({
+                        "source_type": source_type,    # Маркер источника (ВАЖНО!) - он же выбирает шард
                         "created_at": datetime.datetime.now().strftime("%Y-%m-%d"),
                         "program_code": prog_code,     # Ключ для связи с таблицей
                         "speaker": speaker,
@@ -81,13 +89,38 @@ def create_documents_from_podcasts(directory: str) -> List[Document]:
                         "keywords": keywords_str,
                         "url": url
                         
-                    }
+                    })
 
-                    documents.append(Document(page_content=page_content, metadata=metadata))
+                    yield prefix, text, metadata
 
         except Exception as e:
             print(f"❌ Ошибка при чтении {filename}: {e}")
 
+
+def create_documents_from_podcasts(directory: str) -> List[Document]:
+    """
+    Читает JSON-файлы подкастов и превращает их в объекты Document
+    с богатым контекстом и метаданными.
+    """
+    # Сегменты копим целиком, а режем по токенам e5 одним батчем в конце
+    prefixes, texts, metadatas = [], [], []
+    for prefix, text, metadata in iter_podcast_segments(directory):
+        prefixes.append(prefix)
+        texts.append(text)
+        metadatas.append(metadata)
+
+    if not texts:
+        return []
+
+    # Длинные summary-сегменты раньше молча обрезались на 512 токенах - теперь режем по предложениям
+    chunker = TokenChunker()
+    before = chunker.report([prefix + text for prefix, text in zip(prefixes, texts)])
+    documents = []
+    for chunks, metadata in zip(chunker.split_with_prefix(prefixes, texts), metadatas):
+        for i, chunk in enumerate(chunks):
+            documents.append(Document(page_content=chunk, metadata={**metadata, "chunk": i}))
+    print_reports(before, chunker.report([doc.page_content for doc in documents]), "Токены подкастов")
+
     return documents
 
 def main():
@@ -102,22 +135,30 @@ def main():
 
     # 2. Инициализация модели (ОБЯЗАТЕЛЬНО ТА ЖЕ, ЧТО И ДЛЯ ТАБЛИЦ!)
     print("🧠 Загрузка модели эмбеддингов (intfloat/multilingual-e5-large)...")
-    embeddings = HuggingFaceEmbeddings(model_name="intfloat/multilingual-e5-large")
+    embeddings = HuggingFaceEmbeddings(
+        model_name="intfloat/multilingual-e5-large",
+        encode_kwargs={"batch_size": BULK_BATCH_SIZE},  # Пачки по длине собирает bulk_load, модель считает их целиком
+    )
 
-    # 3. Подключение к существующей базе и добавление данных
-    print(f"💾 Подключение к базе '{CHROMA_PATH}'...")
+    # 3. Новая версия индекса (копия текущей) и добавление данных
+    db_path = stage_version(VECTOR_BACKEND, DB_PATH)
+    print(f"💾 Подключение к базе '{db_path}'...")
     
-    # Внимание: здесь мы НЕ удаляем папку (shutil.rmtree), а просто подключаемся
-    vectorstore = Chroma(
-        persist_directory=CHROMA_PATH, 
+    # Внимание: папку базы НЕ удаляем, пересоздаем только шард подкастов
+    # (повторный запуск больше не дублирует фрагменты)
+    vectorstore = ShardedVectorStore(
+        persist_directory=db_path, 
         embedding_function=embeddings
     )
     
-    print("🚀 Добавление новых документов...")
-    vectorstore.add_documents(documents=docs)
+    print("🚀 Добавление новых документов (массовая загрузка: эмбеддинги, затем запись)...")
+    report = bulk_load(vectorstore, docs, embeddings.embed_documents, reset=True)
+    # Контрольные запросы -> атомарная замена манифеста: процессы переключатся между запросами
+    publish_version(vectorstore, db_path)
     
-    print(f"✅ УСПЕХ! В базу добавлено {len(docs)} фрагментов подкастов.")
-    print("Теперь база содержит данные и из таблиц, и из подкастов.")
+    print(f"✅ УСПЕХ! В шард подкастов добавлено {len(docs)} фрагментов.")
+    print(f"⏱️ {report.line()}")
+    print("Таблицы и подкасты лежат в соседних коллекциях одной базы.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
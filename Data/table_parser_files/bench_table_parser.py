@@ -0,0 +1,86 @@
+'''
+Бенчмарк парсера каталога на сохраненной странице (debug_stankin.txt, без сети):
+старый extract_structured_data_legacy (v5, десяток regex на блок) против однопроходного
+extract_structured_data (v6, одно скомпилированное выражение). Плюс сверка полей: где результаты расходятся.
+
+Запуск:
+    python Data/table_parser_files/bench_table_parser.py              # фикстура по умолчанию
+    python Data/table_parser_files/bench_table_parser.py --repeat 500 --scale 20
+'''
+
+import argparse
+import os
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from table_parser import extract_structured_data, extract_structured_data_legacy
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "debug_stankin.txt")
+
+
+def timed(extract: Callable[[str], List[Dict]], text: str, repeat: int) -> List[float]:
+    extract(text)  # прогрев (компиляция и кэш re)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extract(text)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def _same(old, new) -> bool:
+    # Старый парсер хранит все строками, а прочерк в баллах превращает в "N/A"
+    if new is None:
+        return old in ("N/A", "—", None)
+    return str(old) == str(new)
+
+
+def compare(old: List[Dict], new: List[Dict]) -> List[str]:
+    diffs = []
+    if len(old) != len(new):
+        diffs.append(f"программ: было {len(old)}, стало {len(new)}")
+    for o, n in zip(old, new):
+        for key in sorted(set(o) | set(n)):
+            if not _same(o.get(key), n.get(key)):
+                diffs.append(f"{o.get('Код')} {key}: {o.get(key)!r} -> {n.get(key)!r}")
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture", default=FIXTURE_PATH)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--scale", type=int, default=1, help="склеить фикстуру N раз (имитация большого каталога)")
+    args = parser.parse_args()
+
+    with open(args.fixture, "r", encoding="utf-8") as f:
+        text = f.read()
+    text = " ".join([text] * args.scale)
+
+    old_ms = timed(extract_structured_data_legacy, text, args.repeat)
+    new_ms = timed(extract_structured_data, text, args.repeat)
+    old, new = extract_structured_data_legacy(text), extract_structured_data(text)
+
+    print(f"📄 Фикстура: {args.fixture} x{args.scale} ({len(text)} символов), программ: {len(new)}, повторов: {args.repeat}")
+    print("=" * 56)
+    print(f"{'Парсер':<12}{'p50, мс':>12}{'p95, мс':>12}{'программ/с':>16}")
+    print("-" * 56)
+    for name, times, result in (("v5 legacy", old_ms, old), ("v6", new_ms, new)):
+        p50, p95 = np.percentile(times, [50, 95])
+        print(f"{name:<12}{p50:>12.2f}{p95:>12.2f}{len(result) / (p50 / 1000):>16.0f}")
+    print("=" * 56)
+    print(f"⚡ Ускорение (p50): x{np.median(old_ms) / np.median(new_ms):.1f}")
+
+    diffs = compare(old, new)
+    if diffs:
+        print(f"\n🔍 Расхождения с v5 ({len(diffs)}):")
+        for line in diffs[:20 * args.scale]:
+            print("   " + line)
+    else:
+        print("\n✅ Результаты совпадают с v5")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,25 @@
 import json
 import os
+import sys
 import datetime
 import re
-from typing import List
+from typing import Iterable, Iterator, List
 from langchain_core.documents import Document
-from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 
+# Корень проекта в sys.path, чтобы импортировать общие модули (sharded_store и т.д.)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from sharded_store import BACKEND_PATHS, VECTOR_BACKEND, ShardedVectorStore
+from metadata_index import canonicalize_metadata
+from bulk_load import BULK_BATCH_SIZE, bulk_load
+from index_versions import publish_version, stage_version
+from token_chunker import TokenChunker
+from subject_mask import parse_exams
+
 # --- НАСТРОЙКИ ---
 # Проверь, что имя файла точное. В твоем коде было "Data/table_parser_files", я оставил как у тебя.
 JSON_PATH = os.path.join("Data/table_parser_files", "stankin_programs.json")
-CHROMA_PATH = "Data/chroma_db"
+DB_PATH = BACKEND_PATHS[VECTOR_BACKEND]  # База до появления версий (index_versions.py): из нее копируется первая версия
 
 def clean_int(value) -> int:
     """Превращает строку '182 100' или '70' в число 182100. Если мусор - возвращает 0."""
@@ -61,6 +70,11 @@ def prettify_exams(raw_text: str) -> str:
     return text
 
 
+def score_years(prog: dict) -> List[int]:
+    """Годы, за которые в записи есть проходной балл (ключи Балл_<год>), от новых к старым."""
+    return sorted((int(key[5:]) for key in prog if re.fullmatch(r"Балл_\d{4}", key)), reverse=True)
+
+
 def create_documents(path: str) -> List[Document]:
     if not os.path.exists(path):
         print(f"❌ Файл {path} не найден!")
@@ -71,9 +85,12 @@ def create_documents(path: str) -> List[Document]:
     with open(path, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
-    documents = []
     print(f"🔄 Обработка {len(data)} программ...")
+    return list(iter_program_documents(data))
 
+
+def iter_program_documents(data: Iterable[dict]) -> Iterator[Document]:
+    """Записи каталога -> Document по одному (текст для LLM + метаданные для фильтров). Используется и в ingest_pipeline.py."""
     for prog in data:
         # 1. ПОДГОТОВКА ДАННЫХ
         # Берем русские значения напрямую из JSON
@@ -85,9 +102,14 @@ def create_documents(path: str) -> List[Document]:
         subjects_str = ", ".join(raw_subjects_list)
 
         exams_pretty = prettify_exams(prog.get('Предметы', ''))
+        # Число лет с баллами зависит от каталога (у магистратуры и аспирантуры их может быть меньше)
+        years = score_years(prog)
+        # Обязательные предметы и группы "на выбор" (И/Ф) - битовыми масками, см. subject_mask.py
+        exam_mask = parse_exams(prog.get('Предметы', ''))
 
         # 2. СБОРКА МЕТАДАННЫХ (Ключи English, Значения Russian)
-        metadata = {
+        # canonicalize_metadata приводит форму/уровень/код к одному написанию (для фильтров и индекса)
+        metadata = canonicalize_metadata({
             "source_type": "Таблица",
             "created_at": datetime.datetime.now().strftime("%Y-%m-%d"),
             
@@ -98,6 +120,7 @@ def create_documents(path: str) -> List[Document]:
             
             # Поле с предметами (СТРОКА, не список!)
             "subjects": subjects_str, 
+            **exam_mask.metadata(),  # subj_required, subj_choices, subj_any (int)
             
             # Числовые поля (int)
             "b_places": clean_int(prog.get('Бюджет', 0)),
@@ -107,11 +130,12 @@ def create_documents(path: str) -> List[Document]:
             "price_rf": clean_int(prog.get('Стоимость_РФ', 0)),
             "price_in": clean_int(prog.get('Стоимость_Иностр', 0)),
             
-            "score_last": clean_int(prog.get('Балл_2025', 0))
-        }
+            "score_last": clean_int(prog.get(f'Балл_{years[0]}', 0)) if years else 0
+        })
 
         # 3. СБОРКА ТЕКСТА (PAGE CONTENT)
         # То, что читает LLM. Красивый русский текст.
+        scores_text = "\n".join(f"{year} год: {prog.get(f'Балл_{year}') or '-'}" for year in years) or "нет данных"
         content = f"""
 Направление: {prog['Код']} {prog['Направление']}
 Уровень образования: {prog['Уровень']}
@@ -129,18 +153,11 @@ def create_documents(path: str) -> List[Document]:
 - Для иностранных граждан: {metadata['price_in']} руб.
 
 Проходные баллы прошлых лет (Бюджет):
-2025 год: {prog.get('Балл_2025', '-')}
-2024 год: {prog.get('Балл_2024', '-')}
-2023 год: {prog.get('Балл_2023', '-')}
-2022 год: {prog.get('Балл_2022', '-')}
-2021 год: {prog.get('Балл_2021', '-')}
+{scores_text}
 """.strip()
 
         # Создаем документ
-        doc = Document(page_content=content, metadata=metadata)
-        documents.append(doc)
-
-    return documents
+        yield Document(page_content=content, metadata=metadata)
 
 def main():
     # 1. Генерация документов
@@ -148,6 +165,13 @@ def main():
     if not docs:
         return
 
+    # Строки таблицы не режем (это одна запись с метаданными), но проверяем, что они влезают в окно e5
+    chunker = TokenChunker()
+    report = chunker.report([doc.page_content for doc in docs])
+    print(f"📏 Токены таблиц: {report.line()}")
+    if report.truncated:
+        print(f"⚠️ {report.truncated} документов длиннее {chunker.max_tokens} токенов - хвост будет обрезан моделью!")
+
     # Выведем пример для проверки
     print("\n--- ПРИМЕР МЕТАДАННЫХ (№1) ---")
     print(json.dumps(docs[0].metadata, indent=4, ensure_ascii=False))
@@ -155,23 +179,27 @@ def main():
 
     # 2. Инициализация модели
     print("🧠 Загрузка модели эмбеддингов...")
-    embeddings = HuggingFaceEmbeddings(model_name="intfloat/multilingual-e5-large")
+    embeddings = HuggingFaceEmbeddings(
+        model_name="intfloat/multilingual-e5-large",
+        encode_kwargs={"batch_size": BULK_BATCH_SIZE},  # Пачки по длине собирает bulk_load, модель считает их целиком
+    )
 
-    # 3. Сохранение в базу
-    print(f"💾 Создание базы данных в '{CHROMA_PATH}'...")
-    
-    # Удаляем старую базу, чтобы не было конфликтов
-    if os.path.exists(CHROMA_PATH):
-        import shutil
-        shutil.rmtree(CHROMA_PATH)
-
-    vectorstore = Chroma.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        persist_directory=CHROMA_PATH
+    # 3. Сохранение в базу: в новую версию индекса (копию текущей), работающие процессы пока читают старую
+    db_path = stage_version(VECTOR_BACKEND, DB_PATH)
+    print(f"💾 Заполнение шарда таблиц в '{db_path}'...")
+
+    vectorstore = ShardedVectorStore(
+        persist_directory=db_path,
+        embedding_function=embeddings
     )
+    # Пересоздаем только коллекцию таблиц, подкасты и остальные шарды не трогаем.
+    # Массовая загрузка: сначала все эмбеддинги, потом запись крупными пачками
+    report = bulk_load(vectorstore, docs, embeddings.embed_documents, reset=True)
+    # Контрольные запросы -> атомарная замена манифеста: процессы переключатся между запросами
+    publish_version(vectorstore, db_path)
     
     print(f"✅ УСПЕХ! Векторная база создана. Загружено {len(docs)} объектов.")
+    print(f"⏱️ {report.line()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,17 +2,24 @@
 
 
 import os
+import sys
 import json
-from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 
+# Корень проекта в sys.path, чтобы импортировать общие модули (sharded_store и т.д.)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from sharded_store import VECTOR_BACKEND, ShardedVectorStore, index_path
+
 # Путь должен быть ТОЧНО такой же, как в create_db.py
-CHROMA_PATH = "Data/chroma_db"
+DB_PATH = index_path(VECTOR_BACKEND)  # Текущая версия индекса для VECTOR_BACKEND: chroma / numpy / snapshot
+# MMR: 6 непохожих документов из 40 кандидатов (не больше двух на программу / спикера).
+# False - обычные 6 ближайших, удобно сравнить выдачу
+USE_MMR = True
 
 def main():
     # 1. ПРОВЕРКА ПУТИ
-    if not os.path.exists(CHROMA_PATH):
-        print(f"❌ ОШИБКА: Папка {CHROMA_PATH} не найдена!")
+    if not os.path.exists(DB_PATH):
+        print(f"❌ ОШИБКА: Папка {DB_PATH} не найдена!")
         print("Сначала запусти create_db.py")
         return
 
@@ -21,9 +28,9 @@ def main():
     embeddings = HuggingFaceEmbeddings(model_name="intfloat/multilingual-e5-large")
 
     # 2. ПОДКЛЮЧЕНИЕ К БАЗЕ
-    print(f"📂 Подключаемся к базе в '{CHROMA_PATH}'...")
-    vectorstore = Chroma(
-        persist_directory=CHROMA_PATH, 
+    print(f"📂 Подключаемся к базе в '{DB_PATH}'...")
+    vectorstore = ShardedVectorStore(
+        persist_directory=DB_PATH, 
         embedding_function=embeddings
     )
 
@@ -44,13 +51,17 @@ def main():
         print(f"❓ ВОПРОС: {q}")
         print(f"{'='*40}")
         
-        # Ищем 2 самых подходящих документа
-        results = vectorstore.similarity_search_with_score(q, k=6)
+        # Ищем 6 самых подходящих документов по всем шардам
+        # (оценка - нормированная релевантность, больше = лучше; для cosine это 1 - distance)
+        if USE_MMR:
+            results = vectorstore.max_marginal_relevance_search_with_relevance_scores(q, k=6, fetch_k=40)
+        else:
+            results = vectorstore.similarity_search_with_relevance_scores(q, k=6)
 
         for i, (doc, score) in enumerate(results):
-            quality = "🟢 ОТЛИЧНО" if score < 0.4 else "🟡 НОРМ" if score < 0.8 else "🔴 ТАК СЕБЕ"
+            quality = "🟢 ОТЛИЧНО" if score > 0.8 else "🟡 НОРМ" if score > 0.6 else "🔴 ТАК СЕБЕ"
             
-            print(f"\n📄 Документ №{i+1} | Оценка (Distance): {score:.4f} [{quality}]")
+            print(f"\n📄 Документ №{i+1} | Оценка (Relevance): {score:.4f} [{quality}]")
             print(f"📌 Код: {doc.metadata.get('program_code')}")
             
             # Выводим полезные метаданные, чтобы убедиться, что всё загрузилось верно
@@ -2,22 +2,33 @@ import requests
 import logging
 import re
 import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from typing import Optional, List, Dict
 from bs4 import BeautifulSoup, Comment
 import os
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 
+# --- НАСТРОЙКИ ---
+# Каталоги программ: уровень -> страница. Уровень каталога надежнее, чем угадывание по коду
+CATALOGS = {
+    "Бакалавриат/Специалитет": "https://priem.stankin.ru/bakalavriatispetsialitet/training_programs/",
+    "Магистратура": "https://priem.stankin.ru/magistratura/training_programs/",
+    "Аспирантура": "https://priem.stankin.ru/aspirantura/training_programs/",
+}
+OUTPUT_PATH = "Data//table_parser_files//stankin_programs.json"
+
 # =========================================================
 # 1. ЗАГРУЗКА И ОЧИСТКА (Твои функции, они ок)
 # =========================================================
 
-def fetch_html_content(url: str) -> Optional[str]:
+def fetch_html_content(url: str, session: Optional[requests.Session] = None) -> Optional[str]:
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        response = requests.get(url, timeout=15, headers=headers)
+        response = (session or requests).get(url, timeout=15, headers=headers)
         response.encoding = response.apparent_encoding
         return response.text
     except Exception as e:
@@ -52,6 +63,8 @@ def clean_html_content(html_content: str) -> str:
 def get_program_level(code: str) -> str:
     if ".03." in code: return "Бакалавриат"
     if ".05." in code: return "Специалитет"
+    if ".04." in code: return "Магистратура"
+    if ".06." in code or re.fullmatch(r"\d\.\d\.\d{1,2}\.?", code): return "Аспирантура"
     return "Магистратура/Другое"
 
 
@@ -92,8 +105,9 @@ def normalize_subjects(raw_subjects: str) -> List[str]:
     return sorted(list(set(final_list)))
 
 
-def extract_structured_data(full_text: str) -> List[Dict]:
+def extract_structured_data_legacy(full_text: str) -> List[Dict]:
     """
+    Оставлено для сравнения (bench_table_parser.py), рабочий путь - extract_structured_data().
     Парсинг v5.0: Логика токенов. Мы не ищем 'число после слова', 
     мы берем все числа в блоке и расставляем их по порядку.
     """
@@ -197,6 +211,152 @@ def extract_structured_data(full_text: str) -> List[Dict]:
 
     return programs
 
+# =========================================================
+# 2.1 ОДНОПРОХОДНЫЙ ПАРСЕР (v6)
+# =========================================================
+
+# Блоки программ: код направления (XX.XX.XX[.XX]) или научной специальности аспирантуры (X.X.X)
+_BLOCK_SPLIT_RE = re.compile(r'(?<![\d.])(\d{2}\.\d{2}\.\d{2}(?:\.\d{2})?|\d\.\d\.\d{1,2})(?![\d])')
+# Все поля блока одним выражением: finditer проходит текст блока один раз слева направо,
+# имя сработавшей группы говорит, какое поле найдено
+_FIELDS_RE = re.compile(
+    r'(?P<form>Форма обучения[:\s]*(?P<form_v>[а-яА-ЯёЁ-]+))'
+    r'|(?P<price>(?<![\d\s])\s?(?P<price_v>\d{1,3}(?:\s\d{3})*|\d+)\s*руб)'
+    r'|(?P<subjects>Предметы[:\s]*(?P<subjects_v>.*?)\s*(?=Количество мест|$))'
+    r'|(?P<seats>Количество мест(?P<seats_v>.*?)(?=Отдельная квота|Проходные баллы|$))'
+    r'|(?P<scores>Проходные баллы[:\s]*(?P<years_v>(?:(?:19|20)\d{2}\s*)+)(?P<scores_v>(?:(?:\d{2,3}|—|-)(?:\s+|$))*))',
+    re.S,
+)
+# Токены мест: 1-3 цифры или прочерк (годы и цены отсекаются)
+_SEAT_TOKEN_RE = re.compile(r'(?<!\d)(\d{1,3}|—)(?!\d)')
+_NAME_JUNK_RE = re.compile(r'^[\s.\-]+')
+
+
+@dataclass
+class ProgramRecord:
+    code: str
+    name: str
+    level: str
+    form: str = "очная"
+    subjects: str = "N/A"
+    subjects_list: List[str] = field(default_factory=list)
+    budget: int = 0
+    paid_rf: int = 0
+    paid_foreign: int = 0
+    cost_rf: int = 0
+    cost_foreign: int = 0
+    # год -> проходной балл (None - прочерк); годов столько, сколько на странице
+    scores: Dict[int, Optional[int]] = field(default_factory=dict)
+
+    def to_json(self) -> Dict:
+        """Формат stankin_programs.json (ключи как раньше, баллы - Балл_<год> за каждый год)."""
+        data = {
+            "Код": self.code,
+            "Направление": self.name,
+            "Форма": self.form,
+            "Предметы": self.subjects,
+            "Предметы_Список": self.subjects_list,
+            "Бюджет": self.budget,
+            "Платное_РФ": self.paid_rf,
+            "Платное_Иностр": self.paid_foreign,
+            "Стоимость_РФ": self.cost_rf,
+            "Стоимость_Иностр": self.cost_foreign,
+        }
+        for year in sorted(self.scores, reverse=True):
+            data[f"Балл_{year}"] = self.scores[year]
+        data["Уровень"] = self.level
+        return data
+
+
+def _seat_value(token: str) -> int:
+    return 0 if token == '—' else int(token)
+
+
+def parse_block(code: str, text: str, level: Optional[str] = None) -> Optional[ProgramRecord]:
+    """Один блок программы -> запись. None, если это не карточка программы (нет "Форма обучения")."""
+    if len(text) < 50:
+        return None
+    record = None
+    prices: List[int] = []
+    # Берется первое вхождение каждого поля: хвост последнего блока может зацепить шапку сводной таблицы
+    seen = set()
+    for match in _FIELDS_RE.finditer(text):
+        kind = match.lastgroup
+        if kind in seen and kind != "price":
+            continue
+        seen.add(kind)
+        if kind == "form":
+            record = ProgramRecord(code=code, name=_NAME_JUNK_RE.sub('', text[:match.start()].strip()) or "N/A",
+                                   level=level or get_program_level(code), form=match["form_v"])
+        elif record is None:
+            continue
+        elif kind == "price":
+            prices.append(int(match["price_v"].replace(' ', '')))
+        elif kind == "subjects":
+            record.subjects = match["subjects_v"].strip() or "N/A"
+            record.subjects_list = normalize_subjects(record.subjects)
+        elif kind == "seats":
+            tokens = _SEAT_TOKEN_RE.findall(match["seats_v"])
+            # Порядок колонок: [Бюджет, Платное РФ, Платное Иностр], берем с конца - так надежнее
+            if len(tokens) >= 3:
+                record.budget, record.paid_rf, record.paid_foreign = map(_seat_value, tokens[-3:])
+            elif tokens:
+                record.budget = _seat_value(tokens[0])
+        elif kind == "scores":
+            years = [int(y) for y in match["years_v"].split()]
+            values = match["scores_v"].split()
+            record.scores = {year: (int(v) if v.isdigit() else None) for year, v in zip(years, values)}
+    if record is None:
+        return None
+    record.cost_rf = prices[0] if prices else 0
+    record.cost_foreign = prices[1] if len(prices) > 1 else 0
+    return record
+
+
+def extract_programs(full_text: str, level: Optional[str] = None) -> List[ProgramRecord]:
+    """Парсинг v6: текст каталога -> типизированные записи, каждый блок проходится один раз."""
+    parts = _BLOCK_SPLIT_RE.split(full_text)
+    programs = []
+    for i in range(1, len(parts) - 1, 2):
+        record = parse_block(parts[i].strip(), parts[i + 1], level)
+        if record is not None:
+            programs.append(record)
+    return programs
+
+
+def extract_structured_data(full_text: str, level: Optional[str] = None) -> List[Dict]:
+    return [record.to_json() for record in extract_programs(full_text, level)]
+
+
+def _catalog_level(name: str) -> Optional[str]:
+    """Бакалавриат и специалитет на одной странице - их различаем по коду."""
+    return None if "/" in name else name
+
+
+def scrape_catalogs(catalogs: Dict[str, str] = CATALOGS) -> List[ProgramRecord]:
+    """Все каталоги параллельно (сеть - основное время), разбор - по мере готовности страниц."""
+    def scrape(item):
+        name, url = item
+        html = fetch_html_content(url, session)
+        if not html:
+            logging.error(f"Каталог '{name}' не загружен: {url}")
+            return []
+        records = extract_programs(clean_html_content(html), _catalog_level(name))
+        logging.info(f"{name}: {len(records)} программ ({url})")
+        return records
+
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=len(catalogs)) as pool:
+        results = list(pool.map(scrape, catalogs.items()))
+
+    # Одна программа может быть в нескольких каталогах - оставляем первую
+    seen, programs = set(), []
+    for record in (r for records in results for r in records):
+        key = (record.code, record.form, record.level)
+        if key not in seen:
+            seen.add(key)
+            programs.append(record)
+    return programs
+
 def save_to_json(data: List[Dict], filename: str):
     """Сохраняет данные в JSON файл."""
     # Создаем папку data, если её нет
@@ -211,16 +371,8 @@ def save_to_json(data: List[Dict], filename: str):
 # =========================================================
 
 if __name__ == "__main__":
-    url = "https://priem.stankin.ru/bakalavriatispetsialitet/training_programs/"
-    print(f"Парсим: {url}")
-    
-    html = fetch_html_content(url)
-    if html:
-        print("1. HTML получен.")
-        clean_text = clean_html_content(html)
-        print("2. Текст очищен.")
-        data = extract_structured_data(clean_text)
-        print(f"3. Извлечено {len(data)} программ.")
-        
-        # Сохраняем результат
-        save_to_json(data, "Data//table_parser_files//stankin_programs.json")
\ No newline at end of file
+    print(f"Парсим каталоги: {', '.join(CATALOGS)}")
+    programs = scrape_catalogs()
+    print(f"Извлечено {len(programs)} программ.")
+    if programs:
+        save_to_json([record.to_json() for record in programs], OUTPUT_PATH)
@@ -0,0 +1,113 @@
+'''
+Бенчмарк двухэтапного поиска NumPy-бэкенда: знаковые биты + Хэмминг -> пересчет короткого списка
+полными векторами против точного перебора.
+
+Все шарды склеиваются в одну матрицу, запросы - золотой набор (Data/golden_queries.json). Меряются:
+- recall@k относительно точного поиска (и для сравнения - только Хэмминг, без пересчета);
+- задержка запроса p50/p95;
+- память, которую просматривает первый этап (коды), против матрицы векторов.
+--scale размножает корпус с шумом, чтобы увидеть поведение на базе в N раз больше текущей.
+
+Запуск из корня проекта:
+    python bench_binary.py                       # золотые вопросы кодируются моделью e5
+    python bench_binary.py --sample 200          # без модели: запросы = векторы базы с шумом
+    python bench_binary.py --scale 20 --dtype float16
+'''
+
+import argparse
+import time
+from typing import List
+import numpy as np
+from sharded_store import VECTOR_BACKEND, ShardedVectorStore, index_path
+from numpy_store import BINARY_MIN_SHORTLIST, NumpyVectorStore, hamming_distances, pack_signs
+from bench_vector_store import load_corpus, percentile
+from hnsw_tuning import encode_queries, exact_top_k, load_golden_queries, sample_queries
+
+# --- НАСТРОЙКИ ---
+# Множители короткого списка (k * factor кандидатов идут на пересчет)
+GRID_SHORTLIST = [2, 5, 10, 20, 50]
+
+
+def scale_corpus(matrix: np.ndarray, scale: int, seed: int = 0) -> np.ndarray:
+    """Корпус в scale раз больше: копии векторов с небольшим шумом (структура соседей как у настоящей базы)."""
+    if scale <= 1:
+        return matrix
+    rng = np.random.default_rng(seed)
+    copies = [matrix] + [matrix + rng.normal(scale=0.02, size=matrix.shape).astype(np.float32) for _ in range(scale - 1)]
+    return np.vstack(copies)
+
+
+def timed_search(store: NumpyVectorStore, queries: np.ndarray, k: int, repeat: int):
+    latencies, found = [], []
+    for query in queries:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            hits = store.search_by_vector(query, k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        found.append({i for i, _ in hits})
+    return latencies, found
+
+
+def recall(found: List[set], truth: List[set]) -> float:
+    return float(np.mean([len(f & t) / max(len(t), 1) for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бинарный первый проход + пересчет: скорость / память / recall@k")
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--sample", type=int, default=0, help="Случайных векторов базы как запросов (без модели)")
+    parser.add_argument("--repeat", type=int, default=20, help="Повторов каждого запроса для замера задержки")
+    parser.add_argument("--scale", type=int, default=1, help="Размножить корпус в N раз (с шумом)")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    parser.add_argument("--backend", default=VECTOR_BACKEND, choices=["chroma", "numpy"], help="Откуда брать эмбеддинги")
+    args = parser.parse_args()
+
+    corpus = load_corpus(ShardedVectorStore(persist_directory=index_path(args.backend), backend=args.backend))
+    if not corpus["ids"]:
+        print("❌ База пуста. Сначала соберите ее (ingest_pipeline.py)")
+        return
+    matrix = scale_corpus(np.asarray(corpus["embeddings"], dtype=np.float32), args.scale)
+    queries = sample_queries(matrix, args.sample) if args.sample else encode_queries(load_golden_queries())
+    truth = exact_top_k(matrix, queries, args.k)
+
+    store = NumpyVectorStore(dtype=args.dtype)
+    store.add_embeddings([""] * len(matrix), matrix, ids=[str(i) for i in range(len(matrix))])
+    print(f"📚 Векторов: {len(matrix)} x {matrix.shape[1]} ({args.dtype}), запросов: {len(queries)}, k={args.k}")
+
+    rows = []
+    exact_lat, found = timed_search(store, queries, args.k, args.repeat)
+    rows.append(("точный", len(matrix), exact_lat, recall(found, truth), store.vectors.nbytes))
+
+    start = time.perf_counter()
+    store.enable_binary_search()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    # Только Хэмминг, без пересчета: сколько теряет сама бинаризация
+    hamming_found = []
+    for query in queries:
+        distances = hamming_distances(store.codes, pack_signs(store.project(query))[0])
+        hamming_found.append(set(np.argsort(distances, kind="stable")[:args.k].tolist()))
+
+    for factor in GRID_SHORTLIST:
+        store.shortlist_factor = factor
+        latencies, found = timed_search(store, queries, args.k, args.repeat)
+        shortlist = min(max(args.k * factor, BINARY_MIN_SHORTLIST), len(matrix))
+        rows.append((f"бинарный x{factor}", shortlist, latencies, recall(found, truth), store.codes.nbytes))
+
+    print("\n" + "=" * 74)
+    print(f"{'Режим':<16}{'кандидатов':>12}{'p50, мс':>10}{'p95, мс':>10}{'recall@k':>10}{'память 1-го этапа':>16}")
+    print("-" * 74)
+    for name, shortlist, latencies, rec, nbytes in rows:
+        print(f"{name:<16}{shortlist:>12}{percentile(latencies, 50):>10.3f}{percentile(latencies, 95):>10.3f}"
+              f"{rec:>10.3f}{nbytes / 2**20:>13.2f} МБ")
+    print("=" * 74)
+    print(f"Только Хэмминг (без пересчета): recall@k {recall(hamming_found, truth):.3f}")
+    print(f"Коды: {store.codes.nbytes / 2**20:.2f} МБ против {store.vectors.nbytes / 2**20:.2f} МБ векторов "
+          f"(x{store.vectors.nbytes / store.codes.nbytes:.0f}), построение {build_ms:.0f} мс")
+    p50 = percentile(exact_lat, 50)
+    for name, _, latencies, rec, _ in rows[1:]:
+        print(f"   {name:<14} ускорение p50 x{p50 / max(percentile(latencies, 50), 1e-9):.1f}, потеря recall {1 - rec:.3f}")
+
+
+if __name__ == "__main__":
+    main()
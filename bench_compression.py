@@ -0,0 +1,184 @@
+'''
+Сжатие векторов NumPy-бэкенда: float16 и/или проекция PCA в меньшую размерность против полных float32.
+
+Для каждого шарда и каждой точки сетки (dtype x pca_dim) хранилище собирается в памяти из уже
+посчитанных эмбеддингов (модель для документов не нужна), затем меряются:
+- recall@k относительно точного поиска по исходным float32-векторам на золотом наборе запросов;
+- размер на диске (vectors.npy + projection.npy) и время подбора проекции;
+- p50/p95 задержки запроса (вместе с проекцией запроса).
+Итог - таблица CSV и выбранная точка (самая компактная с recall >= цели), записанная в Data/index_config.json
+как numpy:dtype / numpy:pca_dim: оттуда ее берет sharded_store.SHARDS при следующей загрузке шарда.
+В конфиг попадает только выбор по золотому набору: прогон с --sample (запросы = векторы базы с шумом)
+годится для оценки, но не для общего конфига, и всегда идет как --dry-run.
+
+Запуск из корня проекта:
+    python bench_compression.py                       # золотые вопросы кодируются моделью e5
+    python bench_compression.py --sample 200          # без модели: запросы = векторы базы с шумом
+    python bench_compression.py --target-recall 0.98 --dry-run
+'''
+
+import argparse
+import csv
+import datetime
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+import numpy as np
+from sharded_store import INDEX_CONFIG_PATH, SHARDS, VECTOR_BACKEND, ShardedVectorStore, index_path, load_index_config
+from numpy_store import PROJECTION_FILE, VECTORS_FILE, NumpyVectorStore
+from bench_vector_store import percentile
+from hnsw_tuning import encode_queries, exact_top_k, load_golden_queries, sample_queries
+
+# --- НАСТРОЙКИ ---
+RESULTS_CSV = "Data/compression_sweep.csv"
+GRID_DTYPE = ["float32", "float16"]
+# None - исходная размерность (1024 у e5-large)
+GRID_PCA_DIM = [None, 512, 384, 256, 128]
+
+
+def evaluate(
+    data: Dict[str, Any],
+    queries: np.ndarray,
+    truth: List[set],
+    dtype: str,
+    pca_dim: Optional[int],
+    k: int,
+    repeat: int,
+) -> Dict[str, Any]:
+    """Собирает NumpyVectorStore с заданным сжатием и меряет recall@k / задержку / размер."""
+    store = NumpyVectorStore(dtype=dtype, pca_dim=pca_dim)
+    start = time.perf_counter()
+    # id = номер строки: найденные позиции сразу сравниваются с эталоном
+    store.add_embeddings(data["documents"], data["embeddings"], ids=[str(i) for i in range(len(data["ids"]))])
+    build_s = time.perf_counter() - start
+
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            found = store.search_by_vector(query, k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        recalls.append(len({i for i, _ in found} & expected) / max(len(expected), 1))
+
+    # Размер на диске - ровно то, что сохраняет persist() (метаданные у всех точек одинаковые, их не считаем)
+    workdir = tempfile.mkdtemp(prefix="compression_sweep_")
+    try:
+        store.persist_directory = workdir
+        store.persist()
+        size_mb = sum(
+            os.path.getsize(os.path.join(workdir, name))
+            for name in (VECTORS_FILE, PROJECTION_FILE)
+            if os.path.exists(os.path.join(workdir, name))
+        ) / 2**20
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "numpy:dtype": dtype,
+        # Проекция не подбирается, если pca_dim не меньше числа документов или размерности
+        "numpy:pca_dim": store.projection.shape[1] if store.projection is not None else None,
+        "dim": store.vectors.shape[1],
+        "recall": float(np.mean(recalls)),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "build_s": build_s,
+        "size_mb": size_mb,
+    }
+
+
+def choose(results: List[Dict[str, Any]], target_recall: float) -> Dict[str, Any]:
+    """Самая компактная точка с recall >= цели (при равенстве - быстрее по p95); иначе максимум recall."""
+    good = [r for r in results if r["recall"] >= target_recall]
+    if good:
+        return min(good, key=lambda r: (round(r["size_mb"], 3), r["p95_ms"]))
+    return max(results, key=lambda r: (r["recall"], -r["size_mb"]))
+
+
+def save_results(results: List[Dict[str, Any]], path: str = RESULTS_CSV) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"💾 Результаты сетки: {path}")
+
+
+def write_index_config(chosen: Dict[str, Dict[str, Any]], path: str = INDEX_CONFIG_PATH) -> None:
+    """Дописывает выбранное сжатие в конфиг индексации (параметры HNSW и другие шарды сохраняются)."""
+    config = load_index_config(path)
+    for source, best in chosen.items():
+        entry = {k: v for k, v in config.get(source, {}).items() if not k.startswith("numpy:") and k != "compression"}
+        entry["numpy:dtype"] = best["numpy:dtype"]
+        if best["numpy:pca_dim"]:
+            entry["numpy:pca_dim"] = best["numpy:pca_dim"]
+        entry["compression"] = {
+            "recall_at_k": round(best["recall"], 4),
+            "size_mb": round(best["size_mb"], 3),
+            "p95_ms": round(best["p95_ms"], 3),
+            "tuned_at": datetime.date.today().isoformat(),
+        }
+        config[source] = entry
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=4)
+    print(f"✅ Сжатие записано в {path}. Пересоберите NumPy-базу (ingest_pipeline.py), чтобы оно применилось.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="float16 / PCA для NumPy-бэкенда: recall@k / размер / задержка")
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--sample", type=int, default=0, help="Случайных векторов базы как запросов (без модели)")
+    parser.add_argument("--repeat", type=int, default=20, help="Повторов каждого запроса для замера задержки")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--backend", default=VECTOR_BACKEND, choices=["chroma", "numpy"], help="Откуда брать эмбеддинги")
+    parser.add_argument("--shards", nargs="*", default=None, help="Какие source_type проверять (по умолчанию все непустые)")
+    parser.add_argument("--dry-run", action="store_true", help="Не записывать выбор в конфиг")
+    args = parser.parse_args()
+
+    store = ShardedVectorStore(persist_directory=index_path(args.backend), backend=args.backend)
+    golden = None if args.sample else encode_queries(load_golden_queries())
+
+    results: List[Dict[str, Any]] = []
+    chosen: Dict[str, Dict[str, Any]] = {}
+    for source in args.shards or list(SHARDS):
+        data = store.shards[source].get(include=["documents", "embeddings"])
+        if not data["ids"]:
+            print(f"⏭️ Шард '{source}' пуст, пропускаю")
+            continue
+        data["embeddings"] = np.asarray(data["embeddings"], dtype=np.float32)
+        queries = sample_queries(data["embeddings"], args.sample) if args.sample else golden
+        truth = exact_top_k(data["embeddings"], queries, args.k)
+
+        grid = list(itertools.product(GRID_DTYPE, GRID_PCA_DIM))
+        print(f"\n🔬 Шард '{source}': {len(data['ids'])} документов x {data['embeddings'].shape[1]}, {len(queries)} запросов")
+        shard_results = []
+        for dtype, pca_dim in grid:
+            row = {"source": source, **evaluate(data, queries, truth, dtype, pca_dim, args.k, args.repeat)}
+            if any(r["numpy:dtype"] == row["numpy:dtype"] and r["dim"] == row["dim"] for r in shard_results):
+                continue  # pca_dim больше, чем позволяет шард: та же точка, что и без PCA
+            shard_results.append(row)
+            print(f"   {dtype:<8} dim={row['dim']:<5} recall={row['recall']:.3f} p50={row['p50_ms']:.3f} мс "
+                  f"p95={row['p95_ms']:.3f} мс размер={row['size_mb']:.2f} МБ сборка={row['build_s']:.2f} с")
+
+        best = choose(shard_results, args.target_recall)
+        chosen[source] = best
+        results.extend(shard_results)
+        full = shard_results[0]
+        print(f"🏆 '{source}': {best['numpy:dtype']}, dim={best['dim']} (recall={best['recall']:.3f}, "
+              f"размер x{full['size_mb'] / max(best['size_mb'], 1e-9):.1f} меньше, p95 {best['p95_ms']:.3f} мс против {full['p95_ms']:.3f})")
+
+    if not results:
+        print("❌ Все шарды пусты. Сначала соберите базу (ingest_pipeline.py)")
+        return
+
+    save_results(results)
+    if args.sample and not args.dry_run:
+        print("ℹ️ Запросы синтетические (--sample): конфиг не записан, для записи запустите на золотом наборе")
+    elif not args.dry_run:
+        write_index_config(chosen)
+
+
+if __name__ == "__main__":
+    main()
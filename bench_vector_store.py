@@ -0,0 +1,124 @@
+'''
+Бенчмарк: Chroma (HNSW) против NumPy (точный перебор) на наших же данных.
+Меряет время открытия базы, задержку запроса (p50/p95) и recall@k Chroma
+относительно точного ответа.
+
+Запуск из корня проекта:
+    python bench_vector_store.py              # вопросы из db_debug, кодируются моделью e5
+    python bench_vector_store.py --sample 200 # без модели: запросы = случайные векторы из базы
+'''
+
+import argparse
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+from sharded_store import ShardedVectorStore
+from numpy_store import NumpyVectorStore
+
+MODEL_NAME = "intfloat/multilingual-e5-large"
+
+# Те же вопросы, что и в Data/table_parser_files/db_debug.py
+DEBUG_QUERIES = [
+    "Где меньше всего физики?",
+    "Я хочу разрабатывать танки",
+    "Куда поступить чтобы стать Data Science специалистом?",
+    "Где разрабатывают роботов?",
+    "Какое направление самое интересное?",
+    "Сколько стоит обучение на Программиста?",
+    "Какой проходной балл на Прикладную информатику в 2025 году?",
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(np.asarray(values), q)) if values else 0.0
+
+
+def load_corpus(store: ShardedVectorStore) -> Dict[str, list]:
+    """Выгружает все шарды в один набор (ids, texts, metadatas, embeddings)."""
+    corpus: Dict[str, list] = {"ids": [], "texts": [], "metadatas": [], "embeddings": []}
+    for shard in store.shards.values():
+        data = shard.get(include=["documents", "metadatas", "embeddings"])
+        corpus["ids"].extend(data["ids"])
+        corpus["texts"].extend(data["documents"])
+        corpus["metadatas"].extend(data["metadatas"])
+        corpus["embeddings"].extend(list(data["embeddings"]))
+    return corpus
+
+
+def load_query_vectors(corpus: Dict[str, list], sample: int, seed: int = 0) -> np.ndarray:
+    """Векторы запросов: либо вопросы, закодированные моделью, либо случайные документы базы с шумом."""
+    if sample:
+        rng = np.random.default_rng(seed)
+        matrix = np.asarray(corpus["embeddings"], dtype=np.float32)
+        picked = matrix[rng.choice(len(matrix), size=min(sample, len(matrix)), replace=False)]
+        return picked + rng.normal(scale=0.02, size=picked.shape).astype(np.float32)
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    print("🧠 Загрузка модели эмбеддингов для запросов...")
+    embeddings = HuggingFaceEmbeddings(model_name=MODEL_NAME)
+    return np.asarray(embeddings.embed_documents(DEBUG_QUERIES), dtype=np.float32)
+
+
+def chroma_search(store: ShardedVectorStore, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+    """Запрос во все шарды Chroma и слияние по дистанции (все шарды в cosine)."""
+    hits = []
+    for shard in store.shards.values():
+        res = shard._collection.query(query_embeddings=[query.tolist()], n_results=k, include=["distances"])
+        hits.extend(zip(res["ids"][0], res["distances"][0]))
+    hits.sort(key=lambda pair: pair[1])
+    return hits[:k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chroma vs NumPy: задержка и recall@k")
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--sample", type=int, default=0, help="Сколько случайных векторов базы взять как запросы (без модели)")
+    parser.add_argument("--repeat", type=int, default=20, help="Повторов каждого запроса для замера задержки")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    args = parser.parse_args()
+
+    # 1. Открытие баз
+    start = time.perf_counter()
+    chroma = ShardedVectorStore(backend="chroma")
+    chroma_open = time.perf_counter() - start
+
+    corpus = load_corpus(chroma)
+    if not corpus["ids"]:
+        print("❌ База Chroma пуста. Сначала запусти create_db.py / podcast_to_db.py")
+        return
+
+    start = time.perf_counter()
+    exact = NumpyVectorStore(dtype=args.dtype)
+    exact.add_embeddings(corpus["texts"], corpus["embeddings"], corpus["metadatas"], corpus["ids"])
+    numpy_build = time.perf_counter() - start
+
+    queries = load_query_vectors(corpus, args.sample)
+    print(f"📚 Документов: {len(corpus['ids'])}, запросов: {len(queries)}, k={args.k}")
+
+    # 2. Задержка и recall
+    chroma_lat, numpy_lat, recalls = [], [], []
+    for query in queries:
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            chroma_hits = chroma_search(chroma, query, args.k)
+            t1 = time.perf_counter()
+            exact_hits = exact.search_by_vector(query, args.k)
+            t2 = time.perf_counter()
+            chroma_lat.append((t1 - t0) * 1000)
+            numpy_lat.append((t2 - t1) * 1000)
+
+        truth = {exact.ids[i] for i, _ in exact_hits}
+        found = {doc_id for doc_id, _ in chroma_hits}
+        recalls.append(len(truth & found) / max(len(truth), 1))
+
+    print("\n" + "=" * 60)
+    print(f"{'Бэкенд':<10}{'открытие, мс':>14}{'p50, мс':>10}{'p95, мс':>10}{'recall@k':>12}")
+    print("-" * 60)
+    print(f"{'chroma':<10}{chroma_open * 1000:>14.1f}{percentile(chroma_lat, 50):>10.2f}{percentile(chroma_lat, 95):>10.2f}{np.mean(recalls):>12.3f}")
+    print(f"{'numpy':<10}{numpy_build * 1000:>14.1f}{percentile(numpy_lat, 50):>10.2f}{percentile(numpy_lat, 95):>10.2f}{1.0:>12.3f}")
+    print("=" * 60)
+    print(f"Матрица NumPy: {exact.vectors.nbytes / 2**20:.1f} МБ ({args.dtype})")
+
+
+if __name__ == "__main__":
+    main()
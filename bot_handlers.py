@@ -0,0 +1,305 @@
+'''
+Асинхронный шлюз чат-бота перед ретривером.
+
+В пик приемной кампании десятки абитуриентов за секунды присылают один и тот же вопрос.
+Шлюз защищает энкодер и LLM от таких всплесков:
+- single-flight: одинаковые вопросы, пока первый из них считается (или стоит в очереди),
+  не запускают новый поиск, а ждут тот же результат;
+- token bucket на пользователя: не больше RATE_BURST вопросов подряд и RATE_PER_SEC в среднем;
+- ограниченная очередь: если она заполнена, пользователь сразу получает "попробуйте позже"
+  вместо того, чтобы ждать минуты.
+
+Вместо настоящего API мессенджера - LocalMessenger (входящие сообщения и ответы в памяти).
+
+Запуск из корня проекта:
+    python bot_handlers.py            # всплеск одинаковых вопросов, ответы - заглушка (без модели и LLM)
+    python bot_handlers.py --real     # тот же всплеск, но ответы через get_retriever()
+'''
+
+import argparse
+import asyncio
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+# --- НАСТРОЙКИ ---
+# Сколько вопросов считается одновременно (потоки для блокирующего retriever.invoke)
+ANSWER_WORKERS = 4
+# Очередь на обработку: при переполнении новые вопросы отбрасываются сразу
+QUEUE_SIZE = 64
+# Token bucket на пользователя: запас и скорость пополнения (вопросов в секунду)
+RATE_BURST = 3
+RATE_PER_SEC = 0.2
+# Документов в ответе бота
+ANSWER_DOCS = 3
+
+MSG_RATE_LIMITED = "⏳ Слишком много вопросов подряд. Попробуйте через {wait:.0f} с."
+MSG_OVERLOADED = "🚦 Сейчас очень много вопросов. Пожалуйста, повторите через минуту."
+MSG_ERROR = "❌ Не получилось найти ответ, попробуйте переформулировать вопрос."
+
+
+@dataclass
+class Message:
+    user_id: int
+    chat_id: int
+    text: str
+    received_at: float = field(default_factory=time.monotonic)
+
+
+class LocalMessenger:
+    """Локальная замена API мессенджера: очередь входящих и список отправленных ответов."""
+
+    def __init__(self, verbose: bool = False):
+        self.updates: "asyncio.Queue[Optional[Message]]" = asyncio.Queue()
+        self.sent: List[Tuple[int, str, float]] = []
+        self.verbose = verbose
+
+    async def push(self, message: Message) -> None:
+        await self.updates.put(message)
+
+    async def close(self) -> None:
+        await self.updates.put(None)
+
+    async def get_update(self) -> Optional[Message]:
+        return await self.updates.get()
+
+    async def send_message(self, chat_id: int, text: str, reply_to: Optional[Message] = None) -> None:
+        latency = time.monotonic() - reply_to.received_at if reply_to else 0.0
+        self.sent.append((chat_id, text, latency))
+        if self.verbose:
+            print(f"💬 -> {chat_id} ({latency * 1000:.0f} мс): {text[:80]}")
+
+
+class TokenBucket:
+    def __init__(self, capacity: float = RATE_BURST, rate: float = RATE_PER_SEC):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Списывает токен. Возвращает 0, если можно, иначе сколько секунд ждать следующего."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def normalize_question(text: str) -> str:
+    """Ключ single-flight: регистр, пунктуация и лишние пробелы не важны."""
+    text = re.sub(r"[^\w\s.]", " ", text.lower().replace("ё", "е"))
+    return re.sub(r"\s+", " ", text).strip(" .")
+
+
+@dataclass
+class GatewayStats:
+    received: int = 0
+    rate_limited: int = 0
+    shed: int = 0
+    deduplicated: int = 0
+    computed: int = 0
+    errors: int = 0
+
+
+class BotGateway:
+    """Прием сообщений -> лимиты -> single-flight -> очередь -> воркеры -> ответ."""
+
+    def __init__(
+        self,
+        answer_fn: Callable[[str], str],
+        messenger: LocalMessenger,
+        workers: int = ANSWER_WORKERS,
+        queue_size: int = QUEUE_SIZE,
+    ):
+        self.answer_fn = answer_fn
+        self.messenger = messenger
+        self.workers = workers
+        self.queue: "asyncio.Queue[Tuple[str, str]]" = asyncio.Queue(maxsize=queue_size)
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.buckets: Dict[int, TokenBucket] = {}
+        self.stats = GatewayStats()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="answer")
+
+    async def _answer_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            key, question = await self.queue.get()
+            future = self.inflight[key]
+            try:
+                # Блокирующий поиск (энкодер + LLM) уходит в поток, цикл событий продолжает принимать сообщения
+                answer = await loop.run_in_executor(self._executor, self.answer_fn, question)
+                self.stats.computed += 1
+                future.set_result(answer)
+            except Exception as e:
+                self.stats.errors += 1
+                future.set_exception(e)
+            finally:
+                # Ключ освобождается сразу: следующий такой же вопрос уже посчитается заново
+                del self.inflight[key]
+                self.queue.task_done()
+
+    async def handle(self, message: Message) -> None:
+        self.stats.received += 1
+
+        # 1. Лимит на пользователя
+        bucket = self.buckets.setdefault(message.user_id, TokenBucket())
+        wait = bucket.take()
+        if wait:
+            self.stats.rate_limited += 1
+            await self.messenger.send_message(message.chat_id, MSG_RATE_LIMITED.format(wait=wait), message)
+            return
+
+        # 2. Single-flight: такой вопрос уже в работе - ждем его результат, не занимая место в очереди
+        key = normalize_question(message.text)
+        future = self.inflight.get(key)
+        if future is not None:
+            self.stats.deduplicated += 1
+        else:
+            # 3. Новый вопрос - в ограниченную очередь или сразу отказ
+            future = asyncio.get_running_loop().create_future()
+            self.inflight[key] = future
+            try:
+                self.queue.put_nowait((key, message.text))
+            except asyncio.QueueFull:
+                del self.inflight[key]
+                self.stats.shed += 1
+                await self.messenger.send_message(message.chat_id, MSG_OVERLOADED, message)
+                return
+
+        try:
+            answer = await asyncio.shield(future)
+        except Exception:
+            answer = MSG_ERROR
+        await self.messenger.send_message(message.chat_id, answer, message)
+
+    async def run(self) -> None:
+        """Читает входящие, пока мессенджер не пришлет None; затем дожидается всех ответов."""
+        workers = [asyncio.create_task(self._answer_worker()) for _ in range(self.workers)]
+        handlers = set()
+        while True:
+            message = await self.messenger.get_update()
+            if message is None:
+                break
+            task = asyncio.create_task(self.handle(message))
+            handlers.add(task)
+            task.add_done_callback(handlers.discard)
+
+        if handlers:
+            await asyncio.gather(*handlers)
+        for worker in workers:
+            worker.cancel()
+        self._executor.shutdown(wait=False)
+
+
+# --- ОТВЕТЫ ---
+
+def format_answer(docs: list) -> str:
+    if not docs:
+        return "🤷 Ничего не нашел по этому вопросу."
+    lines = [f"🔎 Нашел {len(docs)} материалов, самые подходящие:"]
+    for doc in docs[:ANSWER_DOCS]:
+        code = doc.metadata.get("program_code", "")
+        lines.append(f"• [{doc.metadata.get('source_type', '?')}] {code}: {doc.page_content[:300].strip()}")
+    return "\n".join(lines)
+
+
+def make_retriever_answer_fn() -> Callable[[str], str]:
+    """Ответы через self-query ретривер (модель и индекс грузятся один раз)."""
+    from self_query_searcher import get_retriever
+    from program_index import ProgramIndex
+    from index_versions import IndexWatcher
+
+    retriever = get_retriever()
+    program_index = ProgramIndex.from_store(retriever.vectorstore)
+
+    def open_version(path: str):
+        store = retriever.vectorstore.reopen(path)
+        return store, ProgramIndex.from_store(store)
+
+    # Новая версия индекса открывается в фоне и подменяется между вопросами
+    watcher = IndexWatcher(retriever.vectorstore.backend, open_version)
+
+    def answer(question: str) -> str:
+        nonlocal program_index
+        opened = watcher.poll()
+        if opened is not None:
+            old = retriever.vectorstore
+            retriever.vectorstore, program_index = opened
+            old.close()
+        docs = program_index.attach_linked(retriever.invoke(question), question)
+        return format_answer(docs)
+
+    return answer
+
+
+def make_stub_answer_fn(delay: float = 1.0) -> Callable[[str], str]:
+    """Заглушка с задержкой как у энкодера + LLM: для проверки шлюза без модели."""
+    def answer(question: str) -> str:
+        time.sleep(delay)
+        return f"Ответ на: {question}"
+    return answer
+
+
+# --- ДЕМО: ВСПЛЕСК ОДИНАКОВЫХ ВОПРОСОВ ---
+
+BURST_QUESTIONS = [
+    "Какой проходной балл на Прикладную информатику?",
+    "какой проходной балл на прикладную информатику",
+    "Сколько стоит обучение на Программиста?",
+    "Есть ли общежитие?",
+]
+
+
+async def simulate_burst(gateway: BotGateway, users: int, seconds: float) -> None:
+    """users пользователей за seconds секунд присылают по 1-5 вопросов из небольшого набора."""
+    messenger = gateway.messenger
+    runner = asyncio.create_task(gateway.run())
+    events = []
+    for user_id in range(users):
+        for _ in range(random.randint(1, 5)):
+            events.append((random.uniform(0, seconds), user_id, random.choice(BURST_QUESTIONS)))
+    events.sort()
+
+    start = time.monotonic()
+    for at, user_id, text in events:
+        await asyncio.sleep(max(0.0, at - (time.monotonic() - start)))
+        await messenger.push(Message(user_id=user_id, chat_id=user_id, text=text))
+    await messenger.close()
+    await runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Шлюз чат-бота: single-flight, лимиты, сброс нагрузки")
+    parser.add_argument("--real", action="store_true", help="Отвечать через настоящий ретривер")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    answer_fn = make_retriever_answer_fn() if args.real else make_stub_answer_fn()
+    messenger = LocalMessenger(verbose=args.verbose)
+    gateway = BotGateway(answer_fn, messenger)
+
+    start = time.monotonic()
+    asyncio.run(simulate_burst(gateway, args.users, args.seconds))
+    elapsed = time.monotonic() - start
+
+    s = gateway.stats
+    latencies = sorted(latency for _, _, latency in messenger.sent)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+    print("\n" + "=" * 60)
+    print(f"📨 Сообщений: {s.received} за {elapsed:.1f} с, ответов отправлено: {len(messenger.sent)}")
+    print(f"🧠 Реальных поисков: {s.computed} (объединено single-flight: {s.deduplicated})")
+    print(f"⏳ Отсечено лимитом: {s.rate_limited}, 🚦 сброшено из-за очереди: {s.shed}, ❌ ошибок: {s.errors}")
+    print(f"⏱️ p95 времени ответа: {p95 * 1000:.0f} мс")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+'''
+Массовая загрузка документов в шарды: сначала все эмбеддинги, потом запись.
+
+Обычный add_documents чередует инференс модели, запись в SQLite и вставку в HNSW маленькими пачками.
+Здесь две раздельные фазы:
+1. Эмбеддинги всех текстов большими пачками, тексты отсортированы по длине
+   (в пачке тексты похожей длины - почти нет паддинга), результат - одна матрица float32.
+2. Запись готовых векторов: в Chroma - пачками максимального размера, который принимает клиент
+   (одна транзакция SQLite на пачку), в коллекцию, пересозданную с BULK_HNSW_METADATA:
+   вставка в HNSW копится в буфере и идет крупными блоками, а не по 100 векторов.
+   Chroma не дает менять эти ключи после создания, так что они остаются у коллекции и при обслуживании
+   (hnsw_tuning.py подбирает M/ef на коллекциях с теми же параметрами).
+   NumPy-бэкенд пишет матрицу один раз.
+Для каждой фазы печатается скорость в док/с.
+plan_token_batches - пачки по бюджету токенов вместо фиксированного числа текстов (SBERT_EmbeddingFunction в html_parser.ipynb).
+stable_ids - детерминированные id документов: после пересборки тот же чанк получает тот же id
+(replay_queries.py сравнивает выдачу старой и новой базы по id).
+
+Пример:
+    report = bulk_load(vectorstore, docs, embeddings.embed_documents, reset=True)
+    print(report.line())
+'''
+
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from metadata_index import canonicalize_metadata
+
+# --- НАСТРОЙКИ ---
+# Текстов в одном вызове модели (для e5-large на CPU ~ 64-128, на GPU можно больше)
+BULK_BATCH_SIZE = 128
+# Пачка записи, если клиент Chroma не сообщает свой максимум
+WRITE_BATCH_SIZE = 5000
+# Постоянные параметры коллекций Chroma, которые пересоздают загрузчики (после создания не меняются):
+# векторы копятся в буфере и вставляются в HNSW блоками по batch_size - шард меньше batch_size
+# обслуживается точным перебором буфера; индекс сбрасывается на диск раз в sync_threshold добавлений -
+# при открытии коллекции (демон, воркеры, новая версия индекса) из журнала досчитывается не больше него
+BULK_HNSW_METADATA = {"hnsw:batch_size": 1000, "hnsw:sync_threshold": 1000}
+# Бюджет пачки в токенах (длина самого длинного текста x число текстов) для plan_token_batches
+TOKEN_BUDGET = 16384
+# Текст короче такой доли первого текста пачки открывает новую пачку (корзины по длине: паддинг <= 25%)
+BUCKET_RATIO = 0.75
+# Поля метаданных, по которым понятно, откуда документ (в id идут все заполненные)
+ID_SOURCE_FIELDS = ("url", "program_code", "source", "file", "title")
+
+
+@dataclass
+class BulkReport:
+    docs: int = 0
+    embed_seconds: float = 0.0
+    write_seconds: float = 0.0
+
+    def rate(self, seconds: float) -> float:
+        return self.docs / seconds if seconds > 0 else float("inf")
+
+    def line(self) -> str:
+        return (f"документов {self.docs}: эмбеддинги {self.embed_seconds:.1f} с ({self.rate(self.embed_seconds):.1f} док/с), "
+                f"запись {self.write_seconds:.1f} с ({self.rate(self.write_seconds):.1f} док/с)")
+
+
+def embed_sorted(texts: Sequence[str], embed: Callable[[List[str]], Any], batch_size: int = BULK_BATCH_SIZE) -> np.ndarray:
+    """Эмбеддинги в исходном порядке; считаются пачками по убыванию длины текста."""
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    matrix = None
+    for start in range(0, len(order), batch_size):
+        rows = order[start:start + batch_size]
+        block = np.asarray(embed([texts[i] for i in rows]), dtype=np.float32)
+        if matrix is None:
+            matrix = np.empty((len(texts), block.shape[1]), dtype=np.float32)
+        matrix[rows] = block
+    return matrix
+
+
+def plan_token_batches(
+    lengths: Sequence[int],
+    token_budget: int = TOKEN_BUDGET,
+    max_batch: int = BULK_BATCH_SIZE,
+    bucket_ratio: float = BUCKET_RATIO,
+) -> List[List[int]]:
+    """
+    Индексы текстов, разложенные в пачки по убыванию длины (в токенах).
+    Размер пачки задает бюджет, а не число: длина первого (самого длинного) текста x число текстов <= token_budget,
+    поэтому короткие тексты идут большими пачками, длинные - маленькими. В пачку попадают только тексты
+    не короче bucket_ratio от первого - паддинг внутри пачки ограничен.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for i in order:
+        head = lengths[current[0]] if current else 0
+        if current and ((len(current) + 1) * head > token_budget or len(current) >= max_batch or lengths[i] < bucket_ratio * head):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def padding_ratio(lengths: Sequence[int], batches: Sequence[Sequence[int]]) -> float:
+    """Доля слотов батчей, занятых паддингом (каждая пачка дополняется до своего самого длинного текста)."""
+    slots = sum(max(lengths[i] for i in rows) * len(rows) for rows in batches if rows)
+    return 1 - sum(lengths) / slots if slots else 0.0
+
+
+def stable_ids(docs: Sequence[Document], seen: Dict[str, int]) -> List[str]:
+    """
+    id = хэш от source_type, места документа (ID_SOURCE_FIELDS), номера чанка и текста.
+    Заданный doc.id сохраняется. Полные дубли получают суффикс по порядку появления;
+    seen - счетчик уже выданных id, общий на одну сборку.
+    """
+    ids = []
+    for doc in docs:
+        if doc.id:
+            ids.append(doc.id)
+            continue
+        meta = doc.metadata
+        key = "\x1f".join(
+            [str(meta.get("source_type", ""))]
+            + [f"{name}={meta[name]}" for name in ID_SOURCE_FIELDS if meta.get(name) not in (None, "")]
+            + [str(meta.get("chunk", "")), doc.page_content]
+        )
+        doc_id = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        seen[doc_id] = seen.get(doc_id, 0) + 1
+        ids.append(doc_id if seen[doc_id] == 1 else f"{doc_id}-{seen[doc_id]}")
+    return ids
+
+
+def write_batch_size(store: Any) -> int:
+    """Максимальная пачка, которую принимает клиент Chroma (ограничение SQLite на число параметров)."""
+    client = store if hasattr(store, "get_max_batch_size") else getattr(store, "_client", None)
+    if client is not None and hasattr(client, "get_max_batch_size"):
+        return client.get_max_batch_size()
+    return WRITE_BATCH_SIZE
+
+
+def bulk_load(
+    store: Any,
+    documents: List[Document],
+    embed: Callable[[List[str]], Any],
+    reset: bool = True,
+    batch_size: int = BULK_BATCH_SIZE,
+) -> BulkReport:
+    """
+    Загружает документы в ShardedVectorStore по шардам (source_type).
+    reset=True пересоздает затронутые шарды (с BULK_HNSW_METADATA для Chroma).
+    """
+    report = BulkReport(docs=len(documents))
+    by_shard: Dict[str, List[int]] = {}
+    for i, doc in enumerate(documents):
+        doc.metadata = canonicalize_metadata(doc.metadata)
+        by_shard.setdefault(doc.metadata.get("source_type", ""), []).append(i)
+
+    # Фаза 1: все эмбеддинги сразу, общей сортировкой по длине для всех шардов (модель не ждет записи на диск)
+    start = time.perf_counter()
+    matrix = embed_sorted([doc.page_content for doc in documents], embed, batch_size)
+    report.embed_seconds = time.perf_counter() - start
+    print(f"🧮 Эмбеддинги: {report.docs} документов за {report.embed_seconds:.1f} с ({report.rate(report.embed_seconds):.1f} док/с)")
+
+    # Фаза 2: запись готовых векторов крупными транзакциями
+    start = time.perf_counter()
+    seen: Dict[str, int] = {}
+    for source, rows in by_shard.items():
+        docs = [documents[i] for i in rows]
+        if reset:
+            store.reset_shard(source, collection_metadata=BULK_HNSW_METADATA)
+        store.add_embeddings(
+            source,
+            [d.page_content for d in docs],
+            matrix[rows],
+            [d.metadata for d in docs],
+            stable_ids(docs, seen),
+            batch_size=write_batch_size(store.shards[source]),
+        )
+    report.write_seconds = time.perf_counter() - start
+    print(f"💾 Запись: {report.docs} документов за {report.write_seconds:.1f} с ({report.rate(report.write_seconds):.1f} док/с)")
+    return report
@@ -0,0 +1,161 @@
+'''
+Фильтр мусорных и шаблонных чанков перед эмбеддингом (краулер сайта и PDF).
+
+За один проход по чанку:
+- одно скомпилированное регулярное выражение (все шаблоны мусора через | с именованными группами),
+  по имени сработавшей группы видно причину;
+- доля букв и цифр среди непробельных символов (цифры - содержимое: цены, баллы, коды направлений);
+- прицельно мусор: сплошные куски без пробелов (base64, минифицированный JS/CSS) и доля символов кода {}<>=;
+- доля строк-шаблонов: строки, которые встречаются на многих страницах (меню, футер, баннер cookie),
+  заранее считаются по всему корпусу в fit() и вырезаются из страниц до чанкинга.
+
+Отчет: сколько чанков отброшено и по каким причинам и сколько секунд энкодера это сэкономило.
+'''
+
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+# Имя причины -> шаблон. Ни один шаблон не должен совпадать с пустой строкой (иначе отсекается все)
+DEFAULT_PATTERNS = {
+    "base64": r"data:image/[a-zA-Z0-9+/=;,-]+",
+    "html_comment": r"<!--.*?-->",
+    "analytics": r"\[Top\.Mail\.Ru\]|Yandex\.Metrika|googletagmanager|gtag\(",
+    "bare_url": r"^\s*https?://\S+\s*$",
+    "cookie_banner": r"(?i:мы используем (?:файлы )?cookie|используя сайт, вы соглашаетесь)",
+}
+# Меньше такой доли букв и цифр среди непробельных символов - не текст
+MIN_ALNUM_RATIO = 0.5
+# Слово без пробелов длиннее этого (кроме ссылок) - base64 / минифицированный код
+MAX_TOKEN_LEN = 100
+# Доля символов {}<>= среди непробельных, выше которой чанк считается CSS/JS/разметкой
+MAX_CODE_CHAR_SHARE = 0.03
+CODE_CHARS = frozenset("{}<>=")
+# Строка считается шаблонной, если встречается хотя бы на стольких страницах и на такой доле страниц
+REPEATED_LINE_MIN_PAGES = 3
+REPEATED_LINE_MIN_SHARE = 0.3
+# Чанк, в котором шаблонные строки занимают такую долю, отбрасывается
+MAX_BOILERPLATE_SHARE = 0.6
+# Сколько отброшенных чанков реально прогнать через энкодер для оценки сэкономленного времени
+ENCODER_SAMPLE = 32
+
+
+def _normalize_line(line: str) -> str:
+    return re.sub(r"\s+", " ", line).strip().lower()
+
+
+@dataclass
+class FilterReport:
+    total: int = 0
+    kept: int = 0
+    reasons: Counter = field(default_factory=Counter)
+    removed_chars: int = 0
+    boilerplate_lines_stripped: int = 0
+    encoder_seconds_saved: Optional[float] = None
+
+    @property
+    def removed(self) -> int:
+        return self.total - self.kept
+
+    def line(self) -> str:
+        reasons = ", ".join(f"{name}: {count}" for name, count in self.reasons.most_common()) or "нет"
+        saved = f", энкодер сэкономил ~{self.encoder_seconds_saved:.1f} с" if self.encoder_seconds_saved is not None else ""
+        return (f"чанков {self.total}, оставлено {self.kept}, отброшено {self.removed} ({reasons}); "
+                f"вырезано шаблонных строк {self.boilerplate_lines_stripped}, символов мусора {self.removed_chars}{saved}")
+
+
+class ChunkFilter:
+    def __init__(self, patterns: Optional[Dict[str, str]] = None, min_alnum_ratio: float = MIN_ALNUM_RATIO):
+        patterns = patterns or DEFAULT_PATTERNS
+        for name, pattern in patterns.items():
+            if re.compile(pattern, re.DOTALL).fullmatch(""):
+                raise ValueError(f"Шаблон '{name}' совпадает с пустой строкой и отсеял бы все чанки: {pattern!r}")
+        # Одно выражение на все шаблоны: один проход по тексту вместо цикла по списку
+        self.combined = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in patterns.items()), re.DOTALL)
+        self.min_alnum_ratio = min_alnum_ratio
+        self.boilerplate: set = set()
+        self.report = FilterReport()
+
+    # --- ШАБЛОННЫЕ СТРОКИ ПО ВСЕМУ КОРПУСУ ---
+
+    def fit(self, pages: Iterable[str]) -> "ChunkFilter":
+        """Считает, на скольких страницах встречается каждая строка; частые строки - шаблон сайта."""
+        page_freq: Counter = Counter()
+        n_pages = 0
+        for text in pages:
+            n_pages += 1
+            page_freq.update({_normalize_line(line) for line in text.splitlines() if line.strip()})
+        threshold = max(REPEATED_LINE_MIN_PAGES, REPEATED_LINE_MIN_SHARE * n_pages)
+        self.boilerplate = {line for line, count in page_freq.items() if count >= threshold}
+        return self
+
+    def clean_page(self, text: str) -> str:
+        """Вырезает из страницы шаблонные строки (до чанкинга, чтобы они не попадали в каждый чанк)."""
+        if not self.boilerplate:
+            return text
+        kept = []
+        for line in text.splitlines():
+            if _normalize_line(line) in self.boilerplate:
+                self.report.boilerplate_lines_stripped += 1
+            else:
+                kept.append(line)
+        return "\n".join(kept)
+
+    # --- ПРОВЕРКА ЧАНКА ---
+
+    def check(self, chunk: str) -> Optional[str]:
+        """Причина отбросить чанк или None, если чанк нормальный."""
+        match = self.combined.search(chunk)
+        if match:
+            return match.lastgroup
+
+        alnum = code = non_space = 0
+        for ch in chunk:
+            if not ch.isspace():
+                non_space += 1
+                if ch.isalnum():
+                    alnum += 1
+                elif ch in CODE_CHARS:
+                    code += 1
+        if non_space == 0 or alnum / non_space < self.min_alnum_ratio:
+            return "symbols"
+        if code / non_space > MAX_CODE_CHAR_SHARE:
+            return "code"
+        if any(len(token) > MAX_TOKEN_LEN and not token.startswith("http") for token in chunk.split()):
+            return "long_token"
+
+        if self.boilerplate:
+            lines = [line for line in chunk.splitlines() if line.strip()]
+            repeated = sum(_normalize_line(line) in self.boilerplate for line in lines)
+            if lines and repeated / len(lines) >= MAX_BOILERPLATE_SHARE:
+                return "boilerplate"
+        return None
+
+    def classify(self, chunk: str) -> Optional[str]:
+        """То же, что check(), но с учетом в self.report."""
+        reason = self.check(chunk)
+        self.report.total += 1
+        if reason is None:
+            self.report.kept += 1
+        else:
+            self.report.reasons[reason] += 1
+            self.report.removed_chars += len(chunk)
+        return reason
+
+    def filter(self, chunks: Sequence[str]) -> List[bool]:
+        """Маска "оставить" для списка чанков."""
+        return [self.classify(chunk) is None for chunk in chunks]
+
+    def estimate_encoder_seconds(self, encode: Callable[[List[str]], object], removed: Sequence[str], sample: int = ENCODER_SAMPLE) -> float:
+        """Прогоняет выборку отброшенных чанков через энкодер и экстраполирует время на все отброшенные."""
+        if not removed:
+            self.report.encoder_seconds_saved = 0.0
+            return 0.0
+        batch = list(removed[:sample])
+        start = time.perf_counter()
+        encode(batch)
+        per_chunk = (time.perf_counter() - start) / len(batch)
+        self.report.encoder_seconds_saved = per_chunk * len(removed)
+        return self.report.encoder_seconds_saved
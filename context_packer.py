@@ -0,0 +1,179 @@
+'''Сборка контекста для LLM из найденных документов в рамках бюджета токенов.'''
+
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+
+# --- НАСТРОЙКИ ---
+# Токенизатор, которым считаем длину контекста (тот же, что у модели эмбеддингов)
+TOKENIZER_NAME = "intfloat/multilingual-e5-large"
+# Общий бюджет токенов на весь контекст
+DEFAULT_TOKEN_BUDGET = 3000
+# Квоты (в токенах) на каждый тип источника. Тип, которого нет в словаре, ограничен только общим бюджетом.
+DEFAULT_SOURCE_QUOTAS = {
+    "Таблица": 1500,
+    "Подкаст": 2000,
+}
+
+# Строки-"шапки", которые повторяются от документа к документу.
+# Если строка с таким ключом одинакова у всех документов группы, выводим её один раз.
+HEADER_KEYS = (
+    "Источник",
+    "Спикер",
+    "Уровень образования",
+    "Форма обучения",
+    "Экзамены (ЕГЭ)",
+)
+
+_HEADER_RE = re.compile(rf"^(?:{'|'.join(re.escape(k) for k in HEADER_KEYS)}):")
+_YEAR_LINE_RE = re.compile(r"^(\d{4}) год: (.*)$")
+
+
+@dataclass
+class PackReport:
+    """Статистика упаковки контекста для одного запроса."""
+    raw_tokens: int = 0            # Сколько стоили бы все документы "как есть"
+    packed_tokens: int = 0         # Сколько стоит итоговый контекст
+    included: int = 0              # Сколько документов попало в контекст
+    dropped: int = 0               # Сколько не влезло в бюджет/квоты
+    tokens_by_source: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.raw_tokens - self.packed_tokens
+
+
+@lru_cache(maxsize=4)
+def load_token_counter(tokenizer_name: str = TOKENIZER_NAME) -> Callable[[str], int]:
+    """Загружает настоящий токенизатор HuggingFace и возвращает функцию подсчета токенов."""
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+
+    def count_tokens(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    return count_tokens
+
+
+def compact_year_lines(text: str) -> str:
+    """
+    Сворачивает список проходных баллов по годам
+    '2025 год: 248\\n2024 год: 245...' в одну строку '2025/2024 гг.: 248 / 245'.
+    """
+    result, years, values = [], [], []
+
+    def flush():
+        if len(years) > 1:
+            result.append(f"{'/'.join(years)} гг.: {' / '.join(values)}")
+        elif years:
+            result.append(f"{years[0]} год: {values[0]}")
+        years.clear()
+        values.clear()
+
+    for line in text.splitlines():
+        match = _YEAR_LINE_RE.match(line.strip())
+        if match:
+            years.append(match.group(1))
+            values.append(match.group(2).strip())
+            continue
+        flush()
+        result.append(line)
+    flush()
+
+    return "\n".join(result)
+
+
+def _group_key(doc: Document) -> Tuple[str, str]:
+    """Документы одной группы делят общую шапку: подкасты - по направлению и спикеру, таблицы - все вместе."""
+    meta = doc.metadata
+    source = meta.get("source_type", "?")
+    if meta.get("speaker"):
+        return source, f"{meta.get('program_code', '')}|{meta['speaker']}"
+    return source, ""
+
+
+def _split_header(text: str) -> Tuple[List[str], List[str]]:
+    """Делит текст документа на строки-шапки и остальное тело (пустые строки выбрасываем)."""
+    header, body = [], []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        (header if _HEADER_RE.match(line) else body).append(line)
+    return header, body
+
+
+def pack_context(
+    docs: List[Document],
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    source_quotas: Optional[Dict[str, int]] = None,
+    count_tokens: Optional[Callable[[str], int]] = None,
+) -> Tuple[str, PackReport]:
+    """
+    Собирает документы (в порядке ранжирования) в один текст для LLM:
+    - общие шапки группы документов выводятся один раз,
+    - списки баллов по годам сворачиваются в одну строку,
+    - соблюдаются общий бюджет токенов и квоты по source_type.
+    Возвращает (контекст, отчет).
+    """
+    if source_quotas is None:
+        source_quotas = DEFAULT_SOURCE_QUOTAS
+    if count_tokens is None:
+        count_tokens = load_token_counter()
+
+    report = PackReport()
+    report.raw_tokens = count_tokens("\n\n".join(d.page_content for d in docs)) if docs else 0
+
+    # 1. Разбиваем документы на шапку и тело
+    prepared = []
+    for doc in docs:
+        header, body = _split_header(compact_year_lines(doc.page_content))
+        prepared.append((doc, header, "\n".join(body).strip()))
+
+    # 2. Общая шапка группы = строки, одинаковые у всех документов группы
+    group_headers: Dict[Tuple[str, str], List[str]] = {}
+    for doc, header, _ in prepared:
+        key = _group_key(doc)
+        if key not in group_headers:
+            group_headers[key] = list(header)
+        else:
+            group_headers[key] = [h for h in group_headers[key] if h in header]
+
+    # 3. Жадно набираем документы по рангу, пока хватает бюджета и квот
+    groups: Dict[Tuple[str, str], List[str]] = {}
+    used_total = 0
+    for doc, header, body in prepared:
+        key = _group_key(doc)
+        source = key[0]
+        shared = group_headers[key]
+        own_header = [h for h in header if h not in shared]
+        part = "\n".join(own_header + [body]).strip()
+
+        cost = count_tokens(part)
+        if key not in groups and shared:
+            cost += count_tokens("\n".join(shared))
+
+        quota = source_quotas.get(source)
+        used_source = report.tokens_by_source.get(source, 0)
+        if used_total + cost > token_budget or (quota is not None and used_source + cost > quota):
+            report.dropped += 1
+            continue
+
+        groups.setdefault(key, []).append(part)
+        used_total += cost
+        report.tokens_by_source[source] = used_source + cost
+        report.included += 1
+
+    # 4. Финальная сборка
+    blocks = []
+    for key, parts in groups.items():
+        lines = [f"[{key[0]}]"]
+        lines.extend(group_headers[key])
+        lines.append("\n---\n".join(parts))
+        blocks.append("\n".join(lines))
+
+    context = "\n\n".join(blocks)
+    report.packed_tokens = count_tokens(context) if context else 0
+    return context, report
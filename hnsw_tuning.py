@@ -0,0 +1,257 @@
+'''
+Подбор параметров HNSW (M, construction_ef, search_ef) для шардов Chroma на наших данных.
+
+Для каждого шарда и каждой точки сетки коллекция пересобирается во временной папке из уже
+посчитанных эмбеддингов (модель для документов не нужна), затем меряются:
+- recall@k относительно точного поиска (перебор косинусов в NumPy) на золотом наборе запросов;
+- p95 задержки запроса;
+- время построения индекса и размер на диске.
+Коллекции сетки создаются с теми же постоянными параметрами, что у загрузчиков (bulk_load.BULK_HNSW_METADATA),
+иначе recall и задержка мерились бы не на том индексе, который обслуживает запросы.
+Итог - график recall@k от p95 (и время/размер сборки), таблица CSV и выбранные параметры,
+записанные в Data/index_config.json, откуда их берет sharded_store.SHARDS.
+
+Запуск из корня проекта:
+    python hnsw_tuning.py                         # золотые вопросы кодируются моделью e5
+    python hnsw_tuning.py --sample 200            # без модели: запросы = векторы базы с шумом
+    python hnsw_tuning.py --target-recall 0.98 --dry-run
+'''
+
+import argparse
+import csv
+import datetime
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List
+import numpy as np
+import chromadb
+from bulk_load import BULK_HNSW_METADATA
+from sharded_store import INDEX_CONFIG_PATH, SHARDS, ShardedVectorStore, load_index_config
+from bench_vector_store import DEBUG_QUERIES, MODEL_NAME, percentile
+
+# --- НАСТРОЙКИ ---
+GOLDEN_QUERIES_PATH = "Data/golden_queries.json"
+RESULTS_CSV = "Data/hnsw_sweep.csv"
+RESULTS_PLOT = "Data/hnsw_sweep.png"
+GRID_M = [8, 16, 32, 48]
+GRID_CONSTRUCTION_EF = [64, 128, 200, 400]
+GRID_SEARCH_EF = [16, 32, 64, 128, 256]
+BATCH_SIZE = 500
+
+
+def load_golden_queries(path: str = GOLDEN_QUERIES_PATH) -> List[str]:
+    """Золотой набор вопросов (список строк в JSON). Если файла нет - вопросы из db_debug."""
+    if not os.path.exists(path):
+        print(f"⚠️ {path} не найден, использую вопросы из db_debug.py")
+        return DEBUG_QUERIES
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def encode_queries(queries: List[str]) -> np.ndarray:
+    from langchain_huggingface import HuggingFaceEmbeddings
+    print("🧠 Загрузка модели эмбеддингов для запросов...")
+    embeddings = HuggingFaceEmbeddings(model_name=MODEL_NAME)
+    return np.asarray(embeddings.embed_documents(queries), dtype=np.float32)
+
+
+def sample_queries(matrix: np.ndarray, sample: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picked = matrix[rng.choice(len(matrix), size=min(sample, len(matrix)), replace=False)]
+    return picked + rng.normal(scale=0.02, size=picked.shape).astype(np.float32)
+
+
+def exact_top_k(matrix: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    """Эталон: точный top-k по косинусу для каждого запроса (номера строк)."""
+    normed = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    q = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    scores = q @ normed.T
+    k = min(k, len(matrix))
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row.tolist()) for row in top]
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def evaluate(
+    data: Dict[str, Any],
+    queries: np.ndarray,
+    truth: List[set],
+    m: int,
+    construction_ef: int,
+    search_ef: int,
+    k: int,
+    repeat: int,
+) -> Dict[str, Any]:
+    """Строит временную коллекцию с заданными параметрами и меряет recall@k / p95 / сборку."""
+    # search_ef в Chroma фиксируется при создании коллекции, поэтому на каждую точку сетки - своя сборка
+    workdir = tempfile.mkdtemp(prefix="hnsw_sweep_")
+    try:
+        client = chromadb.PersistentClient(path=workdir)
+        collection = client.create_collection(
+            name="sweep",
+            metadata={"hnsw:space": "cosine", "hnsw:M": m, "hnsw:construction_ef": construction_ef, "hnsw:search_ef": search_ef,
+                      **BULK_HNSW_METADATA},
+        )
+        # id = номер строки: так найденные документы сразу сравниваются с эталоном
+        ids = [str(i) for i in range(len(data["ids"]))]
+        start = time.perf_counter()
+        for i in range(0, len(ids), BATCH_SIZE):
+            collection.add(ids=ids[i:i + BATCH_SIZE], embeddings=data["embeddings"][i:i + BATCH_SIZE].tolist())
+        build_s = time.perf_counter() - start
+
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                res = collection.query(query_embeddings=[query.tolist()], n_results=min(k, len(ids)), include=[])
+                latencies.append((time.perf_counter() - t0) * 1000)
+            found = {int(doc_id) for doc_id in res["ids"][0]}
+            recalls.append(len(found & expected) / max(len(expected), 1))
+
+        size_mb = _dir_size(workdir) / 2**20
+        del client
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "hnsw:M": m,
+        "hnsw:construction_ef": construction_ef,
+        "hnsw:search_ef": search_ef,
+        "recall": float(np.mean(recalls)),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "build_s": build_s,
+        "size_mb": size_mb,
+    }
+
+
+def choose(results: List[Dict[str, Any]], target_recall: float) -> Dict[str, Any]:
+    """Самая быстрая по p95 точка с recall >= цели (при равенстве - меньший индекс); иначе максимум recall."""
+    good = [r for r in results if r["recall"] >= target_recall]
+    if good:
+        return min(good, key=lambda r: (round(r["p95_ms"], 2), r["size_mb"], r["build_s"]))
+    return max(results, key=lambda r: (r["recall"], -r["p95_ms"]))
+
+
+def plot(results: List[Dict[str, Any]], chosen: Dict[str, Dict[str, Any]], path: str = RESULTS_PLOT) -> None:
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("⚠️ matplotlib не установлен, график пропущен (таблица есть в CSV)")
+        return
+
+    sources = sorted({r["source"] for r in results})
+    fig, axes = plt.subplots(len(sources), 2, figsize=(12, 4.5 * len(sources)), squeeze=False)
+    for row, source in enumerate(sources):
+        points = [r for r in results if r["source"] == source]
+        ax = axes[row][0]
+        sc = ax.scatter([r["p95_ms"] for r in points], [r["recall"] for r in points],
+                        c=[r["hnsw:search_ef"] for r in points], s=[r["hnsw:M"] * 3 for r in points], cmap="viridis")
+        best = chosen[source]
+        ax.scatter([best["p95_ms"]], [best["recall"]], marker="*", s=300, c="red", label="выбрано")
+        ax.set_title(f"{source}: recall@k vs p95 (размер точки - M, цвет - search_ef)")
+        ax.set_xlabel("p95, мс")
+        ax.set_ylabel("recall@k")
+        ax.legend()
+        fig.colorbar(sc, ax=ax, label="search_ef")
+
+        ax = axes[row][1]
+        builds = {(r["hnsw:M"], r["hnsw:construction_ef"]): r for r in points}
+        ax.scatter([r["build_s"] for r in builds.values()], [r["size_mb"] for r in builds.values()])
+        for (m, cef), r in builds.items():
+            ax.annotate(f"M={m}, ef_c={cef}", (r["build_s"], r["size_mb"]), fontsize=7)
+        ax.set_title(f"{source}: время сборки и размер индекса")
+        ax.set_xlabel("сборка, с")
+        ax.set_ylabel("размер, МБ")
+
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    print(f"📈 График сохранен: {path}")
+
+
+def save_results(results: List[Dict[str, Any]], path: str = RESULTS_CSV) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"💾 Результаты сетки: {path}")
+
+
+def write_index_config(chosen: Dict[str, Dict[str, Any]], path: str = INDEX_CONFIG_PATH) -> None:
+    """Дописывает выбранные параметры в конфиг индексации (остальные шарды сохраняются как были)."""
+    config = load_index_config(path)
+    for source, best in chosen.items():
+        config[source] = {
+            **config.get(source, {}),
+            "hnsw:M": best["hnsw:M"],
+            "hnsw:construction_ef": best["hnsw:construction_ef"],
+            "hnsw:search_ef": best["hnsw:search_ef"],
+            "recall_at_k": round(best["recall"], 4),
+            "p95_ms": round(best["p95_ms"], 3),
+            "tuned_at": datetime.date.today().isoformat(),
+        }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=4)
+    print(f"✅ Параметры записаны в {path}. Пересоберите базу (create_db.py / podcast_to_db.py), чтобы они применились.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сетка параметров HNSW: recall@k / p95 / сборка")
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--sample", type=int, default=0, help="Случайных векторов базы как запросов (без модели)")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов каждого запроса для замера задержки")
+    parser.add_argument("--target-recall", type=float, default=0.99)
+    parser.add_argument("--shards", nargs="*", default=None, help="Какие source_type настраивать (по умолчанию все непустые)")
+    parser.add_argument("--dry-run", action="store_true", help="Не записывать параметры в конфиг")
+    args = parser.parse_args()
+
+    store = ShardedVectorStore(backend="chroma")
+    golden = None if args.sample else encode_queries(load_golden_queries())
+
+    results: List[Dict[str, Any]] = []
+    chosen: Dict[str, Dict[str, Any]] = {}
+    for source in args.shards or list(SHARDS):
+        data = store.shards[source].get(include=["embeddings"])
+        if not data["ids"]:
+            print(f"⏭️ Шард '{source}' пуст, пропускаю")
+            continue
+        data["embeddings"] = np.asarray(data["embeddings"], dtype=np.float32)
+        queries = sample_queries(data["embeddings"], args.sample) if args.sample else golden
+        truth = exact_top_k(data["embeddings"], queries, args.k)
+
+        grid = list(itertools.product(GRID_M, GRID_CONSTRUCTION_EF, GRID_SEARCH_EF))
+        print(f"\n🔬 Шард '{source}': {len(data['ids'])} документов, {len(queries)} запросов, {len(grid)} точек сетки")
+        shard_results = []
+        for m, construction_ef, search_ef in grid:
+            row = {"source": source, **evaluate(data, queries, truth, m, construction_ef, search_ef, args.k, args.repeat)}
+            shard_results.append(row)
+            print(f"   M={m:<3} ef_c={construction_ef:<4} ef_s={search_ef:<4} recall={row['recall']:.3f} "
+                  f"p95={row['p95_ms']:.2f} мс сборка={row['build_s']:.2f} с размер={row['size_mb']:.1f} МБ")
+
+        best = choose(shard_results, args.target_recall)
+        chosen[source] = best
+        results.extend(shard_results)
+        print(f"🏆 '{source}': M={best['hnsw:M']}, construction_ef={best['hnsw:construction_ef']}, "
+              f"search_ef={best['hnsw:search_ef']} (recall={best['recall']:.3f}, p95={best['p95_ms']:.2f} мс)")
+
+    if not results:
+        print("❌ Все шарды пусты. Сначала запусти create_db.py / podcast_to_db.py")
+        return
+
+    save_results(results)
+    plot(results, chosen)
+    if not args.dry_run:
+        write_index_config(chosen)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+'''
+Компактный снимок индекса в одном файле, который открывается через mmap без копирования.
+
+Формат файла:
+    8 байт  - сигнатура b"STNKSNP1"
+    8 байт  - длина JSON-заголовка (uint64, little-endian)
+    JSON    - заголовок: размеры, смещения секций, типы столбцов, диапазоны строк шардов
+    секции  - выровнены по 64 байта:
+              vectors               float16 [n, dim] (строки одного шарда идут подряд)
+              ids/texts             uint64 смещения [n+1] + utf-8 блоб
+              col.<ключ>            float64 [n] для числовых полей (NaN = нет значения)
+              col.<ключ>.codes      int32 [n] + словарь значений (смещения + блоб) для строковых
+
+Снимок только читается: несколько процессов, открывших один файл, делят одни и те же страницы page cache.
+
+Запуск из корня проекта:
+    python index_snapshot.py export [--from chroma|numpy] [--out Data/index.snapshot]
+    python index_snapshot.py info [Data/index.snapshot]
+'''
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from numpy_store import NumpyVectorStore
+
+SNAPSHOT_PATH = "Data/index.snapshot"
+MAGIC = b"STNKSNP1"
+ALIGN = 64
+# Код "значения нет" в словарных столбцах и код "такого значения нет в словаре" в фильтрах
+MISSING_CODE = -1
+UNKNOWN_CODE = -2
+
+
+class _StringTable:
+    """Ленивая последовательность строк поверх (смещения, блоб) в mmap."""
+
+    def __init__(self, offsets: np.ndarray, blob: memoryview):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return bytes(self.blob[int(self.offsets[i]):int(self.offsets[i + 1])]).decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class _DictColumn:
+    """Строковый столбец, закодированный словарем: codes[i] -> dictionary[code]."""
+
+    dtype = np.dtype(object)
+
+    def __init__(self, codes: np.ndarray, dictionary: _StringTable):
+        self.codes = codes
+        self.dictionary = dictionary
+        self._lookup: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        code = int(self.codes[i])
+        return None if code == MISSING_CODE else self.dictionary[code]
+
+    def code_of(self, value: Any) -> int:
+        if self._lookup is None:
+            self._lookup = {v: c for c, v in enumerate(self.dictionary)}
+        return self._lookup.get(str(value), UNKNOWN_CODE)
+
+    def slice(self, start: int, end: int) -> "_DictColumn":
+        column = _DictColumn(self.codes[start:end], self.dictionary)
+        column._lookup = self._lookup
+        return column
+
+
+class SnapshotVectorStore(NumpyVectorStore):
+    """NumpyVectorStore только для чтения, все массивы которого - представления над mmap."""
+
+    def __init__(self, vectors: np.ndarray, ids, texts, columns: Dict[str, Any], embedding_function=None):
+        self._embedding_function = embedding_function
+        self.persist_directory = None
+        self.dtype = vectors.dtype
+        self.vectors = vectors
+        # Снимок хранит векторы в исходной размерности (export берет их через get())
+        self.pca_dim = None
+        self.projection = None
+        self._unprojected = None
+        self.shortlist_factor = None
+        self.codes = None
+        self.ids = ids
+        self.texts = texts
+        self._positions = None
+        self.columns = columns
+
+    def _condition_mask(self, key: str, condition: Any) -> np.ndarray:
+        column = self.columns.get(key)
+        if not isinstance(column, _DictColumn):
+            return super()._condition_mask(key, condition)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        # Строковые условия сравниваем по целочисленным кодам словаря
+        codes = column.codes
+        mask = np.ones(len(codes), dtype=bool)
+        for op, arg in condition.items():
+            if op == "$eq":
+                mask &= codes == column.code_of(arg)
+            elif op == "$ne":
+                mask &= codes != column.code_of(arg)
+            elif op in ("$in", "$nin"):
+                found = np.isin(codes, [column.code_of(v) for v in arg])
+                mask &= found if op == "$in" else ~found
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                mask[:] = False
+            else:
+                raise ValueError(f"Неподдерживаемый оператор фильтра: {op}")
+        return mask
+
+    def add_embeddings(self, *args: Any, **kwargs: Any) -> List[str]:
+        raise RuntimeError("Снимок индекса только для чтения: пересоберите его через index_snapshot.py export")
+
+    def reset_collection(self) -> None:
+        raise RuntimeError("Снимок индекса только для чтения: пересоберите его через index_snapshot.py export")
+
+    def persist(self) -> None:
+        pass
+
+
+class _RowSlice:
+    """Представление диапазона строк ленивой таблицы (для шарда внутри общего снимка)."""
+
+    def __init__(self, table: _StringTable, start: int, end: int):
+        self.table, self.start, self.end = table, start, end
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __getitem__(self, i: int) -> str:
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.table[self.start + i]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+# =========================================================
+# ЗАПИСЬ СНИМКА
+# =========================================================
+
+def _encode_strings(values: List[str]) -> Tuple[np.ndarray, bytes]:
+    blobs = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(blobs) + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum([len(b) for b in blobs], dtype=np.uint64)
+    return offsets, b"".join(blobs)
+
+
+def write_snapshot(shards: Dict[str, Dict[str, list]], path: str = SNAPSHOT_PATH) -> Dict[str, Any]:
+    """
+    Пишет снимок. shards: {source_type: {"ids", "texts", "metadatas", "embeddings"}}.
+    Файл сначала пишется рядом во временный, затем атомарно подменяет старый.
+    """
+    ids, texts, metadatas, vectors, ranges = [], [], [], [], {}
+    for source, data in shards.items():
+        start = len(ids)
+        ids.extend(data["ids"])
+        texts.extend(data["texts"])
+        metadatas.extend(m or {} for m in data["metadatas"])
+        if len(data["ids"]):
+            vectors.append(np.asarray(data["embeddings"], dtype=np.float32))
+        ranges[source] = [start, len(ids)]
+
+    matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12) if len(matrix) else 1.0
+
+    sections: Dict[str, bytes] = {"vectors": matrix.astype(np.float16).tobytes()}
+    dtypes: Dict[str, str] = {"vectors": "float16"}
+    for name, values in (("ids", ids), ("texts", texts)):
+        offsets, blob = _encode_strings(values)
+        sections[f"{name}.offsets"], dtypes[f"{name}.offsets"] = offsets.tobytes(), "uint64"
+        sections[f"{name}.blob"], dtypes[f"{name}.blob"] = blob, "uint8"
+
+    # Столбцы метаданных
+    columns: Dict[str, str] = {}
+    for key in sorted({k for m in metadatas for k in m}):
+        values = [m.get(key) for m in metadatas]
+        present = [v for v in values if v is not None]
+        if present and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+            columns[key] = "num"
+            column = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+            sections[f"col.{key}"], dtypes[f"col.{key}"] = column.tobytes(), "float64"
+        else:
+            columns[key] = "str"
+            dictionary = sorted({str(v) for v in present})
+            code = {v: i for i, v in enumerate(dictionary)}
+            codes = np.array([MISSING_CODE if v is None else code[str(v)] for v in values], dtype=np.int32)
+            offsets, blob = _encode_strings(dictionary)
+            sections[f"col.{key}.codes"], dtypes[f"col.{key}.codes"] = codes.tobytes(), "int32"
+            sections[f"col.{key}.dict.offsets"], dtypes[f"col.{key}.dict.offsets"] = offsets.tobytes(), "uint64"
+            sections[f"col.{key}.dict.blob"], dtypes[f"col.{key}.dict.blob"] = blob, "uint8"
+
+    # Смещения считаем от начала области данных, заголовок может иметь любую длину
+    layout, position = {}, 0
+    for name, payload in sections.items():
+        position = -(-position // ALIGN) * ALIGN
+        layout[name] = {"offset": position, "nbytes": len(payload), "dtype": dtypes[name]}
+        position += len(payload)
+
+    header = {
+        "version": 1,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "n": len(ids),
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "shards": ranges,
+        "columns": columns,
+        "sections": layout,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGN) * ALIGN
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name, payload in sections.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(payload)
+        # Добиваем файл до конца последней секции (пустая секция в конце не должна указывать за EOF)
+        f.truncate(data_start + -(-position // ALIGN) * ALIGN)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return header
+
+
+# =========================================================
+# ЧТЕНИЕ СНИМКА
+# =========================================================
+
+def read_header(path: str = SNAPSHOT_PATH) -> Tuple[Dict[str, Any], int]:
+    """Читает только заголовок (без данных). Возвращает (заголовок, начало области данных)."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: это не снимок индекса (неверная сигнатура)")
+        (length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(length).decode("utf-8"))
+    data_start = -(-(len(MAGIC) + 8 + length) // ALIGN) * ALIGN
+    return header, data_start
+
+
+def open_snapshot(path: str = SNAPSHOT_PATH, embedding_function=None) -> Dict[str, SnapshotVectorStore]:
+    """
+    Открывает снимок через mmap и возвращает по хранилищу на шард.
+    Данные не копируются: все массивы - np.frombuffer поверх отображенного файла.
+    """
+    header, data_start = read_header(path)
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def section(name: str) -> np.ndarray:
+        info = header["sections"][name]
+        dtype = np.dtype(info["dtype"])
+        return np.frombuffer(mm, dtype=dtype, count=info["nbytes"] // dtype.itemsize, offset=data_start + info["offset"])
+
+    n, dim = header["n"], header["dim"]
+    vectors = section("vectors").reshape(n, dim) if n else np.zeros((0, 0), dtype=np.float16)
+    ids = _StringTable(section("ids.offsets"), memoryview(section("ids.blob")))
+    texts = _StringTable(section("texts.offsets"), memoryview(section("texts.blob")))
+
+    columns: Dict[str, Any] = {}
+    for key, kind in header["columns"].items():
+        if kind == "num":
+            columns[key] = section(f"col.{key}")
+        else:
+            dictionary = _StringTable(section(f"col.{key}.dict.offsets"), memoryview(section(f"col.{key}.dict.blob")))
+            columns[key] = _DictColumn(section(f"col.{key}.codes"), dictionary)
+
+    stores = {}
+    for source, (start, end) in header["shards"].items():
+        shard_columns = {
+            key: col.slice(start, end) if isinstance(col, _DictColumn) else col[start:end]
+            for key, col in columns.items()
+        }
+        stores[source] = SnapshotVectorStore(
+            vectors[start:end],
+            _RowSlice(ids, start, end),
+            _RowSlice(texts, start, end),
+            shard_columns,
+            embedding_function=embedding_function,
+        )
+    return stores
+
+
+def export_snapshot(source_backend: str = "chroma", path: str = SNAPSHOT_PATH) -> Dict[str, Any]:
+    """Выгружает все шарды из Chroma/NumPy-бэкенда в один файл-снимок (модель не нужна)."""
+    from sharded_store import ShardedVectorStore
+
+    store = ShardedVectorStore(backend=source_backend)
+    shards = {}
+    for source, shard in store.shards.items():
+        data = shard.get(include=["documents", "metadatas", "embeddings"])
+        shards[source] = {
+            "ids": data["ids"],
+            "texts": data["documents"],
+            "metadatas": data["metadatas"],
+            "embeddings": data["embeddings"],
+        }
+    return write_snapshot(shards, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт/просмотр снимка индекса")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export")
+    export.add_argument("--from", dest="source", default="chroma", choices=["chroma", "numpy"])
+    export.add_argument("--out", default=SNAPSHOT_PATH)
+    info = sub.add_parser("info")
+    info.add_argument("path", nargs="?", default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        start = time.perf_counter()
+        header = export_snapshot(args.source, args.out)
+        size = os.path.getsize(args.out) / 2**20
+        print(f"✅ Снимок '{args.out}': {header['n']} документов, dim={header['dim']}, {size:.1f} МБ "
+              f"за {time.perf_counter() - start:.1f} с")
+    else:
+        start = time.perf_counter()
+        stores = open_snapshot(args.path)
+        opened = (time.perf_counter() - start) * 1000
+        header, _ = read_header(args.path)
+        print(f"📦 {args.path} (создан {header['created_at']}), открыт за {opened:.1f} мс")
+        for source, store in stores.items():
+            print(f"   {source:<10} {len(store):>6} документов")
+        print(f"   Столбцы: {', '.join(f'{k}:{v}' for k, v in header['columns'].items())}")
+
+
+if __name__ == "__main__":
+    main()
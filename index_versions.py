@@ -0,0 +1,334 @@
+'''
+Версии индекса (blue/green): пересборка пишет в новый каталог, проверяется контрольными запросами
+и публикуется атомарной заменой манифеста. Работающие процессы видят либо старую версию, либо новую целиком -
+никогда не удаленную или наполовину записанную базу.
+
+    Data/index_versions/<backend>/
+        v20261019-153000-4242/   - каталог версии (persist_directory для ShardedVectorStore)
+        v20261019-153000-4242.staging.json - версия еще не опубликована: с какой версии скопирована, pid сборки
+        current.json             - манифест текущей версии; пишется во временный файл и подменяется os.replace
+        publish.lock             - публикация идет под flock
+
+Две сборки по своим источникам одновременно (create_db.py и podcast_to_db.py) копируют одну и ту же
+текущую версию; вторая публикация отказывается, если текущая сменилась после копирования,
+иначе она молча выкинула бы шард первой.
+
+Сборка (create_db.py, podcast_to_db.py, ingest_pipeline.py):
+    path = stage_version("chroma", BACKEND_PATHS["chroma"])   # копия текущей версии: пересобираем только свои шарды
+    store = ShardedVectorStore(persist_directory=path, ...)
+    bulk_load(store, ...)
+    publish_version(store, path)                             # контрольные запросы -> current.json -> удаление старых версий
+
+Чтение: sharded_store.index_path() - каталог текущей версии (без манифеста - прежний Data/chroma_db).
+Работающий процесс между запросами вызывает IndexWatcher.poll(): новая версия открывается в фоне
+и отдается, когда готова; запросы в это время идут в старую.
+
+Запуск из корня проекта:
+    python index_versions.py status          # текущая версия и список каталогов
+    python index_versions.py gc              # удалить старые версии вручную
+'''
+
+import argparse
+import contextlib
+import datetime
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# --- НАСТРОЙКИ ---
+VERSIONS_DIR = "Data/index_versions"
+MANIFEST_NAME = "current.json"
+LOCK_NAME = "publish.lock"
+STAGING_SUFFIX = ".staging.json"
+# Сколько предыдущих версий хранить рядом с текущей (процессы, еще не переключившиеся, читают их)
+KEEP_VERSIONS = 2
+# Как часто работающий процесс проверяет манифест (секунды): между проверками poll() почти бесплатен
+CHECK_INTERVAL = 5.0
+# Контрольные запросы: каждый должен вернуть хотя бы один документ без ошибки
+SMOKE_QUERIES = [
+    "Какие документы нужны для подачи заявления в МГТУ СТАНКИН?",
+    "Сколько баллов нужно набрать, чтобы поступить на направление 09.03.03?",
+    "Стоимость обучения на бакалавриате",
+    "Что рассказывают о направлении Информатика и вычислительная техника?",
+]
+# Шард новой версии не должен потерять больше этой доли документов относительно текущей
+MAX_SHARD_SHRINK = 0.1
+# Бэкенды, которые версионируются каталогами (снимок - один файл, его пишет index_snapshot.py export)
+VERSIONED_BACKENDS = ("chroma", "numpy")
+
+
+def backend_dir(backend: str) -> str:
+    return os.path.join(VERSIONS_DIR, backend)
+
+
+def read_manifest(backend: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(backend_dir(backend), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def resolve_index_path(backend: str, fallback: str) -> str:
+    """Каталог текущей версии или fallback (база, собранная до появления версий)."""
+    manifest = read_manifest(backend) if backend in VERSIONED_BACKENDS else None
+    return manifest["path"] if manifest else fallback
+
+
+def _write_manifest(backend: str, manifest: Dict[str, Any]) -> None:
+    """Временный файл + fsync + os.replace: читатель видит либо старый манифест, либо новый целиком."""
+    path = os.path.join(backend_dir(backend), MANIFEST_NAME)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _staging_path(backend: str, version: str) -> str:
+    return os.path.join(backend_dir(backend), version + STAGING_SUFFIX)
+
+
+def _read_staging(backend: str, version: str) -> Optional[Dict[str, Any]]:
+    path = _staging_path(backend, version)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextlib.contextmanager
+def _publish_lock(backend: str):
+    """Проверка текущей версии и запись манифеста - под одной блокировкой на бэкенд."""
+    os.makedirs(backend_dir(backend), exist_ok=True)
+    with open(os.path.join(backend_dir(backend), LOCK_NAME), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _version_dirs(backend: str) -> List[str]:
+    root = backend_dir(backend)
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if name.startswith("v") and os.path.isdir(os.path.join(root, name)))
+
+
+def stage_version(backend: str, fallback: str, copy_current: bool = True) -> str:
+    """
+    Новый каталог версии. copy_current=True копирует текущую версию (или fallback),
+    чтобы скрипт мог пересобрать только свои шарды, не трогая остальные.
+    """
+    if backend not in VERSIONED_BACKENDS:
+        raise ValueError(f"Бэкенд '{backend}' не версионируется каталогами (снимок собирается index_snapshot.py export)")
+    version = f"v{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    path = os.path.join(backend_dir(backend), version)
+    manifest = read_manifest(backend)
+    current = manifest["path"] if manifest else fallback
+    if copy_current and os.path.isdir(current):
+        shutil.copytree(current, path)
+    else:
+        os.makedirs(path)
+    # Копия несет шарды текущей версии: публиковать ее можно, только пока текущая не сменилась
+    staging = {"base": manifest["version"] if manifest else None, "check_base": copy_current, "pid": os.getpid()}
+    with open(_staging_path(backend, version), "w", encoding="utf-8") as f:
+        json.dump(staging, f)
+    print(f"🆕 Новая версия индекса: {path}" + (f" (копия {current})" if copy_current and os.path.isdir(current) else ""))
+    return path
+
+
+def shard_counts(store: Any) -> Dict[str, int]:
+    counts = {}
+    for source, shard in store.shards.items():
+        counts[source] = len(shard) if hasattr(shard, "__len__") else shard._collection.count()
+    return counts
+
+
+def smoke_test(store: Any, queries: Sequence[str] = SMOKE_QUERIES, previous: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """Контрольные запросы и размеры шардов новой версии. problems - пустой список, если версию можно публиковать."""
+    problems: List[str] = []
+    counts = shard_counts(store)
+    for source, before in (previous or {}).items():
+        after = counts.get(source, 0)
+        if before and after < before * (1 - MAX_SHARD_SHRINK):
+            problems.append(f"шард '{source}': {after} документов вместо {before}")
+    if not any(counts.values()):
+        problems.append("все шарды пусты")
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        try:
+            found = store.similarity_search_with_relevance_scores(query, k=3)
+        except Exception as e:
+            problems.append(f"'{query}': {e!r}")
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        if not found:
+            problems.append(f"'{query}': пустая выдача")
+    return {"counts": counts, "problems": problems, "query_ms": [round(ms, 1) for ms in latencies]}
+
+
+def publish_version(store: Any, path: str, queries: Sequence[str] = SMOKE_QUERIES, force: bool = False) -> Dict[str, Any]:
+    """
+    Проверяет версию и делает ее текущей. При проваленной проверке или если текущая версия сменилась
+    после stage_version (параллельная сборка) текущая версия не меняется.
+    """
+    backend = store.backend
+    version = os.path.basename(path)
+    with _publish_lock(backend):
+        current = read_manifest(backend)
+        staging = _read_staging(backend, version)
+        now = current["version"] if current else None
+        if staging and staging["check_base"] and staging["base"] != now:
+            raise RuntimeError(f"Версия {path} не опубликована: она собрана из {staging['base']}, "
+                               f"а текущей за это время стала {now} (параллельная сборка). Пересоберите")
+        report = smoke_test(store, queries, previous=current.get("counts") if current else None)
+        if report["problems"] and not force:
+            raise RuntimeError(f"Версия {path} не опубликована: " + "; ".join(report["problems"]))
+
+        # Опубликованные версии (новые первыми) - на них можно откатиться, их и бережет gc_versions
+        published = current.get("published", [now]) if current else []
+        manifest = {
+            "version": version,
+            "path": path,
+            "backend": backend,
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "previous": now,
+            "published": [version] + published[:KEEP_VERSIONS],
+            "counts": report["counts"],
+            "smoke_query_ms": report["query_ms"],
+        }
+        _write_manifest(backend, manifest)
+        if staging is not None:
+            os.remove(_staging_path(backend, version))
+    print(f"✅ Опубликована версия {manifest['version']}: {report['counts']}, контрольные запросы {report['query_ms']} мс")
+    gc_versions(backend)
+    return manifest
+
+
+def gc_versions(backend: str, keep: int = KEEP_VERSIONS) -> List[str]:
+    """
+    Удаляет каталоги версий, кроме текущей и keep последних опубликованных до нее.
+    Неопубликованные каталоги в счет keep не идут: идущая сборка не трогается, упавшая или не прошедшая
+    проверку удаляется (откатиться на нее нельзя).
+    """
+    root = backend_dir(backend)
+    manifest = read_manifest(backend)
+    current = manifest["version"] if manifest else None
+    # Манифест без списка published (до его появления): все каталоги без staging считаются опубликованными
+    published = set(manifest["published"]) if manifest and "published" in manifest else None
+    removed = []
+    kept = 0
+    # Имена версий начинаются с отметки времени - сортировка по имени совпадает с хронологией
+    for name in reversed(_version_dirs(backend)):
+        if name == current:
+            continue
+        staging = _read_staging(backend, name)
+        if staging is not None and _pid_alive(staging["pid"]):
+            continue
+        if staging is None and (published is None or name in published) and kept < keep:
+            kept += 1
+            continue
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        if staging is not None:
+            os.remove(_staging_path(backend, name))
+        removed.append(name)
+    if removed:
+        print(f"🧹 Удалены старые версии: {', '.join(removed)}")
+    return removed
+
+
+class IndexWatcher:
+    """
+    Следит за манифестом и открывает новую версию через open_version(path).
+    background=True - открытие в отдельном потоке (запросы идут в старую версию, пока новая грузится);
+    False - прямо в poll() (родитель prefork_server: сам запросов не обслуживает, а fork при живом потоке опасен).
+    """
+
+    def __init__(self, backend: str, open_version: Callable[[str], Any], interval: float = CHECK_INTERVAL, background: bool = True):
+        self.backend = backend
+        self.open_version = open_version
+        self.interval = interval
+        self.background = background
+        manifest = read_manifest(backend) if backend in VERSIONED_BACKENDS else None
+        self.version = manifest["version"] if manifest else None
+        self._next_check = time.monotonic() + interval
+        self._lock = threading.Lock()
+        self._loading: Optional[threading.Thread] = None
+        self._ready: Optional[Any] = None
+        self._failed: Optional[str] = None
+
+    def _load(self, manifest: Dict[str, Any]) -> None:
+        start = time.perf_counter()
+        try:
+            self._ready = (manifest["version"], self.open_version(manifest["path"]))
+            print(f"🔁 Версия индекса {manifest['version']} открыта за {time.perf_counter() - start:.1f} с")
+        except Exception as e:
+            # Остаемся на старой версии и не пытаемся открыть эту же снова
+            self._failed = manifest["version"]
+            print(f"❌ Не удалось открыть версию {manifest['version']}: {e}")
+
+    def poll(self) -> Optional[Any]:
+        """Результат open_version для новой версии, если она готова; иначе None. Вызывать между запросами."""
+        if self.backend not in VERSIONED_BACKENDS:
+            return None
+        with self._lock:
+            if self._loading is not None and self._loading.is_alive():
+                return None
+            self._loading = None
+            if self._ready is None:
+                now = time.monotonic()
+                if now < self._next_check:
+                    return None
+                self._next_check = now + self.interval
+                manifest = read_manifest(self.backend)
+                if not manifest or manifest["version"] in (self.version, self._failed):
+                    return None
+                if self.background:
+                    self._loading = threading.Thread(target=self._load, args=(manifest,), name="index-watcher", daemon=True)
+                    self._loading.start()
+                    return None
+                self._load(manifest)
+                if self._ready is None:
+                    return None
+            (self.version, opened), self._ready = self._ready, None
+            return opened
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["status", "gc"])
+    parser.add_argument("--backend", default=os.getenv("VECTOR_BACKEND", "chroma"))
+    args = parser.parse_args()
+
+    if args.command == "gc":
+        gc_versions(args.backend)
+        return
+    manifest = read_manifest(args.backend)
+    print(json.dumps(manifest, ensure_ascii=False, indent=2) if manifest else f"Манифеста нет: {args.backend} читается из старого каталога")
+    for name in _version_dirs(args.backend):
+        staging = _read_staging(args.backend, name)
+        note = "" if staging is None else f"  (не опубликована, сборка pid {staging['pid']})"
+        print(f"   {'*' if manifest and name == manifest['version'] else ' '} {name}{note}")
+
+
+if __name__ == "__main__":
+    main()
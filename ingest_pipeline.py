@@ -0,0 +1,436 @@
+'''
+Единый потоковый конвейер загрузки: программы (JSON каталога), подкасты, страницы сайта и PDF
+попадают в один ShardedVectorStore. Модель эмбеддингов загружается один раз на все источники.
+
+Стадии работают одновременно (каждая в своем потоке) и связаны очередями ограниченного размера:
+    источники + нормализация -> чанкинг -> эмбеддинги -> запись
+Если запись отстает, эмбеддинг ждет места в очереди, а чтение источников останавливается
+(обратное давление) - в памяти лежат только очереди и текущее окно, а не весь корпус списком Document.
+Эмбеддинги считаются окнами по EMBED_WINDOW чанков (внутри окна - сортировка по длине, как в bulk_load.py).
+Потоковая запись - только у Chroma. NumPy-хранилище держит матрицу шарда в памяти целиком и пересобирает ее
+на каждой записи, поэтому векторы его окон дописываются во временный файл на диске (NumpySpool) и попадают
+в шард одной записью в конце; пик памяти у NumPy-бэкенда - порядка размера шарда, а не окна.
+
+Источник - генератор записей (текст, метаданные, шапка чанка). Страницы сайта и PDF читаются из JSONL
+{"url": ..., "text": ...}, который сохраняет html_parser.ipynb (save_pages): краулинг и загрузка разделены.
+Загрузка идет в новую версию индекса и публикуется после контрольных запросов (index_versions.py).
+
+Запуск из корня проекта:
+    python ingest_pipeline.py                          # все источники
+    python ingest_pipeline.py --only programs podcasts # только выбранные (остальные шарды не трогаем)
+'''
+
+import argparse
+import datetime
+import json
+import os
+import queue
+import resource
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from bulk_load import BULK_BATCH_SIZE, BULK_HNSW_METADATA, embed_sorted, stable_ids, write_batch_size
+from chunk_filter import ChunkFilter
+from index_versions import publish_version, stage_version
+from metadata_index import canonicalize_metadata
+from sharded_store import BACKEND_PATHS, VECTOR_BACKEND, ShardedVectorStore
+from token_chunker import TokenChunker
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Сборка документов живет в скриптах рядом с данными - берем ее оттуда, чтобы текст и метаданные не разъехались
+sys.path.extend([os.path.join(ROOT, "Data", "table_parser_files"), os.path.join(ROOT, "Data", "audio")])
+
+# --- НАСТРОЙКИ ---
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "intfloat/multilingual-e5-large")
+PROGRAMS_PATH = "Data/table_parser_files/stankin_programs.json"
+PODCASTS_DIR = "Data/audio/jsons"
+WEB_PAGES_PATH = "Data/html_parser_files/pages.jsonl"
+PDF_PAGES_PATH = "Data/html_parser_files/pdf_pages.jsonl"
+# Размер каждой очереди между стадиями (в записях / чанках / окнах)
+QUEUE_SIZE = 256
+# Сколько записей чанкер токенизирует одним вызовом
+CHUNK_GROUP = 64
+# Сколько чанков эмбеддятся одним окном (сортировка по длине внутри окна)
+EMBED_WINDOW = 512
+# Фильтр длины чанков сайта и PDF (в символах, как в html_parser.ipynb)
+MIN_CHUNK_LEN = 50
+MAX_CHUNK_LEN = 3000
+# Как часто стадия проверяет, не упала ли соседняя (секунды)
+POLL_SECONDS = 0.5
+
+_DONE = object()
+
+
+class NumpySpool:
+    """Окна одного NumPy-шарда: векторы дописываются во временный файл, в памяти - только документы."""
+
+    def __init__(self):
+        self.docs: List[Document] = []
+        self.dim = 0
+        self._file = tempfile.TemporaryFile(prefix="ingest_spool_")
+
+    def append(self, docs: List[Document], matrix: np.ndarray) -> None:
+        self.docs.extend(docs)
+        self.dim = matrix.shape[1]
+        self._file.write(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+
+    def matrix(self) -> np.ndarray:
+        """Все векторы шарда - отображение файла, а не копия в памяти."""
+        self._file.flush()
+        return np.memmap(self._file, dtype=np.float32, mode="r", shape=(len(self.docs), self.dim))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class PipelineAborted(Exception):
+    """Другая стадия упала - текущая выходит без обработки остатка."""
+
+
+@dataclass
+class Record:
+    text: str
+    metadata: Dict[str, Any]
+    prefix: str = ""  # шапка с контекстом, повторяется в каждом чанке (подкасты)
+
+
+@dataclass
+class Source:
+    name: str
+    records: Callable[[], Iterator[Record]]
+    chunk: bool = True                          # False - запись идет в базу целиком (строки таблицы)
+    chunk_filter: Optional[ChunkFilter] = None  # отсев мусорных чанков (сайт, PDF)
+
+
+@dataclass
+class StageStats:
+    name: str
+    items_in: int = 0
+    items_out: int = 0
+    wall_seconds: float = 0.0
+    wait_seconds: float = 0.0  # ждала вход или место в выходной очереди
+    max_queue: int = 0         # максимальная глубина входной очереди
+
+    @property
+    def busy_seconds(self) -> float:
+        return max(self.wall_seconds - self.wait_seconds, 0.0)
+
+
+@dataclass
+class PipelineReport:
+    stages: List[StageStats] = field(default_factory=list)
+    docs: int = 0
+    per_source: Dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+    peak_rss_mb: float = 0.0
+
+    def print(self) -> None:
+        print("=" * 72)
+        print(f"{'Стадия':<12}{'вход':>9}{'выход':>9}{'работа, с':>12}{'ожидание, с':>14}{'макс. очередь':>16}")
+        print("-" * 72)
+        for s in self.stages:
+            print(f"{s.name:<12}{s.items_in:>9}{s.items_out:>9}{s.busy_seconds:>12.1f}{s.wait_seconds:>14.1f}{s.max_queue:>16}")
+        print("=" * 72)
+        sources = ", ".join(f"{name}: {count}" for name, count in self.per_source.items()) or "нет"
+        rate = self.docs / self.seconds if self.seconds > 0 else 0.0
+        print(f"📦 Записано {self.docs} чанков ({sources}) за {self.seconds:.1f} с ({rate:.1f} док/с), "
+              f"пик памяти {self.peak_rss_mb:.0f} МБ")
+
+
+# --- ИСТОЧНИКИ ---
+
+def program_source(path: str = PROGRAMS_PATH) -> Source:
+    """Каталог программ: одна запись - один документ, без чанкинга."""
+    from create_db import iter_program_documents
+
+    def records() -> Iterator[Record]:
+        if not os.path.exists(path):
+            print(f"❌ Файл {path} не найден!")
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for doc in iter_program_documents(data):
+            yield Record(doc.page_content, doc.metadata)
+
+    return Source("programs", records, chunk=False)
+
+
+def podcast_source(directory: str = PODCASTS_DIR) -> Source:
+    from podcast_to_db import iter_podcast_segments
+
+    def records() -> Iterator[Record]:
+        for prefix, text, metadata in iter_podcast_segments(directory):
+            yield Record(text, metadata, prefix)
+
+    return Source("podcasts", records)
+
+
+def save_pages(pages: Dict[str, str], path: str) -> None:
+    """{url: текст} -> JSONL для pages_source (вызывается из html_parser.ipynb после краулинга)."""
+    with open(path, "w", encoding="utf-8") as f:
+        for url, text in pages.items():
+            f.write(json.dumps({"url": url, "text": text}, ensure_ascii=False) + "\n")
+
+
+def iter_pages(path: str) -> Iterator[Tuple[str, str]]:
+    if not os.path.exists(path):
+        print(f"⚠️ Нет файла страниц {path} (сохраняется в html_parser.ipynb)")
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                page = json.loads(line)
+                if page.get("text"):
+                    yield page["url"], page["text"]
+
+
+def pages_source(name: str, path: str, source_type: str, patterns: Optional[Dict[str, str]] = None) -> Source:
+    """Страницы сайта / PDF. Шаблонные строки (меню, футер) считаются отдельным проходом по файлу: в памяти только счетчики строк."""
+    garbage_filter = ChunkFilter(patterns=patterns).fit(text for _, text in iter_pages(path))
+    created_at = datetime.datetime.now().strftime("%Y-%m-%d")
+
+    def records() -> Iterator[Record]:
+        for url, text in iter_pages(path):
+            text = garbage_filter.clean_page(text)
+            if text.strip():
+                yield Record(text, {"source_type": source_type, "url": url, "created_at": created_at})
+
+    return Source(name, records, chunk_filter=garbage_filter)
+
+
+def default_sources() -> Dict[str, Callable[[], Source]]:
+    return {
+        "programs": program_source,
+        "podcasts": podcast_source,
+        "web": lambda: pages_source("web", WEB_PAGES_PATH, "Сайт"),
+        "pdf": lambda: pages_source("pdf", PDF_PAGES_PATH, "PDF"),
+    }
+
+
+# --- КОНВЕЙЕР ---
+
+class IngestPipeline:
+    def __init__(
+        self,
+        store: Any,
+        embed: Callable[[List[str]], Any],
+        chunker: Optional[TokenChunker] = None,
+        reset: bool = True,
+        queue_size: int = QUEUE_SIZE,
+        embed_window: int = EMBED_WINDOW,
+        batch_size: int = BULK_BATCH_SIZE,
+    ):
+        self.store = store
+        self.embed = embed
+        self.chunker = chunker or TokenChunker()
+        self.reset = reset
+        self.queue_size = queue_size
+        self.embed_window = embed_window
+        self.batch_size = batch_size
+
+    # --- ОЧЕРЕДИ С ОБРАТНЫМ ДАВЛЕНИЕМ ---
+
+    def _put(self, q: queue.Queue, item: Any, stats: StageStats) -> None:
+        self._wait_put(q, item, stats)
+        stats.items_out += 1
+
+    def _wait_put(self, q: queue.Queue, item: Any, stats: StageStats) -> None:
+        """put с ожиданием места (обратное давление); выходит, если упала другая стадия."""
+        start = time.perf_counter()
+        while True:
+            if self._failed.is_set():
+                raise PipelineAborted()
+            try:
+                q.put(item, timeout=POLL_SECONDS)
+                break
+            except queue.Full:
+                continue
+        stats.wait_seconds += time.perf_counter() - start
+
+    def _drain(self, q: queue.Queue, stats: StageStats) -> Iterator[Any]:
+        while True:
+            start = time.perf_counter()
+            while True:
+                if self._failed.is_set():
+                    raise PipelineAborted()
+                try:
+                    item = q.get(timeout=POLL_SECONDS)
+                    break
+                except queue.Empty:
+                    continue
+            stats.wait_seconds += time.perf_counter() - start
+            if item is _DONE:
+                return
+            stats.items_in += 1
+            stats.max_queue = max(stats.max_queue, q.qsize() + 1)
+            yield item
+
+    def _stage(self, stats: StageStats, work: Callable[[], None], out: Optional[queue.Queue]) -> Callable[[], None]:
+        def run():
+            start = time.perf_counter()
+            try:
+                work()
+                if out is not None:
+                    self._wait_put(out, _DONE, stats)
+            except PipelineAborted:
+                pass
+            except BaseException as e:
+                self._errors.append(e)
+                self._failed.set()
+            finally:
+                stats.wall_seconds = time.perf_counter() - start
+        return run
+
+    # --- СТАДИИ ---
+
+    def _read(self, sources: List[Source], out: queue.Queue, stats: StageStats) -> None:
+        """Читает источники по очереди и нормализует записи (метаданные - к каноническому виду)."""
+        for source in sources:
+            for record in source.records():
+                stats.items_in += 1
+                text = record.text.strip()
+                if not text:
+                    continue
+                self._put(out, (source, Record(text, canonicalize_metadata(record.metadata), record.prefix)), stats)
+
+    def _chunk_group(self, group: List[Tuple[Source, Record]], out: queue.Queue, stats: StageStats) -> None:
+        split = self.chunker.split_with_prefix([r.prefix for _, r in group], [r.text for _, r in group])
+        for (source, record), chunks in zip(group, split):
+            for i, chunk in enumerate(chunks):
+                if source.chunk_filter is not None:
+                    if not (MIN_CHUNK_LEN <= len(chunk) <= MAX_CHUNK_LEN) or source.chunk_filter.classify(chunk):
+                        continue
+                self._put(out, (source.name, Document(page_content=chunk, metadata={**record.metadata, "chunk": i})), stats)
+
+    def _chunk(self, inp: queue.Queue, out: queue.Queue, stats: StageStats) -> None:
+        """Режет записи по токенам e5 группами по CHUNK_GROUP (один вызов токенизатора на группу)."""
+        group: List[Tuple[Source, Record]] = []
+        for source, record in self._drain(inp, stats):
+            if not source.chunk:
+                self._put(out, (source.name, Document(page_content=record.text, metadata=record.metadata)), stats)
+                continue
+            group.append((source, record))
+            if len(group) >= CHUNK_GROUP:
+                self._chunk_group(group, out, stats)
+                group = []
+        if group:
+            self._chunk_group(group, out, stats)
+
+    def _embed(self, inp: queue.Queue, out: queue.Queue, stats: StageStats) -> None:
+        """Окна по embed_window чанков -> (чанки, матрица float32)."""
+        window: List[Tuple[str, Document]] = []
+        for item in self._drain(inp, stats):
+            window.append(item)
+            if len(window) >= self.embed_window:
+                self._put(out, (window, embed_sorted([d.page_content for _, d in window], self.embed, self.batch_size)), stats)
+                window = []
+        if window:
+            self._put(out, (window, embed_sorted([d.page_content for _, d in window], self.embed, self.batch_size)), stats)
+
+    def _write(self, inp: queue.Queue, stats: StageStats, report: PipelineReport) -> None:
+        """Пишет окна в шарды. Шард пересоздается при первой записи в него (остальные не трогаем)."""
+        touched = set()
+        # NumPy-шард пересобирает матрицу и файл на каждой записи - его окна копятся на диске и пишутся один раз в конце
+        spools: Dict[str, NumpySpool] = {}
+        for window, matrix in self._drain(inp, stats):
+            by_shard: Dict[str, List[int]] = {}
+            for i, (name, doc) in enumerate(window):
+                by_shard.setdefault(doc.metadata.get("source_type", ""), []).append(i)
+                report.per_source[name] = report.per_source.get(name, 0) + 1
+            for source, rows in by_shard.items():
+                if source not in self.store.shards:
+                    raise ValueError(f"Неизвестный source_type '{source}': нет такого шарда")
+                if self.reset and source not in touched:
+                    self.store.reset_shard(source, collection_metadata=BULK_HNSW_METADATA)
+                touched.add(source)
+                docs = [window[i][1] for i in rows]
+                if self.store.backend == "numpy":
+                    spools.setdefault(source, NumpySpool()).append(docs, matrix[rows])
+                else:
+                    self._add(source, docs, matrix[rows])
+            report.docs += len(window)
+        for source, spool in spools.items():
+            try:
+                self._add(source, spool.docs, spool.matrix())
+            finally:
+                spool.close()
+
+    def _add(self, source: str, docs: List[Document], matrix: np.ndarray) -> None:
+        self.store.add_embeddings(
+            source,
+            [d.page_content for d in docs],
+            matrix,
+            [d.metadata for d in docs],
+            stable_ids(docs, self._seen_ids),
+            batch_size=write_batch_size(self.store.shards[source]),
+        )
+
+    def run(self, sources: Iterable[Source]) -> PipelineReport:
+        sources = list(sources)
+        self._failed = threading.Event()
+        self._errors: List[BaseException] = []
+        self._seen_ids: Dict[str, int] = {}
+        report = PipelineReport(stages=[StageStats(name) for name in ("чтение", "чанкинг", "эмбеддинги", "запись")])
+        read, chunk, embed, write = report.stages
+        records, chunks, windows = (queue.Queue(maxsize=self.queue_size) for _ in range(3))
+
+        threads = [
+            threading.Thread(target=self._stage(read, lambda: self._read(sources, records, read), records), name="ingest-read"),
+            threading.Thread(target=self._stage(chunk, lambda: self._chunk(records, chunks, chunk), chunks), name="ingest-chunk"),
+            threading.Thread(target=self._stage(embed, lambda: self._embed(chunks, windows, embed), windows), name="ingest-embed"),
+            threading.Thread(target=self._stage(write, lambda: self._write(windows, write, report), None), name="ingest-write"),
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report.seconds = time.perf_counter() - start
+        # ru_maxrss в Linux - в килобайтах
+        report.peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        if self._errors:
+            raise self._errors[0]
+        for source in sources:
+            if source.chunk_filter is not None:
+                print(f"🧹 Фильтр {source.name}: {source.chunk_filter.report.line()}")
+        return report
+
+
+def load_embeddings():
+    """Одна модель e5 на весь конвейер."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    print(f"🧠 Загрузка модели эмбеддингов ({EMBEDDING_MODEL})...")
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        encode_kwargs={"batch_size": BULK_BATCH_SIZE},  # пачки по длине собирает embed_sorted, модель считает их целиком
+    )
+
+
+def main():
+    factories = default_sources()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", nargs="+", choices=sorted(factories), help="загрузить только эти источники")
+    args = parser.parse_args()
+
+    embeddings = load_embeddings()
+    # Новая версия индекса; копия текущей нужна, только если пересобираются не все источники
+    path = stage_version(VECTOR_BACKEND, BACKEND_PATHS[VECTOR_BACKEND], copy_current=bool(args.only))
+    store = ShardedVectorStore(persist_directory=path, embedding_function=embeddings)
+    sources = [factories[name]() for name in (args.only or factories)]
+    print(f"🚀 Конвейер: {', '.join(s.name for s in sources)} -> '{store.persist_directory}'")
+
+    report = IngestPipeline(store, embeddings.embed_documents).run(sources)
+    report.print()
+    publish_version(store, path)
+
+
+if __name__ == "__main__":
+    main()
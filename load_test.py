@@ -0,0 +1,325 @@
+'''
+Нагрузочный тест пути поиска: на какой интенсивности get_retriever() упирается в CPU.
+
+- Открытая модель нагрузки: запросы приходят по пуассоновскому потоку с заданной частотой,
+  независимо от того, успели ли ответить на предыдущие. Задержка считается от ЗАПЛАНИРОВАННОГО
+  момента отправки, поэтому очередь внутри сервиса честно попадает в перцентили.
+- Вопросы - взвешенная смесь типичных вопросов абитуриентов (Data/load_test_questions.json).
+- Вместо OpenRouter - локальный фейковый endpoint с настраиваемой задержкой: он возвращает
+  структурированный запрос (фильтр берется из того же файла вопросов), LLM не тратится.
+- Отчет: пропускная способность, p50/p90/p99, доля ошибок и ежесекундные CPU%/RSS.
+
+Запуск из корня проекта:
+    python load_test.py --rates 1,2,4,8 --stage-seconds 30           # ретривер в этом же процессе
+    python load_test.py --fake-llm-only                               # только фейковый OpenRouter
+    OPENROUTER_BASE_URL=http://127.0.0.1:8901/v1 python prefork_server.py   # (в другом терминале)
+    python load_test.py --target http://127.0.0.1:8000 --server-pid <pid>   # через HTTP-сервис
+'''
+
+import argparse
+import csv
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+# --- НАСТРОЙКИ ---
+QUESTIONS_PATH = "Data/load_test_questions.json"
+RESULTS_CSV = "Data/load_test_timeline.csv"
+FAKE_LLM_HOST = "127.0.0.1"
+FAKE_LLM_PORT = 8901
+# Максимум одновременно висящих запросов: сверх этого запрос считается отброшенным клиентом
+MAX_INFLIGHT = 512
+SAMPLE_INTERVAL = 1.0
+
+_USER_QUERY_RE = re.compile(r"User Query:\s*(.*?)\s*Structured Request:", re.DOTALL)
+
+
+def load_questions(path: str = QUESTIONS_PATH) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# --- ФЕЙКОВЫЙ OPENROUTER ---
+
+class FakeOpenRouterHandler(BaseHTTPRequestHandler):
+    """Отвечает как /chat/completions: структурированный запрос для SelfQueryRetriever после паузы."""
+
+    filters: Dict[str, str] = {}
+    latency_ms = 800.0
+    jitter_ms = 200.0
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        prompt = "\n".join(str(m.get("content", "")) for m in payload.get("messages", []))
+        # Последний "User Query:" в промпте - вопрос пользователя (выше идут примеры из few-shot)
+        matches = _USER_QUERY_RE.findall(prompt)
+        question = matches[-1].strip() if matches else ""
+        structured = {"query": question, "filter": self.filters.get(question, "NO_FILTER")}
+
+        time.sleep(max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000)
+        body = json.dumps({
+            "id": "fake-completion",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "```json\n" + json.dumps(structured, ensure_ascii=False) + "\n```"},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_fake_openrouter(questions: List[Dict[str, Any]], latency_ms: float, jitter_ms: float) -> ThreadingHTTPServer:
+    FakeOpenRouterHandler.filters = {q["question"]: q.get("filter", "NO_FILTER") for q in questions}
+    FakeOpenRouterHandler.latency_ms = latency_ms
+    FakeOpenRouterHandler.jitter_ms = jitter_ms
+    server = ThreadingHTTPServer((FAKE_LLM_HOST, FAKE_LLM_PORT), FakeOpenRouterHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"🤖 Фейковый OpenRouter: http://{FAKE_LLM_HOST}:{FAKE_LLM_PORT}/v1 (задержка {latency_ms:.0f}±{jitter_ms:.0f} мс)")
+    return server
+
+
+# --- ЦЕЛИ НАГРУЗКИ ---
+
+def make_inproc_target() -> Callable[[str], int]:
+    """Ретривер в этом же процессе. Возвращает число найденных документов."""
+    # Только фейковый endpoint: реальные значения из окружения/.env перезаписываем, иначе нагрузка
+    # пошла бы в настоящий OpenRouter за счет настоящего ключа
+    fake_url = f"http://{FAKE_LLM_HOST}:{FAKE_LLM_PORT}/v1"
+    os.environ["OPENROUTER_API_KEY"] = "sk-or-v1-fake"
+    os.environ["OPENROUTER_BASE_URL"] = fake_url
+    import self_query_searcher
+    # Настройки читаются при импорте модуля - если он уже был загружен раньше, проверяем, что взят фейк
+    if self_query_searcher.OPENROUTER_BASE_URL != fake_url:
+        raise RuntimeError(f"self_query_searcher уже настроен на {self_query_searcher.OPENROUTER_BASE_URL}, "
+                           f"а не на фейковый {fake_url} - нагрузочный тест не запущен")
+    retriever = self_query_searcher.get_retriever()
+    return lambda question: len(retriever.invoke(question))
+
+
+def make_http_target(base_url: str) -> Callable[[str], int]:
+    """Сервис поиска (prefork_server.py): POST /search."""
+    url = base_url.rstrip("/") + "/search"
+
+    def call(question: str) -> int:
+        request = urllib.request.Request(
+            url, data=json.dumps({"query": question}).encode("utf-8"), headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=120) as response:
+            return len(json.load(response)["docs"])
+
+    return call
+
+
+# --- РЕСУРСЫ ---
+
+class ProcSampler(threading.Thread):
+    """Раз в секунду снимает CPU% и RSS процесса (и его дочерних - воркеров prefork) из /proc."""
+
+    def __init__(self, pid: int):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.samples: List[Dict[str, float]] = []
+        self.stopped = threading.Event()
+        self._ticks = os.sysconf("SC_CLK_TCK")
+
+    def _pids(self) -> List[int]:
+        pids = [self.pid]
+        try:
+            with open(f"/proc/{self.pid}/task/{self.pid}/children") as f:
+                pids += [int(p) for p in f.read().split()]
+        except OSError:
+            pass
+        return pids
+
+    def _read(self) -> Dict[str, float]:
+        cpu_s, rss_mb = 0.0, 0.0
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                cpu_s += (int(fields[11]) + int(fields[12])) / self._ticks
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            rss_mb += int(line.split()[1]) / 1024
+            except OSError:
+                continue
+        return {"cpu_s": cpu_s, "rss_mb": rss_mb}
+
+    def run(self) -> None:
+        prev, prev_t = self._read(), time.monotonic()
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            cur, now = self._read(), time.monotonic()
+            self.samples.append({
+                "t": now,
+                "cpu_pct": 100 * (cur["cpu_s"] - prev["cpu_s"]) / (now - prev_t),
+                "rss_mb": cur["rss_mb"],
+            })
+            prev, prev_t = cur, now
+
+
+# --- ГЕНЕРАТОР НАГРУЗКИ ---
+
+class OpenLoopRun:
+    def __init__(self, target: Callable[[str], int], questions: List[Dict[str, Any]], max_inflight: int = MAX_INFLIGHT):
+        self.target = target
+        self.questions = [q["question"] for q in questions]
+        self.weights = [q.get("weight", 1) for q in questions]
+        self.pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="load")
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self.lock = threading.Lock()
+        self.records: List[Dict[str, Any]] = []
+
+    def _fire(self, stage: int, question: str, scheduled: float) -> None:
+        ok, error = True, ""
+        try:
+            self.target(question)
+        except Exception as e:
+            ok, error = False, type(e).__name__
+        finished = time.monotonic()
+        with self.lock:
+            self.inflight -= 1
+            self.records.append({"stage": stage, "scheduled": scheduled, "finished": finished,
+                                 "latency_ms": (finished - scheduled) * 1000, "ok": ok, "error": error})
+
+    def run_stage(self, stage: int, rate: float, seconds: float, seed: int = 0) -> None:
+        rng = random.Random(seed + stage)
+        start = time.monotonic()
+        next_at = start
+        while True:
+            # Пуассоновский поток: интервалы между запросами экспоненциальные
+            next_at += rng.expovariate(rate)
+            if next_at - start > seconds:
+                break
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            question = rng.choices(self.questions, weights=self.weights)[0]
+            with self.lock:
+                if self.inflight >= self.max_inflight:
+                    self.records.append({"stage": stage, "scheduled": next_at, "finished": next_at,
+                                         "latency_ms": 0.0, "ok": False, "error": "dropped"})
+                    continue
+                self.inflight += 1
+            self.pool.submit(self._fire, stage, question, next_at)
+
+    def drain(self) -> None:
+        self.pool.shutdown(wait=True)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def report(run: OpenLoopRun, rates: List[float], stage_windows: List[tuple], sampler: Optional[ProcSampler]) -> None:
+    print("\n" + "=" * 96)
+    print(f"{'rps (план)':>10}{'rps (факт)':>12}{'p50, мс':>10}{'p90, мс':>10}{'p99, мс':>10}"
+          f"{'ошибки':>9}{'отброшено':>11}{'CPU, %':>9}{'RSS, МБ':>10}")
+    print("-" * 96)
+    for stage, (rate, (t0, t1)) in enumerate(zip(rates, stage_windows)):
+        rows = [r for r in run.records if r["stage"] == stage]
+        done = [r for r in rows if r["ok"]]
+        errors = sum(1 for r in rows if not r["ok"] and r["error"] != "dropped")
+        dropped = sum(1 for r in rows if r["error"] == "dropped")
+        latencies = [r["latency_ms"] for r in done]
+        # Пропускная способность - успешные ответы за время стадии (включая хвост дослушивания)
+        span = max(max((r["finished"] for r in done), default=t1), t1) - t0
+        cpu = [s["cpu_pct"] for s in sampler.samples if t0 <= s["t"] <= t1] if sampler else []
+        rss = [s["rss_mb"] for s in sampler.samples if t0 <= s["t"] <= t1] if sampler else []
+        print(f"{rate:>10.1f}{len(done) / span:>12.2f}{_percentile(latencies, 50):>10.0f}{_percentile(latencies, 90):>10.0f}"
+              f"{_percentile(latencies, 99):>10.0f}{errors / max(len(rows), 1):>9.1%}{dropped:>11}"
+              f"{(np.mean(cpu) if cpu else 0):>9.0f}{(max(rss) if rss else 0):>10.0f}")
+    print("=" * 96)
+
+
+def save_timeline(sampler: ProcSampler, run: OpenLoopRun, path: str = RESULTS_CSV) -> None:
+    """Ежесекундная лента: выполнено, ошибок, CPU%, RSS - для графиков планирования мощности."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["t_s", "completed", "errors", "cpu_pct", "rss_mb"])
+        t_start = sampler.samples[0]["t"] - SAMPLE_INTERVAL if sampler.samples else 0.0
+        prev_t = t_start
+        for s in sampler.samples:
+            window = [r for r in run.records if prev_t < r["finished"] <= s["t"]]
+            writer.writerow([round(s["t"] - t_start, 1), sum(r["ok"] for r in window),
+                             sum(not r["ok"] for r in window), round(s["cpu_pct"], 1), round(s["rss_mb"], 1)])
+            prev_t = s["t"]
+    print(f"💾 Лента CPU/RSS/ответов по секундам: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Открытая нагрузка на поиск с фейковым OpenRouter")
+    parser.add_argument("--target", default="inproc", help="'inproc' или адрес сервиса, например http://127.0.0.1:8000")
+    parser.add_argument("--rates", default="1,2,4,8", help="Частоты запросов (в секунду) по стадиям")
+    parser.add_argument("--stage-seconds", type=float, default=30.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200.0)
+    parser.add_argument("--server-pid", type=int, default=None, help="PID сервиса для замера CPU/RSS (для HTTP-цели)")
+    parser.add_argument("--fake-llm-only", action="store_true", help="Только поднять фейковый OpenRouter и ждать")
+    args = parser.parse_args()
+
+    questions = load_questions()
+    fake_llm = start_fake_openrouter(questions, args.llm_latency_ms, args.llm_jitter_ms)
+    if args.fake_llm_only:
+        print("Ctrl+C для выхода")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            fake_llm.shutdown()
+        return
+
+    if args.target == "inproc":
+        target = make_inproc_target()
+        pid = os.getpid()
+    else:
+        target = make_http_target(args.target)
+        pid = args.server_pid
+
+    sampler = ProcSampler(pid) if pid else None
+    if sampler:
+        sampler.start()
+
+    rates = [float(r) for r in args.rates.split(",")]
+    run = OpenLoopRun(target, questions)
+    windows = []
+    for stage, rate in enumerate(rates):
+        print(f"🚀 Стадия {stage + 1}/{len(rates)}: {rate} запросов/с в течение {args.stage_seconds:.0f} с")
+        t0 = time.monotonic()
+        run.run_stage(stage, rate, args.stage_seconds)
+        windows.append((t0, time.monotonic()))
+    print("⏳ Дожидаюсь ответов на отправленные запросы...")
+    run.drain()
+
+    if sampler:
+        sampler.stopped.set()
+        sampler.join()
+    report(run, rates, windows, sampler)
+    if sampler:
+        save_timeline(sampler, run)
+    fake_llm.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+'''
+Нормализация метаданных и вторичный индекс "значение -> id документов".
+Значения source_type / form / level / program_code приводятся к одному написанию
+при загрузке в базу и в фильтрах запросов, а индекс позволяет заранее узнать,
+сколько документов проходит фильтр.
+'''
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# --- СЛОВАРИ КАНОНИЧЕСКИХ ЗНАЧЕНИЙ ---
+# Все написания source_type, которые встречаются в скриптах и JSON-ах
+SOURCE_TYPE_ALIASES = {
+    "таблица": "Таблица",
+    "table": "Таблица",
+    "подкаст": "Подкаст",
+    "podcast": "Подкаст",
+    "сайт": "Сайт",
+    "web": "Сайт",
+    "html": "Сайт",
+    "pdf": "PDF",
+}
+
+FORM_ALIASES = {
+    "очная": "очная",
+    "заочная": "заочная",
+    "очно-заочная": "очно-заочная",
+    "очно заочная": "очно-заочная",
+    "очнозаочная": "очно-заочная",
+}
+
+LEVEL_ALIASES = {
+    "бакалавриат": "Бакалавриат",
+    "бакалавр": "Бакалавриат",
+    "специалитет": "Специалитет",
+    "специалист": "Специалитет",
+    "магистратура": "Магистратура",
+    "магистр": "Магистратура",
+    "магистратура/другое": "Магистратура",
+    "аспирантура": "Аспирантура",
+    "аспирант": "Аспирантура",
+}
+
+# Поля, по которым строим вторичный индекс
+INDEXED_FIELDS = ("source_type", "form", "level", "program_code")
+
+_CODE_PARTS_RE = re.compile(r"\d+")
+
+
+def normalize_source_type(value: Any) -> str:
+    """Приводит 'podcast' / 'Подкаст' / 'таблица' и т.п. к каноническому значению."""
+    text = str(value).strip()
+    return SOURCE_TYPE_ALIASES.get(text.lower(), text)
+
+
+def normalize_form(value: Any) -> str:
+    """'Очная' -> 'очная', 'очно заочная' -> 'очно-заочная'."""
+    text = re.sub(r"\s+", " ", str(value).strip().lower())
+    return FORM_ALIASES.get(text, text)
+
+
+def normalize_level(value: Any) -> str:
+    """'магистр' / 'МАГИСТРАТУРА' -> 'Магистратура'."""
+    text = str(value).strip()
+    return LEVEL_ALIASES.get(text.lower(), text)
+
+
+def normalize_program_code(value: Any) -> str:
+    """'9.3.1' / '09 03 01' / '09,03,01' -> '09.03.01'. Нецифровые значения ('global') не трогаем."""
+    text = str(value).strip()
+    parts = _CODE_PARTS_RE.findall(text)
+    if len(parts) < 3 or re.search(r"[^\d\s.,\-]", text):
+        return text
+    return ".".join(p.zfill(2) for p in parts)
+
+
+NORMALIZERS = {
+    "source_type": normalize_source_type,
+    "form": normalize_form,
+    "level": normalize_level,
+    "program_code": normalize_program_code,
+}
+
+
+def canonicalize_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Возвращает копию метаданных с каноническими значениями категориальных полей."""
+    result = dict(metadata)
+    for key, normalize in NORMALIZERS.items():
+        if key in result and result[key] is not None:
+            result[key] = normalize(result[key])
+    return result
+
+
+def canonicalize_filter(where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Нормализует значения в фильтре Chroma (то, что сгенерировала LLM), чтобы они совпали с базой."""
+    if not where:
+        return where
+
+    result = {}
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            result[key] = [canonicalize_filter(child) for child in value]
+        elif key in NORMALIZERS:
+            normalize = NORMALIZERS[key]
+            if isinstance(value, dict):
+                result[key] = {
+                    op: [normalize(v) for v in arg] if isinstance(arg, list) else normalize(arg)
+                    for op, arg in value.items()
+                }
+            else:
+                result[key] = normalize(value)
+        else:
+            result[key] = value
+    return result
+
+
+def _compare(actual: Any, op: str, expected: Any) -> bool:
+    if op == "$eq":
+        return actual == expected
+    if op == "$ne":
+        return actual != expected
+    if op == "$in":
+        return actual in expected
+    if op == "$nin":
+        return actual not in expected
+    if actual is None:
+        return False
+    try:
+        if op == "$gt":
+            return actual > expected
+        if op == "$gte":
+            return actual >= expected
+        if op == "$lt":
+            return actual < expected
+        if op == "$lte":
+            return actual <= expected
+    except TypeError:
+        return False
+    raise ValueError(f"Неподдерживаемый оператор фильтра: {op}")
+
+
+def matches_filter(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Проверяет метаданные одного документа на фильтр в формате where из Chroma."""
+    if not where:
+        return True
+
+    for key, value in where.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, child) for child in value):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, child) for child in value):
+                return False
+        elif isinstance(value, dict):
+            actual = metadata.get(key)
+            if not all(_compare(actual, op, arg) for op, arg in value.items()):
+                return False
+        elif metadata.get(key) != value:
+            return False
+    return True
+
+
+class MetadataIndex:
+    """Вторичный индекс: поле -> значение -> множество id документов (плюс метаданные каждого id)."""
+
+    def __init__(self, fields: Iterable[str] = INDEXED_FIELDS):
+        self.fields = tuple(fields)
+        self.postings: Dict[str, Dict[Any, Set[str]]] = {f: {} for f in self.fields}
+        self.metadatas: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.metadatas)
+
+    def add(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        for doc_id, meta in zip(ids, metadatas):
+            meta = meta or {}
+            self.metadatas[doc_id] = meta
+            for field in self.fields:
+                if field in meta:
+                    self.postings[field].setdefault(meta[field], set()).add(doc_id)
+
+    def clear(self) -> None:
+        self.postings = {f: {} for f in self.fields}
+        self.metadatas.clear()
+
+    def _lookup(self, field: str, condition: Any) -> Optional[Set[str]]:
+        """id по одному условию на индексированное поле (None - индекс тут не помогает)."""
+        values = self.postings[field]
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        result: Optional[Set[str]] = None
+        for op, arg in condition.items():
+            if op == "$eq":
+                ids = set(values.get(arg, ()))
+            elif op == "$in":
+                ids = set().union(*(values.get(v, set()) for v in arg))
+            else:
+                # $ne / $nin / сравнения проверяются построчно на уже суженном множестве
+                return None
+            result = ids if result is None else result & ids
+        return result
+
+    def _resolve(self, where: Dict[str, Any]) -> Optional[Set[str]]:
+        """Надмножество id, проходящих фильтр, или None, если индекс не может его сузить."""
+        narrowed: List[Set[str]] = []
+        for key, value in where.items():
+            if key == "$and":
+                parts = [self._resolve(child) for child in value]
+                narrowed.extend(p for p in parts if p is not None)
+            elif key == "$or":
+                parts = [self._resolve(child) for child in value]
+                if any(p is None for p in parts):
+                    continue
+                narrowed.append(set().union(*parts))
+            elif key in self.postings:
+                ids = self._lookup(key, value)
+                if ids is not None:
+                    narrowed.append(ids)
+
+        if not narrowed:
+            return None
+        return set.intersection(*narrowed)
+
+    def candidates(self, where: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+        """
+        Точный список id, проходящих фильтр, если индекс смог его сузить;
+        иначе None (значит, фильтр неселективен по индексированным полям).
+        """
+        if not where:
+            return None
+        superset = self._resolve(where)
+        if superset is None:
+            return None
+        return [doc_id for doc_id in superset if matches_filter(self.metadatas[doc_id], where)]
@@ -0,0 +1,418 @@
+'''
+Векторное хранилище на NumPy для маленьких корпусов (сотни-тысячи векторов e5).
+Все эмбеддинги лежат одной непрерывной матрицей float32/float16, метаданные - по столбцам,
+поиск точный: одно умножение матрицы на вектор + argpartition.
+pca_dim - хранить векторы в пониженной размерности: проекция на главные компоненты корпуса подбирается
+заново на каждой записи по всем векторам, записанным в этом процессе (сборка базы - всегда по всему корпусу,
+сколькими бы пачками он ни писался), сохраняется рядом с матрицей и применяется к запросам.
+Дописывание в уже сжатый шард, загруженный с диска, использует старую проекцию (исходных векторов нет) -
+об этом печатается предупреждение, шард стоит пересобрать. Замер recall@k / размера / задержки - bench_compression.py.
+enable_binary_search - двухэтапный поиск: знаковые биты всех векторов (1 бит на измерение) просматриваются
+по расстоянию Хэмминга, короткий список пересчитывается полными векторами (bench_binary.py).
+Интерфейс повторяет нужную нам часть Chroma, поэтому хранилище подставляется в шарды вместо нее.
+'''
+
+import json
+import os
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.json"
+PROJECTION_FILE = "projection.npy"
+# Для float16 считаем скоры блоками: BLAS не умеет fp16, переводим в float32 порциями
+FP16_BLOCK_ROWS = 4096
+# Двухэтапный поиск: короткий список по Хэммингу = k * BINARY_SHORTLIST_FACTOR строк, но не меньше BINARY_MIN_SHORTLIST
+BINARY_SHORTLIST_FACTOR = 10
+BINARY_MIN_SHORTLIST = 100
+# popcount: np.bitwise_count (NumPy >= 2.0) по 64-битным словам, иначе таблица на 256 значений байта
+_bitwise_count = getattr(np, "bitwise_count", None)
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def fit_projection(matrix: np.ndarray, dim: int) -> np.ndarray:
+    """
+    Матрица (исходная размерность x dim) из главных направлений корпуса (собственные векторы X^T X).
+    Без вычитания среднего: тогда (x W) . (q W) приближает исходный косинус x . q,
+    а не близость относительно центра корпуса.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    values, vectors = np.linalg.eigh(matrix.T @ matrix)
+    top = np.argsort(values)[::-1][:dim]
+    return np.ascontiguousarray(vectors[:, top], dtype=np.float32)
+
+
+def pack_signs(matrix: np.ndarray) -> np.ndarray:
+    """
+    Знаковые биты строк, упакованные по 8 в байт (1024 измерения -> 128 байт вместо 4 КБ float32).
+    Ширина дополнена нулями до кратной 8 байтам, чтобы коды читались как uint64.
+    """
+    matrix = np.atleast_2d(matrix)
+    width = (matrix.shape[1] + 63) // 64 * 8
+    codes = np.zeros((len(matrix), width), dtype=np.uint8)
+    # Блоками: для float16 / mmap не создаем булеву копию всей матрицы
+    for start in range(0, len(matrix), FP16_BLOCK_ROWS):
+        block = np.packbits(matrix[start:start + FP16_BLOCK_ROWS] > 0, axis=1)
+        codes[start:start + len(block), :block.shape[1]] = block
+    return codes
+
+
+def hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    """Расстояние Хэмминга от кода запроса до каждой строки: XOR по 64-битным словам + popcount."""
+    xor = np.ascontiguousarray(codes).view(np.uint64) ^ query_code.view(np.uint64)
+    if _bitwise_count is not None:
+        return _bitwise_count(xor).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT8[xor.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+
+def _build_column(values: List[Any]) -> np.ndarray:
+    """Числовые столбцы - float64 (NaN = нет значения), остальные - object."""
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+class NumpyVectorStore(VectorStore):
+    """Точный поиск по косинусу над одной матрицей эмбеддингов."""
+
+    def __init__(
+        self,
+        persist_directory: Optional[str] = None,
+        embedding_function: Optional[Embeddings] = None,
+        dtype: str = "float32",
+        pca_dim: Optional[int] = None,
+        **kwargs: Any,
+    ):
+        self._embedding_function = embedding_function
+        self.persist_directory = persist_directory
+        self.dtype = np.dtype(dtype)
+        self.pca_dim = pca_dim
+        # Проекция в пониженную размерность (None - векторы хранятся как есть)
+        self.projection: Optional[np.ndarray] = None
+        # Исходные (до проекции) нормированные векторы шарда, записанного в этом процессе: по ним проекция
+        # подбирается заново при каждой записи. None - проекции нет или шард с проекцией загружен с диска
+        self._unprojected: Optional[np.ndarray] = None
+        # Двухэтапный поиск (enable_binary_search): множитель короткого списка и упакованные знаковые биты
+        self.shortlist_factor: Optional[int] = None
+        self.codes: Optional[np.ndarray] = None
+
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        # id -> номер строки для get(ids=...): строится при первом обращении, сбрасывается при записи
+        self._positions: Optional[Dict[str, int]] = None
+        self.vectors = np.zeros((0, 0), dtype=self.dtype)
+        self.columns: Dict[str, np.ndarray] = {}
+
+        if persist_directory and os.path.exists(os.path.join(persist_directory, META_FILE)):
+            self._load()
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding_function
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # --- ХРАНЕНИЕ ---
+
+    def _load(self) -> None:
+        with open(os.path.join(self.persist_directory, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ids = meta["ids"]
+        self.texts = meta["texts"]
+        self._positions = None
+        self.columns = {key: _build_column(values) for key, values in meta["columns"].items()}
+        self.vectors = np.ascontiguousarray(np.load(os.path.join(self.persist_directory, VECTORS_FILE)), dtype=self.dtype)
+        projection_path = os.path.join(self.persist_directory, PROJECTION_FILE)
+        self.projection = np.load(projection_path) if os.path.exists(projection_path) else None
+
+    def persist(self) -> None:
+        if not self.persist_directory:
+            return
+        os.makedirs(self.persist_directory, exist_ok=True)
+        np.save(os.path.join(self.persist_directory, VECTORS_FILE), self.vectors)
+        projection_path = os.path.join(self.persist_directory, PROJECTION_FILE)
+        if self.projection is not None:
+            np.save(projection_path, self.projection)
+        elif os.path.exists(projection_path):
+            os.remove(projection_path)
+        meta = {
+            "ids": self.ids,
+            "texts": self.texts,
+            "columns": {key: [self._cell(col, i) for i in range(len(col))] for key, col in self.columns.items()},
+        }
+        with open(os.path.join(self.persist_directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    @staticmethod
+    def _cell(column: np.ndarray, i: int) -> Any:
+        """Значение столбца в виде обычного Python-объекта (NaN -> None, целые float -> int)."""
+        value = column[i]
+        if column.dtype == np.float64:
+            if np.isnan(value):
+                return None
+            return int(value) if float(value).is_integer() else float(value)
+        return value
+
+    def _metadata(self, i: int) -> Dict[str, Any]:
+        meta = {}
+        for key, column in self.columns.items():
+            value = self._cell(column, i)
+            if value is not None:
+                meta[key] = value
+        return meta
+
+    def reset_collection(self) -> None:
+        self.ids, self.texts, self.columns = [], [], {}
+        self._positions = None
+        self.vectors = np.zeros((0, 0), dtype=self.dtype)
+        # Следующая загрузка подберет проекцию заново - под новый корпус
+        self.projection = None
+        self._unprojected = None
+        self.codes = None
+        self.persist()
+
+    # --- ЗАПИСЬ ---
+
+    def add_embeddings(
+        self,
+        texts: Sequence[str],
+        embeddings: Any,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """Добавляет готовые эмбеддинги (без вызова модели). Матрица пересобирается одним блоком."""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+
+        block = _l2_normalize(np.asarray(embeddings, dtype=np.float32))
+        if self.pca_dim and (self.projection is None or self._unprojected is not None):
+            # Проекция по всему корпусу: без проекции записанные векторы и есть исходные
+            if len(self.ids) == 0:
+                full = block
+            else:
+                full = np.vstack([self._unprojected if self.projection is not None else self.vectors.astype(np.float32), block])
+            if self.pca_dim < min(full.shape):
+                self.projection = fit_projection(full, self.pca_dim)
+                self._unprojected = full
+                full = full @ self.projection
+            self.vectors = np.ascontiguousarray(full.astype(self.dtype))
+        else:
+            if self.projection is not None:
+                print(f"⚠️ {self.persist_directory}: проекция PCA подобрана без {len(texts)} новых документов - пересоберите шард")
+                block = block @ self.projection
+            block = block.astype(self.dtype)
+            self.vectors = block if len(self.ids) == 0 else np.ascontiguousarray(np.vstack([self.vectors, block]))
+
+        # Столбцы метаданных: старые значения + новые (новые ключи добиваем None-ами)
+        old_rows = len(self.ids)
+        keys = set(self.columns) | {k for m in metadatas for k in m}
+        for key in keys:
+            old = [self._cell(self.columns[key], i) for i in range(old_rows)] if key in self.columns else [None] * old_rows
+            self.columns[key] = _build_column(old + [m.get(key) for m in metadatas])
+
+        self.ids.extend(ids)
+        self.texts.extend(texts)
+        self._positions = None
+        if self.shortlist_factor:
+            self.codes = pack_signs(self.vectors)
+        self.persist()
+        return ids
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        embeddings = self._embedding_function.embed_documents(texts)
+        return self.add_embeddings(texts, embeddings, metadatas=metadatas, ids=ids)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        persist_directory: Optional[str] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        store = cls(persist_directory=persist_directory, embedding_function=embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas)
+        return store
+
+    # --- ФИЛЬТРЫ ---
+
+    def _condition_mask(self, key: str, condition: Any) -> np.ndarray:
+        n = len(self.ids)
+        column = self.columns.get(key)
+        if column is None:
+            # Поля нет ни у одного документа: проходит только $ne/$nin
+            passes = isinstance(condition, dict) and set(condition) <= {"$ne", "$nin"}
+            return np.full(n, passes)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        mask = np.ones(n, dtype=bool)
+        numeric = column.dtype == np.float64
+        for op, arg in condition.items():
+            if op == "$eq":
+                mask &= column == arg
+            elif op == "$ne":
+                mask &= column != arg
+            elif op in ("$in", "$nin"):
+                # Сравниваем поэлементно: np.isin сортирует и падает на смеси str/None в object-столбце
+                found = np.zeros(n, dtype=bool)
+                for value in arg:
+                    found |= column == value
+                mask &= found if op == "$in" else ~found
+            elif op in ("$gt", "$gte", "$lt", "$lte") and numeric:
+                with np.errstate(invalid="ignore"):
+                    if op == "$gt":
+                        mask &= column > arg
+                    elif op == "$gte":
+                        mask &= column >= arg
+                    elif op == "$lt":
+                        mask &= column < arg
+                    else:
+                        mask &= column <= arg
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                mask[:] = False
+            else:
+                raise ValueError(f"Неподдерживаемый оператор фильтра: {op}")
+        return mask
+
+    def where_mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Векторизованная проверка фильтра в формате Chroma сразу по всем документам."""
+        mask = np.ones(len(self.ids), dtype=bool)
+        if not where:
+            return mask
+        for key, value in where.items():
+            if key == "$and":
+                for child in value:
+                    mask &= self.where_mask(child)
+            elif key == "$or":
+                any_mask = np.zeros(len(self.ids), dtype=bool)
+                for child in value:
+                    any_mask |= self.where_mask(child)
+                mask &= any_mask
+            else:
+                mask &= self._condition_mask(key, value)
+        return mask
+
+    # --- ПОИСК ---
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Косинусная близость запроса ко всем (или к выбранным) строкам матрицы (query - уже в пространстве матрицы)."""
+        matrix = self.vectors if rows is None else self.vectors[rows]
+        if matrix.dtype == np.float32:
+            return matrix @ query
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), FP16_BLOCK_ROWS):
+            block = matrix[start:start + FP16_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + FP16_BLOCK_ROWS] = block @ query
+        return scores
+
+    def project(self, embedding: Any) -> np.ndarray:
+        """Нормированный запрос в пространстве хранимых векторов (та же проекция, что и у корпуса)."""
+        query = _l2_normalize(np.asarray(embedding, dtype=np.float32))
+        return query if self.projection is None else query @ self.projection
+
+    def full_vectors(self, rows: Any = slice(None)) -> np.ndarray:
+        """Векторы в исходной размерности float32 (при PCA - восстановленные из проекции: скалярные произведения те же)."""
+        vectors = self.vectors[rows].astype(np.float32)
+        return vectors if self.projection is None else vectors @ self.projection.T
+
+    def enable_binary_search(self, shortlist_factor: int = BINARY_SHORTLIST_FACTOR) -> None:
+        """
+        Включает двухэтапный поиск: Хэмминг по знаковым битам -> k * shortlist_factor кандидатов ->
+        косинус по хранимым векторам только для них. Коды держатся в памяти (в 16-32 раза меньше матрицы).
+        """
+        self.shortlist_factor = shortlist_factor
+        self.codes = pack_signs(self.vectors) if self.ids else None
+
+    def _shortlist(self, query: np.ndarray, k: int, rows: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """Строки короткого списка по Хэммингу или rows как есть, если кандидатов и так немного."""
+        total = len(self.ids) if rows is None else len(rows)
+        size = max(k * self.shortlist_factor, BINARY_MIN_SHORTLIST)
+        if size >= total:
+            return rows
+        codes = self.codes if rows is None else self.codes[rows]
+        distances = hamming_distances(codes, pack_signs(query)[0])
+        picked = np.argpartition(distances, size - 1)[:size]
+        return picked if rows is None else rows[picked]
+
+    def search_by_vector(self, embedding: Any, k: int = 4, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[int, float]]:
+        """Top-k: [(номер строки, косинусная близость)], по убыванию близости. Точный, если не включен бинарный поиск."""
+        if not self.ids or k <= 0:
+            return []
+        query = self.project(embedding)
+
+        rows = None
+        if filter:
+            rows = np.flatnonzero(self.where_mask(filter))
+            if len(rows) == 0:
+                return []
+        if self.shortlist_factor:
+            rows = self._shortlist(query, k, rows)
+        scores = self._scores(query, rows)
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        positions = top if rows is None else rows[top]
+        return [(int(p), float(s)) for p, s in zip(positions, scores[top])]
+
+    def _document(self, i: int) -> Document:
+        return Document(page_content=self.texts[i], metadata=self._metadata(i), id=self.ids[i])
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        # Как и Chroma с hnsw:space=cosine, возвращаем косинусную ДИСТАНЦИЮ (1 - близость)
+        return [(self._document(i), 1.0 - score) for i, score in self.search_by_vector(embedding, k, filter)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return lambda distance: 1.0 - distance
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = self._embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        include: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        """Аналог Chroma.get(): по id или первые limit документов."""
+        include = include or ["documents", "metadatas"]
+        if ids is not None:
+            # MMR по шардам запрашивает векторы кандидатов на каждый запрос - словарь не пересобираем
+            if self._positions is None:
+                self._positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+            rows = [self._positions[doc_id] for doc_id in ids if doc_id in self._positions]
+        else:
+            rows = list(range(len(self.ids)))[:limit]
+
+        return {
+            "ids": [self.ids[i] for i in rows],
+            "documents": [self.texts[i] for i in rows] if "documents" in include else None,
+            "metadatas": [self._metadata(i) for i in rows] if "metadatas" in include else None,
+            "embeddings": self.full_vectors(rows) if "embeddings" in include else None,
+        }
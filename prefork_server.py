@@ -0,0 +1,312 @@
+'''
+Pre-fork сервер ретривера: модель e5 и индекс загружаются ОДИН раз в родительском процессе,
+затем os.fork() поднимает N воркеров. Воркеры делят страницы модели и индекса copy-on-write,
+поэтому память не растет пропорционально числу процессов.
+
+Воркеры слушают общий сокет (ядро само раздает соединения), родитель следит за ними:
+- здоровье: каждый воркер пишет heartbeat в общую память, зависший воркер убивается и перезапускается;
+- плавная переработка: воркер завершается после MAX_REQUESTS_PER_WORKER запросов (доделав текущий),
+  родитель сразу поднимает замену; SIGHUP - поочередный перезапуск всех воркеров;
+- SIGTERM / Ctrl+C - корректная остановка;
+- новая версия индекса (index_versions.py): родитель открывает ее сам и поочередно перезапускает воркеров,
+  новые воркеры получают ее при fork, старые дообслуживают запросы на прежней.
+
+API:
+    GET  /health                              -> {"status": "ok", "pid": ..., "requests": ..., "rss_mb": ..., "pss_mb": ...}
+    POST /search {"query": "...", "mode": "self_query" | "vector", "k": 6}
+
+Запуск из корня проекта (лучше со снимком индекса - он и так в mmap):
+    VECTOR_BACKEND=snapshot WORKERS=4 python prefork_server.py
+'''
+
+import gc
+import json
+import os
+import random
+import signal
+import socket
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from multiprocessing.sharedctypes import RawArray
+from typing import Any, Dict, List, Optional
+
+from index_versions import IndexWatcher
+from program_index import ProgramIndex
+from self_query_searcher import get_retriever
+
+# --- НАСТРОЙКИ ---
+HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+PORT = int(os.getenv("SERVER_PORT", "8000"))
+WORKERS = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))
+# Сколько запросов обслуживает воркер до перезапуска (+ случайный разброс, чтобы не рестартовали все разом)
+MAX_REQUESTS_PER_WORKER = int(os.getenv("MAX_REQUESTS_PER_WORKER", "1000"))
+MAX_REQUESTS_JITTER = 100
+# Воркер без heartbeat дольше этого (сек) считается зависшим. Запрос с LLM может идти десятки секунд
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", "120"))
+# Сколько ждать воркеров при остановке, прежде чем убить
+GRACEFUL_TIMEOUT = 30.0
+# Потоков torch на воркер: ядра делим между процессами, иначе они дерутся за CPU
+TORCH_THREADS = max(1, (os.cpu_count() or 1) // max(WORKERS, 1))
+LISTEN_BACKLOG = 1024
+DEFAULT_K = 6
+
+
+def _memory_mb() -> Dict[str, Optional[float]]:
+    """RSS и PSS процесса из /proc (PSS честно делит общие COW-страницы между воркерами)."""
+    result: Dict[str, Optional[float]] = {"rss_mb": None, "pss_mb": None}
+    for path, key, field in (("/proc/self/status", "rss_mb", "VmRSS:"), ("/proc/self/smaps_rollup", "pss_mb", "Pss:")):
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    if line.startswith(field):
+                        result[key] = round(int(line.split()[1]) / 1024, 1)
+                        break
+        except OSError:
+            pass
+    return result
+
+
+def _serialize(docs: List[Any]) -> List[Dict[str, Any]]:
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+
+# --- ВОРКЕР ---
+
+class RetrieverHandler(BaseHTTPRequestHandler):
+    # Не даем медленному клиенту держать воркер бесконечно
+    timeout = 30
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        self._send_json(200, {"status": "ok", "pid": os.getpid(), "requests": self.server.served, **_memory_mb()})
+
+    def do_POST(self) -> None:
+        if self.path != "/search":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            query = payload["query"]
+        except (ValueError, KeyError):
+            self._send_json(400, {"error": "ожидается JSON с полем query"})
+            return
+
+        start = time.perf_counter()
+        try:
+            retriever = self.server.retriever
+            if payload.get("mode") == "vector":
+                # Без LLM: только эмбеддинг запроса + поиск по шардам
+                docs = retriever.vectorstore.similarity_search(query, k=int(payload.get("k", DEFAULT_K)))
+            else:
+                docs = retriever.invoke(query)
+            docs = self.server.program_index.attach_linked(docs, query)
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, {
+            "docs": _serialize(docs),
+            "pid": os.getpid(),
+            "took_ms": round((time.perf_counter() - start) * 1000, 1),
+        })
+
+
+class WorkerServer(HTTPServer):
+    """HTTP-сервер воркера поверх уже открытого (унаследованного от родителя) сокета."""
+
+    def __init__(self, sock: socket.socket, retriever: Any, program_index: ProgramIndex):
+        super().__init__(sock.getsockname()[:2], RetrieverHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.retriever = retriever
+        self.program_index = program_index
+        self.served = 0
+        # handle_request() возвращается раз в секунду, даже без запросов - успеваем писать heartbeat
+        self.timeout = 1.0
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        self.served += 1
+        super().process_request(request, client_address)
+
+
+def _worker_main(slot: int, sock: socket.socket, retriever: Any, program_index: ProgramIndex, heartbeats: Any) -> None:
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    # Ctrl+C приходит всей группе процессов - остановкой управляет родитель
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _stop)
+
+    try:
+        import torch
+        torch.set_num_threads(TORCH_THREADS)
+    except ImportError:
+        pass
+
+    server = WorkerServer(sock, retriever, program_index)
+    limit = MAX_REQUESTS_PER_WORKER + random.randint(0, MAX_REQUESTS_JITTER)
+    print(f"👷 Воркер #{slot} (pid {os.getpid()}) готов, лимит запросов: {limit}")
+
+    while not stopping and server.served < limit:
+        heartbeats[slot] = time.time()
+        server.handle_request()
+
+
+# --- РОДИТЕЛЬ ---
+
+class PreforkMaster:
+    def __init__(self, retriever: Any, program_index: ProgramIndex, sock: socket.socket, workers: int):
+        self.retriever = retriever
+        self.program_index = program_index
+        self.sock = sock
+        self.workers = workers
+        self.heartbeats = RawArray("d", workers)
+        self.children: Dict[int, int] = {}  # pid -> slot
+        self.stopping = False
+        self.recycle_queue: List[int] = []
+        # Открываем новую версию прямо в цикле родителя: фоновый поток при fork опасен, а запросов родитель не ведет
+        self.watcher = IndexWatcher(retriever.vectorstore.backend, self._open_version, background=False)
+
+    def spawn(self, slot: int) -> None:
+        self.heartbeats[slot] = time.time()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _worker_main(slot, self.sock, self.retriever, self.program_index, self.heartbeats)
+            except BaseException as e:
+                print(f"❌ Воркер #{slot} упал: {e}")
+                code = 1
+            finally:
+                # os._exit: не выполняем atexit-хуки и финализаторы родителя в дочернем процессе
+                os._exit(code)
+        self.children[pid] = slot
+
+    def _on_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def _on_hup(self, signum, frame) -> None:
+        print("🔄 SIGHUP: поочередный перезапуск воркеров")
+        self.recycle_queue = list(self.children)
+
+    def _reap(self) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            slot = self.children.pop(pid, None)
+            if slot is None:
+                continue
+            if not self.stopping:
+                reason = "переработан" if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0 else f"упал (status {status})"
+                print(f"♻️ Воркер #{slot} (pid {pid}) {reason}, запускаю замену")
+                self.spawn(slot)
+
+    def _check_health(self) -> None:
+        now = time.time()
+        for pid, slot in list(self.children.items()):
+            if now - self.heartbeats[slot] > HEALTH_TIMEOUT:
+                print(f"💀 Воркер #{slot} (pid {pid}) не отвечает {now - self.heartbeats[slot]:.0f} с, убиваю")
+                self.heartbeats[slot] = now
+                os.kill(pid, signal.SIGKILL)
+
+    def _open_version(self, path: str):
+        store = self.retriever.vectorstore.reopen(path)
+        return store, ProgramIndex.from_store(store)
+
+    def _check_index_version(self) -> None:
+        opened = self.watcher.poll()
+        if opened is None:
+            return
+        old = self.retriever.vectorstore
+        self.retriever.vectorstore, self.program_index = opened
+        # Старая версия заморожена вместе со всем остальным (gc.freeze в run): без unfreeze ее циклы
+        # не собрать никогда. Освобождаем ее и замораживаем заново - в вечном поколении только текущая версия
+        old.close()
+        del old
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+        print("🔄 Новая версия индекса: поочередный перезапуск воркеров")
+        self.recycle_queue = list(self.children)
+
+    def _recycle_next(self) -> None:
+        """Перезапуск по одному: следующий воркер гасится, только когда все слоты снова заняты."""
+        if not self.recycle_queue or len(self.children) < self.workers:
+            return
+        pid = self.recycle_queue.pop(0)
+        if pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+
+    def _shutdown(self) -> None:
+        print("🛑 Останавливаю воркеров...")
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.time() + GRACEFUL_TIMEOUT
+        while self.children and time.time() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in self.children:
+            os.kill(pid, signal.SIGKILL)
+        self.sock.close()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_hup)
+
+        # Переносим все уже созданные объекты в "вечное" поколение: сборщик мусора в воркерах
+        # не будет их обходить и писать в их заголовки, значит, страницы останутся общими
+        gc.collect()
+        gc.freeze()
+
+        for slot in range(self.workers):
+            self.spawn(slot)
+        print(f"🚀 Сервер слушает http://{HOST}:{PORT}, воркеров: {self.workers} (pid родителя {os.getpid()})")
+
+        while not self.stopping:
+            self._reap()
+            self._check_health()
+            self._check_index_version()
+            self._recycle_next()
+            time.sleep(0.5)
+        self._shutdown()
+
+
+def main():
+    # 1. Тяжелая загрузка - один раз, до fork
+    start = time.perf_counter()
+    retriever = get_retriever()
+    program_index = ProgramIndex.from_store(retriever.vectorstore)
+    print(f"⏱️ Модель и индекс загружены за {time.perf_counter() - start:.1f} с, {_memory_mb()}")
+    # Прогрев в родителе не делаем: OpenMP-пул torch, созданный до fork, может повиснуть в воркерах
+
+    # 2. Общий слушающий сокет. Неблокирующий: если соединение забрал соседний воркер, accept просто вернется
+    sock = socket.create_server((HOST, PORT), backlog=LISTEN_BACKLOG)
+    sock.setblocking(False)
+
+    PreforkMaster(retriever, program_index, sock, WORKERS).run()
+
+
+if __name__ == "__main__":
+    main()
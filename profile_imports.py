@@ -0,0 +1,93 @@
+'''
+Профиль времени импорта (python -X importtime) для точек входа.
+Каждый модуль импортируется в отдельном чистом процессе, отчет пишется в Data/profiling/importtime.md:
+общее время и самые дорогие пакеты по накопленному времени.
+Если хоть один модуль не импортировался (нет зависимостей), отчет не записывается.
+
+Запуск из корня проекта:
+    python profile_imports.py                                  # модули по умолчанию
+    python profile_imports.py self_query_searcher sharded_store
+'''
+
+import datetime
+import os
+import platform
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+REPORT_PATH = "Data/profiling/importtime.md"
+DEFAULT_MODULES = ["rag_client", "self_query_searcher", "retriever_daemon", "sharded_store"]
+TOP_N = 15
+
+# "import time:       123 |       4567 |   package.name"
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_module(module: str) -> Tuple[float, List[Tuple[str, int, int]], str]:
+    """(суммарные мс, [(пакет, self мкс, cumulative мкс)], ошибка) для одного чистого импорта."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    rows, total_us = [], 0
+    for line in proc.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = int(match[1]), int(match[2]), match[3], match[4]
+        rows.append((name, self_us, cumulative_us))
+        # Пакеты верхнего уровня (минимальный отступ) в сумме дают полное время импорта
+        if len(indent) <= 1:
+            total_us += cumulative_us
+    error = ""
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"код выхода {proc.returncode}"
+    return total_us / 1000, rows, error
+
+
+def render(results: Dict[str, Tuple[float, List[Tuple[str, int, int]], str]]) -> str:
+    lines = [
+        "# Время импорта точек входа",
+        "",
+        f"Снято `python profile_imports.py` {datetime.date.today().isoformat()}, "
+        f"Python {platform.python_version()}, {platform.system()} {platform.machine()}.",
+        "",
+        "| Модуль | Время импорта, мс | Статус |",
+        "|---|---:|---|",
+    ]
+    for module, (total_ms, _, error) in results.items():
+        lines.append(f"| `{module}` | {total_ms:.1f} | {'❌ ' + error if error else 'ок'} |")
+
+    for module, (total_ms, rows, error) in results.items():
+        lines += ["", f"## {module}", ""]
+        if error:
+            lines += [f"Импорт не завершился: `{error}` (время до ошибки: {total_ms:.1f} мс).", ""]
+        lines += ["| Пакет | self, мс | cumulative, мс |", "|---|---:|---:|"]
+        for name, self_us, cumulative_us in sorted(rows, key=lambda r: -r[2])[:TOP_N]:
+            lines.append(f"| `{name}` | {self_us / 1000:.1f} | {cumulative_us / 1000:.1f} |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    modules = sys.argv[1:] or DEFAULT_MODULES
+    results = {}
+    for module in modules:
+        results[module] = profile_module(module)
+        total_ms, _, error = results[module]
+        print(f"⏱️ {module}: {total_ms:.1f} мс" + (f" (❌ {error})" if error else ""))
+
+    failed = [module for module, (_, _, error) in results.items() if error]
+    if failed:
+        # Отчет без дорогих точек входа вводит в заблуждение - снимайте его в окружении со всеми зависимостями
+        print(f"❌ Отчет не записан: импорт не завершился у {', '.join(failed)}")
+        sys.exit(1)
+    os.makedirs(os.path.dirname(REPORT_PATH), exist_ok=True)
+    with open(REPORT_PATH, "w", encoding="utf-8") as f:
+        f.write(render(results))
+    print(f"💾 Отчет: {REPORT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
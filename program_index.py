@@ -0,0 +1,118 @@
+'''
+Индекс "program_code -> связанные документы": строка таблицы и обзорные (summary) сегменты подкастов.
+Когда поиск нашел хоть один документ программы (или код прямо назван в вопросе),
+остальные документы этой программы подтягиваются словарем за O(1), без второго векторного поиска.
+
+Коды бывают двух уровней: направление 15.03.01 и профиль 15.03.01.01 - они считаются связанными
+(для направления подтягиваются профили, для профиля - его направление).
+'''
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set
+from langchain_core.documents import Document
+from metadata_index import normalize_program_code
+
+# Какие документы считаются "якорями" программы
+TABLE_SOURCE = "Таблица"
+PODCAST_SOURCE = "Подкаст"
+ANCHOR_SEGMENT = "summary"
+# Сколько связанных документов максимум добавлять на один код (защита контекста LLM)
+MAX_LINKED_PER_CODE = 4
+
+# 09.03.01 / 09.03.01.03 в тексте вопроса
+_CODE_IN_TEXT_RE = re.compile(r"\b\d{2}\.\d{2}\.\d{2}(?:\.\d{2})?\b")
+
+
+def parent_code(code: str) -> Optional[str]:
+    """'15.03.01.01' -> '15.03.01'; у направления (3 части) родителя нет."""
+    parts = code.split(".")
+    return ".".join(parts[:3]) if len(parts) > 3 else None
+
+
+def codes_in_text(text: str) -> List[str]:
+    return [normalize_program_code(code) for code in _CODE_IN_TEXT_RE.findall(text)]
+
+
+def _doc_key(doc: Document) -> Any:
+    """Ключ дедупликации: id документа, а если его нет - текст."""
+    return getattr(doc, "id", None) or doc.page_content
+
+
+class ProgramIndex:
+    """program_code -> таблица / обзоры подкастов, плюс связи направление <-> профили."""
+
+    def __init__(self):
+        self.tables: Dict[str, List[Document]] = {}
+        self.anchors: Dict[str, List[Document]] = {}
+        self.children: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(set(self.tables) | set(self.anchors))
+
+    def add(self, documents: Iterable[Document]) -> None:
+        for doc in documents:
+            code = doc.metadata.get("program_code")
+            if not code or code == "global":
+                continue
+            code = normalize_program_code(code)
+            source = doc.metadata.get("source_type")
+            if source == TABLE_SOURCE:
+                self.tables.setdefault(code, []).append(doc)
+            elif source == PODCAST_SOURCE and doc.metadata.get("segment_type") == ANCHOR_SEGMENT:
+                self.anchors.setdefault(code, []).append(doc)
+            else:
+                continue
+            parent = parent_code(code)
+            if parent:
+                self.children.setdefault(parent, set()).add(code)
+
+    @classmethod
+    def from_store(cls, vectorstore: Any) -> "ProgramIndex":
+        """Строит индекс одной выгрузкой документов из хранилища (ShardedVectorStore или Chroma)."""
+        data = vectorstore.get(include=["documents", "metadatas"])
+        index = cls()
+        index.add(
+            Document(page_content=text, metadata=meta or {}, id=doc_id)
+            for doc_id, text, meta in zip(data["ids"], data["documents"], data["metadatas"])
+        )
+        print(f"🔗 Индекс программ: {len(index)} кодов, таблиц {sum(map(len, index.tables.values()))}, "
+              f"обзоров подкастов {sum(map(len, index.anchors.values()))}")
+        return index
+
+    def related_codes(self, code: str) -> List[str]:
+        """Сам код, его направление (для профиля) и профили (для направления)."""
+        code = normalize_program_code(code)
+        related = [code]
+        parent = parent_code(code)
+        if parent:
+            related.append(parent)
+        related.extend(sorted(self.children.get(code, ())))
+        return related
+
+    def linked(self, code: str) -> List[Document]:
+        """Связанные документы программы: сначала строки таблицы, потом обзоры подкастов."""
+        codes = self.related_codes(code)
+        docs = [doc for c in codes for doc in self.tables.get(c, ())]
+        docs += [doc for c in codes for doc in self.anchors.get(c, ())]
+        return docs[:MAX_LINKED_PER_CODE]
+
+    def attach_linked(self, docs: List[Document], query: str = "") -> List[Document]:
+        """
+        Дополняет найденные документы связанными по program_code (из хитов и из текста вопроса).
+        Порядок исходной выдачи сохраняется, связанные документы идут в конце без дублей.
+        """
+        codes: List[str] = codes_in_text(query)
+        for doc in docs:
+            code = doc.metadata.get("program_code")
+            if code and code != "global":
+                codes.append(normalize_program_code(code))
+
+        seen = {_doc_key(doc) for doc in docs}
+        result = list(docs)
+        for code in dict.fromkeys(codes):
+            for doc in self.linked(code):
+                key = _doc_key(doc)
+                if key not in seen:
+                    seen.add(key)
+                    result.append(doc)
+        return result
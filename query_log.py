@@ -0,0 +1,150 @@
+'''
+Журнал запросов: каждый вопрос, построенный LLM фильтр, найденные документы (id + оценка)
+и время по стадиям. Нужен, чтобы потом воспроизвести медленный или плохой ответ (replay_queries.py).
+
+- Только дописывание: gzip JSONL, каждая пачка записей - отдельный gzip member в конце файла
+  (gzip.open читает такие файлы целиком, а при падении процесса теряется максимум последняя пачка).
+- Ротация: новый сегмент при превышении SEGMENT_MAX_BYTES и при каждом запуске процесса.
+- Запись в фоновом потоке пачками: record() только кладет словарь в очередь и никогда не ждет диск.
+  Если очередь переполнена (диск завис), запись отбрасывается и учитывается в dropped.
+  Ошибка записи пачки (диск полон, нет прав) не останавливает поток: пачка учитывается в failed,
+  текст ошибки - в last_error, следующая пачка пишется в новый сегмент (в старом может остаться обрывок).
+
+Пример:
+    log = QueryLog()
+    log.record({"query": "...", "timings_ms": {...}})
+    for entry in read_log("Data/query_log"): ...
+'''
+
+import atexit
+import datetime
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional
+
+# --- НАСТРОЙКИ ---
+QUERY_LOG_DIR = os.getenv("QUERY_LOG_DIR", "Data/query_log")
+# Размер сегмента (сжатый), после которого начинается новый файл
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+# Пачка пишется, когда набралось столько записей или прошло столько секунд
+BATCH_SIZE = 64
+FLUSH_INTERVAL = 2.0
+# Сколько записей может ждать в очереди; сверх этого - отбрасываем, а не тормозим ответ
+QUEUE_SIZE = 10000
+SEGMENT_PATTERN = "queries-*.jsonl.gz"
+
+_STOP = object()
+
+
+class QueryLog:
+    def __init__(
+        self,
+        directory: str = QUERY_LOG_DIR,
+        segment_max_bytes: int = SEGMENT_MAX_BYTES,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+        self._segment_no = 0
+        self.path = self._new_segment()
+        self._queue: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._writer, name="query-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _new_segment(self) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        self._segment_no += 1
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.directory, f"queries-{stamp}-{os.getpid()}-{self._segment_no:03d}.jsonl.gz")
+
+    # --- ГОРЯЧИЙ ПУТЬ ---
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        """Ставит запись в очередь (без ожидания). Время записи добавляется здесь, а не в фоновом потоке."""
+        entry.setdefault("ts", time.time())
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    # --- ФОНОВЫЙ ПОТОК ---
+
+    def _writer(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: List[Dict[str, Any]] = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    self.failed += len(batch)
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    print(f"⚠️ Журнал запросов: не записано {len(batch)} записей ({self.last_error})")
+                    self.path = self._next_segment_after_error()
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        payload = "".join(json.dumps(entry, ensure_ascii=False, default=str) + "\n" for entry in batch)
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.segment_max_bytes:
+            self.path = self._new_segment()
+        # Одна пачка = один полный gzip member: файл всегда читается, даже если процесс упадет после записи
+        with open(self.path, "ab") as f:
+            f.write(gzip.compress(payload.encode("utf-8")))
+        self.written += len(batch)
+
+    def _next_segment_after_error(self) -> str:
+        try:
+            return self._new_segment()
+        except OSError:
+            return self.path  # каталог недоступен - попробуем тот же файл со следующей пачкой
+
+    def close(self) -> None:
+        """Дописывает все, что осталось в очереди (вызывается и автоматически при выходе)."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+
+def segment_paths(path: str) -> List[str]:
+    """Файл сегмента, каталог журнала или glob -> список сегментов по времени создания."""
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, SEGMENT_PATTERN)))
+    return sorted(glob.glob(path)) or [path]
+
+
+def read_log(path: str = QUERY_LOG_DIR, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Записи журнала по порядку; оборванный хвост сегмента (процесс упал посреди записи) пропускается."""
+    count = 0
+    for segment in segment_paths(path):
+        with gzip.open(segment, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    yield json.loads(line)
+                    count += 1
+                    if limit is not None and count >= limit:
+                        return
+            except (EOFError, zlib.error, json.JSONDecodeError):
+                print(f"⚠️ Сегмент {segment} оборван, читаем до места обрыва")
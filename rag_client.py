@@ -0,0 +1,76 @@
+'''
+Тонкий клиент теплого демона (retriever_daemon.py). Импортирует только стандартную библиотеку,
+поэтому запрос из терминала или скрипта занимает миллисекунды плюс время самого поиска.
+
+    python rag_client.py "Сколько стоит обучение на Программиста?"
+    python rag_client.py --vector -k 3 "Где разрабатывают роботов?"
+    python rag_client.py --fast "..."     # поиск параллельно с LLM (спекулятивный режим)
+    python rag_client.py --json "..."     # сырой ответ демона
+    python rag_client.py --ping
+'''
+
+import json
+import os
+import socket
+import sys
+
+SOCKET_PATH = os.getenv("RAG_SOCKET", "/tmp/stankin_rag.sock")
+TIMEOUT = 120.0
+USAGE = "Использование: python rag_client.py [--vector | --fast] [-k N] [--json] \"вопрос\" | --ping"
+
+
+def request(payload: dict, path: str = SOCKET_PATH) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(TIMEOUT)
+        sock.connect(path)
+        sock.sendall(json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as stream:
+            return json.loads(stream.readline())
+
+
+def main(argv: list) -> int:
+    payload = {"mode": "self_query"}
+    raw = False
+    words = []
+    args = iter(argv)
+    for arg in args:
+        if arg == "--ping":
+            payload = {"op": "ping"}
+        elif arg == "--vector":
+            payload["mode"] = "vector"
+        elif arg == "--fast":
+            payload["mode"] = "speculative"
+        elif arg == "-k":
+            payload["k"] = int(next(args))
+        elif arg == "--json":
+            raw = True
+        else:
+            words.append(arg)
+    if payload.get("op") != "ping":
+        if not words:
+            print(USAGE)
+            return 2
+        payload["query"] = " ".join(words)
+
+    try:
+        response = request(payload)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"❌ Демон не запущен ({SOCKET_PATH}). Запустите: python retriever_daemon.py")
+        return 1
+
+    if raw or "docs" not in response:
+        print(json.dumps(response, ensure_ascii=False, indent=2))
+        return 1 if "error" in response else 0
+
+    print(f"🔎 Найдено документов: {len(response['docs'])} за {response['took_ms']} мс")
+    if response.get("degraded"):
+        print("⚠️ LLM не успела построить фильтр: результаты без фильтра")
+    for i, doc in enumerate(response["docs"]):
+        meta = doc["metadata"]
+        print(f"\n📄 #{i + 1} [{meta.get('source_type', '?')}] Код: {meta.get('program_code')}")
+        print(doc["page_content"][:500].replace("\n", " ") + "...")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
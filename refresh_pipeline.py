@@ -0,0 +1,342 @@
+'''
+Полное обновление базы одной командой: граф стадий с контрольными точками.
+
+    crawl ──────┐
+    pdf ────────┼──> index        transcribe (независимо)
+    tables ─────┘
+
+Каждая стадия - отдельный процесс (свой каталог запуска, свой лог в Data/refresh_logs/<стадия>.log).
+После успешной стадии в Data/refresh_state.json записываются хэши ее входов и выходов (sha256 содержимого).
+Локальная стадия пропускается, если входы (файлы, код, выходы зависимостей) не изменились и выходы на месте
+с теми же хэшами. Сетевые стадии (crawl/pdf/tables) читают сайт - по локальным файлам изменения не видны,
+поэтому их ключ включает id запуска: обычный запуск - новый id, сайт скачивается заново;
+--resume продолжает прошлый запуск (его id) - после падения повтор идет с упавшей стадии, а не с краулинга.
+Независимые стадии идут параллельно (до --jobs одновременно).
+
+Краулинг и PDF живут только в html_parser.ipynb: стадии crawl/pdf выполняют ячейки, помеченные строкой
+NOTEBOOK_MARKER (импорты, конфигурация, краулер, PDF-парсер), и сохраняют страницы в JSONL (save_pages).
+Транскрипты (*.txt) размечаются в Data/audio/jsons вручную, поэтому index зависит от JSON подкастов
+как от входного файла, а не от transcribe.
+
+Запуск из корня проекта:
+    python refresh_pipeline.py                   # новый запуск: сайт заново, локальные стадии - если менялись входы
+    python refresh_pipeline.py --resume          # продолжить прошлый запуск после падения
+    python refresh_pipeline.py index             # index и то, от чего он зависит
+    python refresh_pipeline.py --force crawl     # перезапустить стадию, даже если входы не менялись
+    python refresh_pipeline.py --dry-run         # только показать, что будет запущено
+'''
+
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# --- НАСТРОЙКИ ---
+STATE_PATH = "Data/refresh_state.json"
+LOGS_DIR = "Data/refresh_logs"
+# Сколько стадий выполняется одновременно
+JOBS = 3
+# Ячейки html_parser.ipynb с импортами, конфигурацией, краулером и PDF-парсером (без запуска индексации)
+# помечены этой строкой - номера ячеек при правке ноутбука сдвигаются, пометка остается
+NOTEBOOK = "Data/html_parser_files/html_parser.ipynb"
+NOTEBOOK_MARKER = "# refresh_pipeline: определения"
+# Сколько последних строк лога печатать при падении стадии
+LOG_TAIL = 20
+HASH_BLOCK = 1 << 20
+
+
+@dataclass
+class Stage:
+    name: str
+    cmd: List[str]
+    cwd: str = "."
+    deps: List[str] = field(default_factory=list)
+    # Пути относительно корня проекта, допускаются шаблоны glob
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    # Читает сеть: входы не видны локально, стадия перезапускается в каждом новом запуске (не в --resume)
+    network: bool = False
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str  # run / skipped / failed / blocked
+    seconds: float = 0.0
+    note: str = ""
+
+
+def _self(stage: str) -> List[str]:
+    return [sys.executable, os.path.join(ROOT, "refresh_pipeline.py"), "--run-stage", stage]
+
+
+def default_stages() -> Dict[str, Stage]:
+    backend = os.getenv("VECTOR_BACKEND", "chroma")
+    stages = [
+        Stage("crawl", _self("crawl"), cwd="Data/html_parser_files",
+              inputs=[NOTEBOOK], outputs=["Data/html_parser_files/pages.jsonl"], network=True),
+        Stage("pdf", _self("pdf"), cwd="Data/html_parser_files",
+              inputs=[NOTEBOOK], outputs=["Data/html_parser_files/pdf_pages.jsonl"], network=True),
+        Stage("tables", [sys.executable, "Data/table_parser_files/table_parser.py"],
+              inputs=["Data/table_parser_files/table_parser.py"],
+              outputs=["Data/table_parser_files/stankin_programs.json"], network=True),
+        Stage("transcribe", [sys.executable, "audio_whisper.py"], cwd="Data/audio/files",
+              inputs=["Data/audio/files/audio_whisper.py", "Data/audio/files/*.mp3"],
+              outputs=["Data/audio/files/*.txt"]),
+        Stage("index", [sys.executable, "ingest_pipeline.py"], deps=["crawl", "pdf", "tables"],
+              inputs=["Data/audio/jsons/*.json", "ingest_pipeline.py", "bulk_load.py", "token_chunker.py",
+                      "chunk_filter.py", "metadata_index.py", "Data/table_parser_files/create_db.py",
+                      "Data/audio/podcast_to_db.py"],
+              outputs=[f"Data/index_versions/{backend}/current.json"]),
+    ]
+    return {stage.name: stage for stage in stages}
+
+
+def expand(patterns: Sequence[str]) -> List[str]:
+    paths = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths.update(os.path.relpath(p, ROOT) for p in glob.glob(os.path.join(ROOT, pattern)))
+        else:
+            paths.add(pattern)
+    return sorted(paths)
+
+
+class FileHashes:
+    """sha256 файлов с кэшем по (размер, mtime): большие входы (mp3, jsonl) не перечитываются без изменений."""
+
+    def __init__(self, cache: Dict[str, list]):
+        self.cache = cache
+        self._lock = threading.Lock()
+
+    def __call__(self, path: str) -> Optional[str]:
+        full = os.path.join(ROOT, path)
+        try:
+            st = os.stat(full)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self.cache.get(path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(full, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                digest.update(block)
+        with self._lock:
+            self.cache[path] = [st.st_size, st.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+
+class RefreshRunner:
+    def __init__(self, stages: Dict[str, Stage], state_path: str = STATE_PATH, jobs: int = JOBS, resume: bool = False):
+        self.stages = stages
+        self.state_path = os.path.join(ROOT, state_path)
+        self.jobs = jobs
+        self.state = {"stages": {}, "files": {}}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+        self.hashes = FileHashes(self.state.setdefault("files", {}))
+        self._lock = threading.Lock()
+        # id запуска входит в ключ сетевых стадий: новый id - сайт скачивается заново
+        self.resumed = resume and "run_id" in self.state
+        if not self.resumed:
+            self.state["run_id"] = datetime.datetime.now().isoformat(timespec="seconds")
+        self.run_id = self.state["run_id"]
+
+    def plan(self, targets: Sequence[str]) -> List[str]:
+        """Цели и все их зависимости в порядке, где зависимость стоит раньше зависимой стадии."""
+        order: List[str] = []
+
+        def visit(name: str, path: tuple):
+            if name in path:
+                raise ValueError(f"Цикл в графе стадий: {' -> '.join(path + (name,))}")
+            if name not in self.stages:
+                raise ValueError(f"Неизвестная стадия '{name}'")
+            for dep in self.stages[name].deps:
+                visit(dep, path + (name,))
+            if name not in order:
+                order.append(name)
+
+        for name in targets:
+            visit(name, ())
+        return order
+
+    def input_key(self, stage: Stage) -> str:
+        """Хэш команды, входных файлов и выходов зависимостей: меняется - стадию надо перезапускать."""
+        inputs = {path: self.hashes(path) for path in expand(stage.inputs)}
+        deps = {dep: self.state["stages"].get(dep, {}).get("outputs") for dep in stage.deps}
+        run = self.run_id if stage.network else None
+        payload = json.dumps({"cmd": stage.cmd[1:], "cwd": stage.cwd, "inputs": inputs, "deps": deps, "run": run},
+                             sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def output_hashes(self, stage: Stage) -> Dict[str, Optional[str]]:
+        return {path: self.hashes(path) for path in expand(stage.outputs)}
+
+    def up_to_date(self, stage: Stage, key: str) -> bool:
+        saved = self.state["stages"].get(stage.name)
+        if not saved or saved.get("key") != key:
+            return False
+        current = self.output_hashes(stage)
+        return all(current.get(path) == digest for path, digest in saved["outputs"].items())
+
+    def _save_state(self) -> None:
+        """Контрольная точка после каждой стадии: временный файл + os.replace."""
+        tmp = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def _execute(self, stage: Stage, key: str) -> StageResult:
+        log_path = os.path.join(ROOT, LOGS_DIR, f"{stage.name}.log")
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        print(f"▶️  {stage.name}: {' '.join(stage.cmd)} (лог: {os.path.relpath(log_path, ROOT)})")
+        start = time.perf_counter()
+        with open(log_path, "w", encoding="utf-8") as log:
+            code = subprocess.run(stage.cmd, cwd=os.path.join(ROOT, stage.cwd), stdout=log, stderr=subprocess.STDOUT,
+                                  env={**os.environ, "PYTHONUNBUFFERED": "1"}).returncode
+        seconds = time.perf_counter() - start
+
+        outputs = self.output_hashes(stage)
+        missing = [path for path, digest in outputs.items() if digest is None]
+        if code != 0 or missing:
+            with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+                tail = f.readlines()[-LOG_TAIL:]
+            note = f"код {code}" if code != 0 else f"нет выходов: {', '.join(missing)}"
+            print(f"❌ {stage.name}: {note}\n" + "".join("   " + line for line in tail))
+            return StageResult(stage.name, "failed", seconds, note)
+
+        with self._lock:
+            self.state["stages"][stage.name] = {
+                "key": key,
+                "outputs": outputs,
+                "seconds": round(seconds, 1),
+                "finished_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            }
+            self._save_state()
+        print(f"✅ {stage.name}: {seconds:.1f} с")
+        return StageResult(stage.name, "run", seconds)
+
+    def run(self, targets: Sequence[str], force: Sequence[str] = (), dry_run: bool = False) -> List[StageResult]:
+        order = self.plan(targets)
+        results: Dict[str, StageResult] = {}
+        running = {}
+        if not dry_run and not self.resumed:
+            # Новый id сразу на диск: --resume после падения продолжит этот запуск, а не предыдущий
+            self._save_state()
+
+        def ready(name: str) -> bool:
+            return all(dep in results for dep in self.stages[name].deps)
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            pending = list(order)
+            while pending or running:
+                for name in [n for n in pending if ready(n)]:
+                    pending.remove(name)
+                    stage = self.stages[name]
+                    failed = [dep for dep in stage.deps if results[dep].status in ("failed", "blocked")]
+                    if failed:
+                        results[name] = StageResult(name, "blocked", note=f"упали: {', '.join(failed)}")
+                        continue
+                    if dry_run and any(results[dep].status == "run" for dep in stage.deps):
+                        results[name] = StageResult(name, "run", note="после зависимостей")
+                        continue
+                    # Ключ считается, когда зависимости уже записали свои выходы в состояние
+                    key = self.input_key(stage)
+                    if name not in force and self.up_to_date(stage, key):
+                        note = "уже выполнена в этом запуске" if stage.network else "входы не менялись"
+                        results[name] = StageResult(name, "skipped", note=note)
+                        continue
+                    if dry_run:
+                        results[name] = StageResult(name, "run", note="будет запущена")
+                        continue
+                    running[pool.submit(self._execute, stage, key)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        return [results[name] for name in order]
+
+
+def print_report(results: Sequence[StageResult], wall: float) -> None:
+    print("\n" + "=" * 64)
+    print(f"{'Стадия':<14}{'Статус':<10}{'Время, с':>10}   Примечание")
+    print("-" * 64)
+    for r in results:
+        print(f"{r.name:<14}{r.status:<10}{r.seconds:>10.1f}   {r.note}")
+    print("-" * 64)
+    busy = sum(r.seconds for r in results)
+    print(f"Итого: {wall:.1f} с по часам, {busy:.1f} с суммарно по стадиям")
+    print("=" * 64)
+
+
+def _notebook_namespace() -> dict:
+    """Определения из html_parser.ipynb (запуск из Data/html_parser_files, как у ноутбука)."""
+    with open(os.path.basename(NOTEBOOK), "r", encoding="utf-8") as f:
+        cells = json.load(f)["cells"]
+    selected = [i for i, cell in enumerate(cells)
+                if cell["cell_type"] == "code" and any(line.strip() == NOTEBOOK_MARKER for line in cell["source"])]
+    if not selected:
+        raise RuntimeError(f"В {NOTEBOOK} нет ячеек с пометкой '{NOTEBOOK_MARKER}'")
+    namespace = {"__name__": "html_parser"}
+    for i in selected:
+        exec(compile("".join(cells[i]["source"]), f"{NOTEBOOK}[{i}]", "exec"), namespace)
+    return namespace
+
+
+def run_notebook_stage(name: str) -> None:
+    ns = _notebook_namespace()
+    config = ns["STANKIN_RAG_Config"]
+    if name == "crawl":
+        pages = ns["stankin_crawler"](start_url=config.START_URL, max_depth=config.MAX_CRAWL_DEPTH)
+        path = config.PAGES_PATH
+    else:
+        pages = ns["process_pdf_documents"](config.PDF_DOCUMENTS)
+        path = config.PDF_PAGES_PATH
+    if not pages:
+        raise RuntimeError(f"Стадия {name}: ни одной страницы")
+    ns["save_pages"](pages, path)
+    print(f"💾 {name}: {len(pages)} страниц -> {path}")
+
+
+def main():
+    stages = default_stages()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("targets", nargs="*", help=f"стадии (по умолчанию все: {', '.join(stages)})")
+    parser.add_argument("--force", nargs="+", default=[], help="перезапустить эти стадии, даже если входы не менялись")
+    parser.add_argument("--jobs", type=int, default=JOBS)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--resume", action="store_true",
+                        help="продолжить прошлый запуск: сетевые стадии, уже выполненные в нем, не повторять")
+    parser.add_argument("--run-stage", choices=["crawl", "pdf"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        run_notebook_stage(args.run_stage)
+        return
+
+    runner = RefreshRunner(stages, jobs=args.jobs, resume=args.resume)
+    print(f"🆔 Запуск {runner.run_id}" + (" (продолжение)" if runner.resumed else ""))
+    start = time.perf_counter()
+    results = runner.run(args.targets or list(stages), force=args.force, dry_run=args.dry_run)
+    print_report(results, time.perf_counter() - start)
+    if any(r.status in ("failed", "blocked") for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
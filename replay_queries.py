@@ -0,0 +1,153 @@
+'''
+Повтор запросов из журнала (query_log.py) на текущей конфигурации и сравнение с записанным:
+какие документы пропали/появились, насколько совпадает выдача и как изменилось время стадий.
+
+Конфигурация берется из окружения, как у get_retriever(): VECTOR_BACKEND, BINARY_SEARCH, EMBEDDING_MODEL, LLM_MODEL.
+По умолчанию фильтр и лимит берутся из журнала (LLM не вызывается) - сравнивается только индекс/модель
+эмбеддингов. С --full запрос заново строится через LLM (с фильтром по экзаменам, как в self_query_searcher.py).
+Выдача сравнивается по id документов: id детерминированы (bulk_load.stable_ids), так что после пересборки
+базы тот же чанк узнается, а новые/измененные чанки попадают в "появились"/"пропали".
+
+Запуск из корня проекта:
+    python replay_queries.py                                   # весь Data/query_log
+    python replay_queries.py Data/query_log/queries-....jsonl.gz --limit 200
+    VECTOR_BACKEND=numpy python replay_queries.py --full
+'''
+
+import csv
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from query_log import QUERY_LOG_DIR, read_log
+from self_query_searcher import get_retriever, search_with_scores, search_with_trace
+from subject_mask import SubjectIndex
+
+# --- НАСТРОЙКИ ---
+REPORT_PATH = "Data/replay_report.csv"
+# Сколько запросов с самыми большими расхождениями показать в конце
+WORST_N = 10
+USAGE = "Использование: python replay_queries.py [сегмент|каталог] [--full] [--limit N]"
+
+
+def replay_entry(retriever, entry: Dict[str, Any], full: bool, subject_index: Optional[SubjectIndex] = None) -> Dict[str, Any]:
+    """Новый trace для записи журнала: тот же формат, что у search_with_trace()."""
+    if full:
+        return search_with_trace(retriever, entry["query"], subject_index)[1]
+
+    search_kwargs = dict(retriever.search_kwargs)
+    if entry.get("filter"):
+        search_kwargs["filter"] = entry["filter"]
+    if entry.get("limit"):
+        search_kwargs["k"] = entry["limit"]
+    start = time.perf_counter()
+    pairs = search_with_scores(retriever.vectorstore, retriever.search_type, entry.get("search_query", entry["query"]), search_kwargs)
+    return {
+        "docs": [{"id": doc.id, "score": float(score)} for doc, score in pairs],
+        "timings_ms": {"search": (time.perf_counter() - start) * 1000},
+    }
+
+
+def diff_entry(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    old_ids = [d["id"] for d in old.get("docs", [])]
+    new_ids = [d["id"] for d in new.get("docs", [])]
+    common = set(old_ids) & set(new_ids)
+    old_scores = {d["id"]: d["score"] for d in old.get("docs", [])}
+    new_scores = {d["id"]: d["score"] for d in new.get("docs", [])}
+    return {
+        "query": old["query"],
+        "overlap": len(common) / max(len(old_ids), len(new_ids), 1),
+        "same_order": old_ids == new_ids,
+        "top1_same": old_ids[:1] == new_ids[:1],
+        "missing": [i for i in old_ids if i not in common],
+        "added": [i for i in new_ids if i not in common],
+        "score_delta": float(np.mean([new_scores[i] - old_scores[i] for i in common])) if common else 0.0,
+        "old_ms": old.get("timings_ms", {}),
+        "new_ms": new.get("timings_ms", {}),
+    }
+
+
+def _percentiles(values: List[float]) -> str:
+    if not values:
+        return "-"
+    p50, p95 = np.percentile(values, [50, 95])
+    return f"p50 {p50:7.1f} мс, p95 {p95:7.1f} мс"
+
+
+def print_summary(diffs: List[Dict[str, Any]]) -> None:
+    n = len(diffs)
+    print(f"\n📊 Повторено запросов: {n}")
+    print(f"   Совпадение выдачи (доля общих документов): {np.mean([d['overlap'] for d in diffs]):.1%}")
+    print(f"   Тот же порядок: {sum(d['same_order'] for d in diffs)}/{n}, тот же первый документ: {sum(d['top1_same'] for d in diffs)}/{n}")
+    print(f"   Средний сдвиг оценки общих документов: {np.mean([d['score_delta'] for d in diffs]):+.4f}")
+
+    stages = sorted({stage for d in diffs for stage in d["new_ms"]})
+    print("\n⏱️ Время стадий (было -> стало):")
+    for stage in stages:
+        old = [d["old_ms"][stage] for d in diffs if stage in d["old_ms"] and stage in d["new_ms"]]
+        new = [d["new_ms"][stage] for d in diffs if stage in d["old_ms"] and stage in d["new_ms"]]
+        print(f"   {stage:<8} {_percentiles(old)}  ->  {_percentiles(new)}")
+
+    worst = sorted(diffs, key=lambda d: d["overlap"])[:WORST_N]
+    worst = [d for d in worst if d["overlap"] < 1.0]
+    if worst:
+        print("\n🔻 Сильнее всего изменилась выдача:")
+        for d in worst:
+            print(f"   {d['overlap']:.0%}  {d['query'][:70]}  (-{len(d['missing'])} / +{len(d['added'])})")
+
+
+def write_report(diffs: List[Dict[str, Any]], path: str = REPORT_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["query", "overlap", "same_order", "top1_same", "score_delta",
+                         "old_search_ms", "new_search_ms", "missing", "added"])
+        for d in diffs:
+            writer.writerow([d["query"], f"{d['overlap']:.3f}", d["same_order"], d["top1_same"], f"{d['score_delta']:.4f}",
+                             f"{d['old_ms'].get('search', 0):.1f}", f"{d['new_ms'].get('search', 0):.1f}",
+                             " ".join(d["missing"]), " ".join(d["added"])])
+    print(f"💾 Подробности: {path}")
+
+
+def main(argv: list) -> int:
+    path, full, limit = QUERY_LOG_DIR, False, None
+    args = iter(argv)
+    for arg in args:
+        if arg == "--full":
+            full = True
+        elif arg == "--limit":
+            limit = int(next(args))
+        elif arg.startswith("-"):
+            print(USAGE)
+            return 2
+        else:
+            path = arg
+
+    # Записи с ошибкой не с чем сравнивать
+    entries = [entry for entry in read_log(path, limit) if "docs" in entry]
+    if not entries:
+        print(f"❌ В журнале {path} нет записей для повтора")
+        return 1
+    print(f"📂 Записей в журнале: {len(entries)} ({'LLM заново' if full else 'фильтры из журнала'})")
+
+    retriever = get_retriever()
+    subject_index = SubjectIndex.from_store(retriever.vectorstore) if full else None
+    diffs = []
+    for i, entry in enumerate(entries):
+        try:
+            diffs.append(diff_entry(entry, replay_entry(retriever, entry, full, subject_index)))
+        except Exception as e:
+            print(f"❌ [{i}] {entry['query'][:60]}: {e}")
+    if not diffs:
+        return 1
+
+    print_summary(diffs)
+    write_report(diffs)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+'''
+Теплый демон ретривера: модель e5, индекс и self-query ретривер загружаются один раз
+и ждут запросов на Unix-сокете. Разовый запрос из скрипта или терминала идет через
+rag_client.py и не платит десятки секунд за импорты и загрузку модели.
+
+Протокол: одна строка JSON на запрос, одна строка JSON в ответ.
+    {"query": "...", "mode": "self_query" | "vector" | "speculative", "k": 6}  -> {"docs": [...], "took_ms": ...}
+    (speculative: поиск параллельно с LLM, см. speculative_retriever.py; в ответе еще degraded и path)
+Новая версия индекса (index_versions.py) открывается в фоне и подменяет старую между запросами.
+    {"op": "ping"}                                             -> {"status": "ok", "pid": ..., "uptime_s": ...}
+
+Запуск из корня проекта:
+    python retriever_daemon.py          # сокет: RAG_SOCKET или /tmp/stankin_rag.sock
+'''
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import time
+from typing import Any, Dict
+
+from index_versions import IndexWatcher
+from program_index import ProgramIndex
+from self_query_searcher import get_retriever
+from speculative_retriever import SpeculativeRetriever
+from subject_mask import SubjectIndex
+
+SOCKET_PATH = os.getenv("RAG_SOCKET", "/tmp/stankin_rag.sock")
+DEFAULT_K = 6
+
+
+class RetrieverRequestHandler(socketserver.StreamRequestHandler):
+    def _reply(self, payload: Dict[str, Any]) -> None:
+        self.wfile.write(json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def handle(self) -> None:
+        # Клиент может отправить несколько запросов подряд в одном соединении
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                self._reply({"error": "ожидается одна строка JSON"})
+                continue
+            self._reply(self.server.execute(request))
+
+
+class RetrieverDaemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str):
+        # Сокет от упавшего демона мешает bind - удаляем, только если там никто не слушает
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                os.unlink(path)
+            else:
+                raise RuntimeError(f"На {path} уже работает другой демон")
+            finally:
+                probe.close()
+        super().__init__(path, RetrieverRequestHandler)
+        os.chmod(path, 0o600)
+        # Свой сокет узнаем по inode: на выходе не удалим сокет, который успел занять другой демон
+        self.socket_path = path
+        self.socket_inode = os.stat(path).st_ino
+
+        start = time.perf_counter()
+        self.retriever = get_retriever()
+        self.program_index = ProgramIndex.from_store(self.retriever.vectorstore)
+        self.speculative = SpeculativeRetriever(self.retriever, SubjectIndex.from_store(self.retriever.vectorstore))
+        self.watcher = IndexWatcher(self.retriever.vectorstore.backend, self._open_version)
+        self.started = time.time()
+        print(f"🔥 Ретривер прогрет за {time.perf_counter() - start:.1f} с, слушаю {path}")
+
+    def remove_socket(self) -> None:
+        try:
+            if os.stat(self.socket_path).st_ino == self.socket_inode:
+                os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    def _open_version(self, path: str):
+        store = self.retriever.vectorstore.reopen(path)
+        return store, ProgramIndex.from_store(store), SubjectIndex.from_store(store)
+
+    def _swap_if_published(self) -> None:
+        opened = self.watcher.poll()
+        if opened is not None:
+            old = self.retriever.vectorstore
+            store, self.program_index, self.speculative.subject_index = opened
+            self.retriever.vectorstore = store
+            self.speculative.vectorstore = store
+            # Пул потоков старой версии останавливаем сразу; запросы, которые еще идут по ней, дорабатывают
+            old.close()
+
+    def execute(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        self._swap_if_published()
+        if request.get("op") == "ping":
+            return {"status": "ok", "pid": os.getpid(), "uptime_s": round(time.time() - self.started, 1)}
+
+        query = request.get("query")
+        if not query:
+            return {"error": "нет поля query"}
+        start = time.perf_counter()
+        extra: Dict[str, Any] = {}
+        try:
+            if request.get("mode") == "vector":
+                docs = self.retriever.vectorstore.similarity_search(query, k=int(request.get("k", DEFAULT_K)))
+            elif request.get("mode") == "speculative":
+                result = self.speculative.retrieve(query)
+                docs = result.docs
+                extra = {"degraded": result.degraded, "path": result.path}
+                if result.error:
+                    extra["llm_error"] = result.error
+            else:
+                docs = self.retriever.invoke(query)
+            docs = self.program_index.attach_linked(docs, query)
+        except Exception as e:
+            return {"error": str(e)}
+        return {
+            "docs": [{"page_content": d.page_content, "metadata": d.metadata} for d in docs],
+            "took_ms": round((time.perf_counter() - start) * 1000, 1),
+            **extra,
+        }
+
+
+def main():
+    try:
+        server = RetrieverDaemon(SOCKET_PATH)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Демон остановлен")
+    finally:
+        server.server_close()
+        server.remove_socket()
+
+
+if __name__ == "__main__":
+    main()
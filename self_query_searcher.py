@@ -1,28 +1,51 @@
 import os
 import sys
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_classic.chains.query_constructor.base import AttributeInfo
-from langchain_classic.retrievers import SelfQueryRetriever
-from langchain_openai import ChatOpenAI
+import time
 from dotenv import load_dotenv
 
+# Тяжелые библиотеки (langchain_*, sentence-transformers, chromadb) импортируются внутри функций:
+# сам модуль грузится мгновенно, а для повторяющихся запросов есть теплый демон (retriever_daemon.py)
+
 load_dotenv()
 
 # --- 1. НАСТРОЙКИ OPENROUTER ---
 # Вставь сюда свой ключ или используй переменную окружения
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY") 
-CHROMA_PATH = "Data/chroma_db"
+# Адрес API можно подменить (например, на локальный фейковый OpenRouter из load_test.py)
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+# Модели можно подменить окружением (replay_queries.py сравнивает выдачу до и после такой замены)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "intfloat/multilingual-e5-large")
+LLM_MODEL = os.getenv("LLM_MODEL", "google/gemini-2.5-flash")
+# Поиск с разнообразием (MMR): из fetch_k кандидатов выбираются k непохожих,
+# не больше двух документов одной программы / одного спикера. lambda: 1.0 - чистая релевантность
+SEARCH_KWARGS = {"k": 6, "fetch_k": 40, "lambda_mult": 0.6}
+# Двухэтапный поиск для бэкендов numpy / snapshot: бинарные коды (Хэмминг) -> пересчет короткого списка
+# полными векторами. Выигрыш по скорости и потеря recall - bench_binary.py
+BINARY_SEARCH = os.getenv("BINARY_SEARCH", "0") == "1"
+
+def get_retriever(binary_search: bool = BINARY_SEARCH):
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from langchain_classic.chains.query_constructor.base import AttributeInfo
+    from langchain_classic.retrievers import SelfQueryRetriever
+    from langchain_community.query_constructors.chroma import ChromaTranslator
+    from langchain_openai import ChatOpenAI
+    from sharded_store import VECTOR_BACKEND, ShardedVectorStore, index_path
+
+    db_path = index_path(VECTOR_BACKEND)  # Текущая версия индекса (index_versions.py) для VECTOR_BACKEND: chroma / numpy / snapshot
 
-def get_retriever():
     # --- 2. ЭМБЕДДИНГИ (Те же, что при создании) ---
     print("🧠 Загрузка модели эмбеддингов...")
-    embeddings = HuggingFaceEmbeddings(model_name="intfloat/multilingual-e5-large")
+    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
 
     # --- 3. ПОДКЛЮЧЕНИЕ К БАЗЕ ---
-    vectorstore = Chroma(
-        persist_directory=CHROMA_PATH,
-        embedding_function=embeddings
+    # Каждый source_type живет в своей коллекции, запрос уходит только в нужные шарды.
+    # Бэкенд шардов задается VECTOR_BACKEND: chroma (HNSW), numpy (точный перебор для маленькой базы)
+    # или snapshot (снимок индекса через mmap - самый быстрый старт, см. index_snapshot.py)
+    print(f"📂 Векторная база: {VECTOR_BACKEND} ({db_path})" + (", бинарный поиск + пересчет" if binary_search else ""))
+    vectorstore = ShardedVectorStore(
+        persist_directory=db_path,
+        embedding_function=embeddings,
+        binary_search=binary_search,
     )
 
     # --- 4. ТОЧНОЕ ОПИСАНИЕ МЕТАДАННЫХ (ЭТО САМОЕ ВАЖНОЕ!) ---
@@ -99,9 +122,9 @@ def get_retriever():
     # - "anthropic/claude-3-haiku" (Хорошо следует инструкциям)
     
     llm = ChatOpenAI(
-        model="google/gemini-2.5-flash", # <-- Можешь поменять на любую модель из OpenRouter
+        model=LLM_MODEL, # <-- Можешь поменять на любую модель из OpenRouter (или LLM_MODEL в окружении)
         openai_api_key=OPENROUTER_API_KEY,
-        openai_api_base="https://openrouter.ai/api/v1",
+        openai_api_base=OPENROUTER_BASE_URL,
         temperature=0, # ВАЖНО! 0 означает строгую логику без фантазий
     )
 
@@ -111,13 +134,66 @@ def get_retriever():
         vectorstore,                    # 2-й: векторное хранилище
         document_content_description,   # 3-й: описание (то самое document_contents)
         metadata_field_info,            # 4-й: список метаданных
+        structured_query_translator=ChromaTranslator(),  # Шарды - это Chroma, фильтры в ее формате
         verbose=True,
-        enable_limit=True
+        enable_limit=True,
+        search_type="mmr",                  # ShardedVectorStore.max_marginal_relevance_search (mmr.py)
+        search_kwargs=dict(SEARCH_KWARGS),
     )
 
     return retriever
 
+def search_with_scores(vectorstore, search_type: str, query: str, search_kwargs: dict):
+    """[(документ, релевантность)] тем же способом поиска, что и у ретривера (mmr или similarity)."""
+    if search_type == "mmr":
+        return vectorstore.max_marginal_relevance_search_with_relevance_scores(query, **search_kwargs)
+    return vectorstore.similarity_search_with_relevance_scores(query, **search_kwargs)
+
+def search_with_trace(retriever, query: str, subject_index=None):
+    """
+    То же, что retriever.invoke(query), но по стадиям (LLM -> фильтр -> поиск) с замером времени.
+    Возвращает (docs, trace): trace - фильтр, id и оценки документов, время стадий (для query_log.py).
+    subject_index (subject_mask.SubjectIndex): вопросы про экзамены ("без физики", "сдал И и М")
+    превращаются в фильтр по кодам программ и добавляются к фильтру LLM.
+    """
+    from subject_mask import merge_filters, programs_in_filter
+
+    start = time.perf_counter()
+    structured_query = retriever.query_constructor.invoke({"query": query})
+    built = time.perf_counter()
+    new_query, search_kwargs = retriever._prepare_query(query, structured_query)
+    subject_where = subject_index.filter_for_query(query) if subject_index is not None else None
+    if subject_where is not None:
+        search_kwargs["filter"] = merge_filters(search_kwargs.get("filter"), subject_where)
+    pairs = search_with_scores(retriever.vectorstore, retriever.search_type, new_query, search_kwargs)
+    searched = time.perf_counter()
+
+    trace = {
+        "query": query,
+        "search_query": new_query,
+        "filter": search_kwargs.get("filter"),
+        "limit": structured_query.limit,
+        "subject_programs": None if subject_where is None else len(programs_in_filter(subject_where)),
+        "search_type": retriever.search_type,
+        "search_kwargs": {key: value for key, value in search_kwargs.items() if key != "filter"},
+        "docs": [
+            {"id": doc.id, "score": round(float(score), 5), "source_type": doc.metadata.get("source_type"),
+             "program_code": doc.metadata.get("program_code")}
+            for doc, score in pairs
+        ],
+        "timings_ms": {"llm": (built - start) * 1000, "search": (searched - built) * 1000},
+        "config": {"backend": retriever.vectorstore.backend, "binary_search": retriever.vectorstore.binary_search,
+                   "embedding_model": EMBEDDING_MODEL, "llm_model": LLM_MODEL},
+    }
+    return [doc for doc, _ in pairs], trace
+
 def main():
+    from context_packer import pack_context
+    from index_versions import IndexWatcher
+    from program_index import ProgramIndex
+    from query_log import QueryLog
+    from subject_mask import SubjectIndex
+
     if "sk-or-v1" in OPENROUTER_API_KEY:
         print("✅ Ключ OpenRouter обнаружен.")
     else:
@@ -125,6 +201,20 @@ def main():
         return
 
     retriever = get_retriever()
+    # program_code -> таблица и обзоры подкастов: связанные документы без второго векторного поиска
+    program_index = ProgramIndex.from_store(retriever.vectorstore)
+    # Маски экзаменов всех программ: "без физики" / "сдал И и М" -> фильтр по кодам программ
+    subject_index = SubjectIndex.from_store(retriever.vectorstore)
+    # Журнал запросов (фильтр, документы, время стадий) для разбора и replay_queries.py
+    query_log = QueryLog()
+    print(f"📝 Журнал запросов: {query_log.path}")
+
+    def open_version(path: str):
+        store = retriever.vectorstore.reopen(path)
+        return store, ProgramIndex.from_store(store), SubjectIndex.from_store(store)
+
+    # Пересборка базы (create_db.py и др.) публикует новую версию - подхватываем ее между вопросами
+    watcher = IndexWatcher(retriever.vectorstore.backend, open_version)
     
     print("\n💡 Введите запрос. Примеры:")
     print(" - Направления без физики (проверка фильтра 'not contains')")
@@ -133,12 +223,32 @@ def main():
     while True:
         query = input("\n🔍 Ваш вопрос (q для выхода): ")
         if query.lower() in ['q', 'exit']: break
+        opened = watcher.poll()
+        if opened is not None:
+            old = retriever.vectorstore
+            retriever.vectorstore, program_index, subject_index = opened
+            old.close()
         
+        trace = {"query": query}
         try:
-            # invoke сам делает магию: LLM -> Фильтр -> Chroma -> Результат
-            docs = retriever.invoke(query)
+            # То же, что retriever.invoke: LLM -> Фильтр -> Шарды -> Результат, но с замером стадий
+            docs, trace = search_with_trace(retriever, query, subject_index)
+            found = len(docs)
+            start = time.perf_counter()
+            docs = program_index.attach_linked(docs, query)
+            trace["timings_ms"]["linked"] = (time.perf_counter() - start) * 1000
+            trace["linked"] = len(docs) - found
             
-            print(f"\n🔎 Найдено документов: {len(docs)}")
+            print(f"\n🔎 Найдено документов: {found}, связанных по коду программы: {len(docs) - found}")
+
+            # Упаковка контекста для LLM: дедупликация шапок + бюджет токенов
+            start = time.perf_counter()
+            context, pack_report = pack_context(docs)
+            trace["timings_ms"]["pack"] = (time.perf_counter() - start) * 1000
+            trace["packed_tokens"] = pack_report.packed_tokens
+            query_log.record(trace)
+            print(f"🧮 Контекст для LLM: {pack_report.packed_tokens} токенов вместо {pack_report.raw_tokens} "
+                  f"(сэкономлено {pack_report.tokens_saved}), документов в контексте: {pack_report.included}/{len(docs)}")
             
             for i, doc in enumerate(docs):
                 print(f"\n📄 #{i+1} [{doc.metadata.get('source_type', '?')}] Код: {doc.metadata.get('program_code')}")
@@ -154,6 +264,8 @@ def main():
                 print(doc.page_content[:1500].replace('\n', ' ') + "...")
                 
         except Exception as e:
+            trace["error"] = repr(e)
+            query_log.record(trace)
             print(f"❌ Ошибка: {e}")
             print("Совет: Возможно, модель вернула кривой синтаксис. Попробуйте gpt-4o-mini.")
 
@@ -0,0 +1,561 @@
+'''
+Шардированное векторное хранилище: каждый тип источника живет в своей коллекции Chroma
+со своими настройками HNSW. Запрос параллельно уходит только в нужные шарды,
+результаты сливаются по нормированной релевантности.
+'''
+
+import json
+import os
+import sys
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+import numpy as np
+from metadata_index import MetadataIndex, canonicalize_filter, canonicalize_metadata, normalize_source_type
+from numpy_store import NumpyVectorStore
+from index_snapshot import SNAPSHOT_PATH, open_snapshot
+from index_versions import resolve_index_path
+from mmr import DEFAULT_FETCH_K, DEFAULT_GROUP_CAPS, DEFAULT_LAMBDA, mmr_select
+
+# --- НАСТРОЙКИ ---
+CHROMA_PATH = "Data/chroma_db"
+NUMPY_PATH = "Data/numpy_db"
+# Бэкенд шардов: "chroma" (SQLite + HNSW), "numpy" (одна матрица, точный поиск)
+# или "snapshot" (тот же точный поиск, но из одного файла через mmap, только чтение)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+BACKEND_PATHS = {"chroma": CHROMA_PATH, "numpy": NUMPY_PATH, "snapshot": SNAPSHOT_PATH}
+# Коллекция, в которой раньше лежали все документы вместе (имя по умолчанию в langchain_chroma)
+LEGACY_COLLECTION = "langchain"
+# Если фильтр оставляет не больше стольких документов шарда, считаем их точно (dot product), без HNSW
+EXACT_SEARCH_THRESHOLD = 256
+# Параметры HNSW, подобранные hnsw_tuning.py: перекрывают значения по умолчанию из SHARDS
+INDEX_CONFIG_PATH = "Data/index_config.json"
+
+# Канонические значения source_type -> настройки шарда.
+# Таблиц всего ~сотня, поэтому для них ставим большой search_ef (поиск почти точный).
+SHARDS = {
+    "Таблица": {
+        "collection_name": "stankin_tables",
+        "collection_metadata": {"hnsw:space": "cosine", "hnsw:M": 16, "hnsw:construction_ef": 200, "hnsw:search_ef": 200},
+    },
+    "Подкаст": {
+        "collection_name": "stankin_podcasts",
+        "collection_metadata": {"hnsw:space": "cosine", "hnsw:M": 16, "hnsw:construction_ef": 100, "hnsw:search_ef": 100},
+    },
+    "Сайт": {
+        "collection_name": "stankin_web",
+        "collection_metadata": {"hnsw:space": "cosine", "hnsw:M": 32, "hnsw:construction_ef": 200, "hnsw:search_ef": 64},
+    },
+    "PDF": {
+        "collection_name": "stankin_pdf",
+        "collection_metadata": {"hnsw:space": "cosine", "hnsw:M": 32, "hnsw:construction_ef": 200, "hnsw:search_ef": 64},
+    },
+}
+
+
+# Живые хранилища (слабые ссылки): после fork каждому нужен свой пул потоков.
+# Хук один на модуль - хранилище, замененное новой версией индекса, не удерживается им до конца процесса
+_LIVE_STORES: "weakref.WeakSet[ShardedVectorStore]" = weakref.WeakSet()
+
+
+def _restart_pools_after_fork() -> None:
+    for store in list(_LIVE_STORES):
+        store._restart_pool()
+
+
+os.register_at_fork(after_in_child=_restart_pools_after_fork)
+
+
+def index_path(backend: str = VECTOR_BACKEND) -> str:
+    """Каталог текущей версии индекса (манифест index_versions.py); без манифеста - BACKEND_PATHS."""
+    return resolve_index_path(backend, BACKEND_PATHS[backend])
+
+
+def load_index_config(path: str = INDEX_CONFIG_PATH) -> Dict[str, Dict[str, Any]]:
+    """Читает подобранные параметры HNSW: {source_type: {"hnsw:M": ..., ...}}. Нет файла - пустой словарь."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def apply_index_config(shards: Dict[str, Dict[str, Any]], config: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Подставляет ключи hnsw:* из конфига в collection_metadata шардов (hnsw:space не трогаем),
+    а numpy:dtype / numpy:pca_dim (bench_compression.py) - в настройки шарда NumPy-бэкенда.
+    """
+    for source, params in config.items():
+        if source not in shards:
+            continue
+        metadata = shards[source].setdefault("collection_metadata", {})
+        metadata.update({k: v for k, v in params.items() if k.startswith("hnsw:") and k != "hnsw:space"})
+        shards[source].update({k[len("numpy:"):]: v for k, v in params.items() if k.startswith("numpy:")})
+
+
+# Новые параметры применяются при пересоздании коллекции (reset_shard в create_db.py / podcast_to_db.py);
+# проекция PCA NumPy-шарда подбирается при его следующей загрузке
+apply_index_config(SHARDS, load_index_config())
+
+FilterResult = Union[bool, Dict[str, Any]]
+
+
+def _match_source(condition: Any, source: str) -> bool:
+    """Проверяет одно условие на source_type (формат where из Chroma) для конкретного шарда."""
+    if not isinstance(condition, dict):
+        return normalize_source_type(condition) == source
+
+    result = True
+    for op, value in condition.items():
+        if op == "$eq":
+            result &= normalize_source_type(value) == source
+        elif op == "$ne":
+            result &= normalize_source_type(value) != source
+        elif op == "$in":
+            result &= source in {normalize_source_type(v) for v in value}
+        elif op == "$nin":
+            result &= source not in {normalize_source_type(v) for v in value}
+        # Прочие операторы к строковому source_type не применимы - не отсекаем шард
+    return result
+
+
+def specialize_filter(where: Optional[Dict[str, Any]], source: str) -> FilterResult:
+    """
+    Подставляет в фильтр известное значение source_type шарда и упрощает его.
+    Возвращает False (шард можно пропустить), True (фильтр не нужен) или остаточный фильтр.
+    """
+    if not where:
+        return True
+
+    parts: List[FilterResult] = []
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            children = [specialize_filter(child, source) for child in value]
+            if key == "$and":
+                if any(c is False for c in children):
+                    parts.append(False)
+                    continue
+                rest = [c for c in children if c is not True]
+            else:
+                if any(c is True for c in children):
+                    parts.append(True)
+                    continue
+                rest = [c for c in children if c is not False]
+                if not rest:
+                    parts.append(False)
+                    continue
+            if not rest:
+                parts.append(True)
+            elif len(rest) == 1:
+                parts.append(rest[0])
+            else:
+                parts.append({key: rest})
+        elif key == "source_type":
+            parts.append(_match_source(value, source))
+        else:
+            parts.append({key: value})
+
+    if any(p is False for p in parts):
+        return False
+    rest = [p for p in parts if p is not True]
+    if not rest:
+        return True
+    if len(rest) == 1:
+        return rest[0]
+    return {"$and": rest}
+
+
+class ShardedVectorStore(VectorStore):
+    """Набор коллекций Chroma (по одной на source_type) за единым интерфейсом VectorStore."""
+
+    def __init__(
+        self,
+        persist_directory: Optional[str] = None,
+        embedding_function: Optional[Embeddings] = None,
+        shards: Optional[Dict[str, Dict[str, Any]]] = None,
+        backend: str = VECTOR_BACKEND,
+        binary_search: bool = False,
+    ):
+        self._embedding_function = embedding_function
+        self.backend = backend
+        self.binary_search = binary_search
+        # Двухэтапный поиск (Хэмминг -> пересчет) работает поверх матрицы NumPy; в Chroma векторы лежат в SQLite
+        if binary_search and backend == "chroma":
+            raise ValueError("Бинарный поиск доступен только для бэкендов numpy и snapshot")
+        self.persist_directory = persist_directory or index_path(backend)
+        self.shard_config = shards or SHARDS
+        if backend == "snapshot":
+            # Один файл на все шарды: открывается через mmap за миллисекунды, страницы общие для всех процессов
+            snapshot = open_snapshot(self.persist_directory, embedding_function)
+            self.shards: Dict[str, VectorStore] = {
+                source: snapshot.get(source) or NumpyVectorStore(embedding_function=embedding_function)
+                for source in self.shard_config
+            }
+        else:
+            self.shards = {source: self._open_shard(cfg) for source, cfg in self.shard_config.items()}
+        if binary_search:
+            for shard in self.shards.values():
+                shard.enable_binary_search()
+        self._pool = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard")
+        # Потоки пула не переживают fork: в дочернем процессе (prefork_server) пул создается заново
+        _LIVE_STORES.add(self)
+
+        # Вторичный индекс метаданных по каждому шарду (значения уже канонические - нормализуются при загрузке).
+        # Нужен только Chroma: NumPy-бэкенды и так считают фильтрованный поиск точно.
+        self.indexes: Dict[str, MetadataIndex] = {}
+        if backend == "chroma":
+            for source, store in self.shards.items():
+                data = store.get(include=["metadatas"])
+                self.indexes[source] = MetadataIndex()
+                self.indexes[source].add(data["ids"], data["metadatas"])
+
+    def _open_shard(self, cfg: Dict[str, Any]) -> VectorStore:
+        if self.backend == "numpy":
+            # У NumPy-бэкенда нет HNSW: поиск всегда точный, метрика - косинус
+            return NumpyVectorStore(
+                persist_directory=os.path.join(self.persist_directory, cfg["collection_name"]),
+                embedding_function=self._embedding_function,
+                dtype=cfg.get("dtype", "float32"),
+                pca_dim=cfg.get("pca_dim"),
+            )
+        # chromadb импортируем только для Chroma-бэкенда: numpy/snapshot стартуют без него
+        from langchain_chroma import Chroma
+        return Chroma(
+            collection_name=cfg["collection_name"],
+            persist_directory=self.persist_directory,
+            embedding_function=self._embedding_function,
+            collection_metadata=cfg.get("collection_metadata"),
+        )
+
+    def reopen(self, persist_directory: str) -> "ShardedVectorStore":
+        """Та же конфигурация (модель, бэкенд, шарды) поверх другого каталога - новой версии индекса."""
+        return ShardedVectorStore(persist_directory, self._embedding_function, self.shard_config, self.backend, self.binary_search)
+
+    def _restart_pool(self) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard")
+
+    def close(self) -> None:
+        """
+        Освобождает хранилище, которое заменила новая версия индекса: останавливает пул потоков
+        (начатые запросы дорабатывают) и снимает хранилище с учета fork-хука.
+        """
+        _LIVE_STORES.discard(self)
+        self._pool.shutdown(wait=False)
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding_function
+
+    # --- ЗАПИСЬ ---
+
+    def add_documents(self, documents: List[Document], **kwargs: Any) -> List[str]:
+        """Раскладывает документы по шардам согласно (нормализованному) source_type."""
+        by_shard: Dict[str, List[Document]] = {}
+        for doc in documents:
+            doc.metadata = canonicalize_metadata(doc.metadata)
+            source = doc.metadata.get("source_type", "")
+            if source not in self.shards:
+                raise ValueError(f"Неизвестный source_type '{source}': нет такого шарда")
+            by_shard.setdefault(source, []).append(doc)
+
+        ids = []
+        for source, docs in by_shard.items():
+            shard_ids = self.shards[source].add_documents(docs, **kwargs)
+            if source in self.indexes:
+                self.indexes[source].add(shard_ids, [doc.metadata for doc in docs])
+            ids.extend(shard_ids)
+        return ids
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        docs = [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)]
+        return self.add_documents(docs, **kwargs)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        persist_directory: Optional[str] = None,
+        **kwargs: Any,
+    ) -> "ShardedVectorStore":
+        store = cls(persist_directory=persist_directory, embedding_function=embedding)
+        store.add_texts(texts, metadatas=metadatas, **kwargs)
+        return store
+
+    def add_embeddings(
+        self,
+        source: str,
+        texts: List[str],
+        embeddings: Any,
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+        batch_size: int = 500,
+    ) -> List[str]:
+        """Пишет в шард готовые эмбеддинги (модель не вызывается) и обновляет индекс метаданных."""
+        source = normalize_source_type(source)
+        metadatas = [canonicalize_metadata(m or {}) for m in metadatas]
+        shard = self.shards[source]
+        if isinstance(shard, NumpyVectorStore):
+            shard.add_embeddings(texts, embeddings, metadatas=metadatas, ids=ids)
+        else:
+            for i in range(0, len(ids), batch_size):
+                shard._collection.upsert(
+                    ids=ids[i:i + batch_size],
+                    documents=texts[i:i + batch_size],
+                    metadatas=metadatas[i:i + batch_size],
+                    embeddings=[list(map(float, e)) for e in embeddings[i:i + batch_size]],
+                )
+        if source in self.indexes:
+            self.indexes[source].add(ids, metadatas)
+        return ids
+
+    def reset_shard(self, source: str, collection_metadata: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Очищает один шард (остальные источники не трогаем).
+        collection_metadata дополняет параметры коллекции Chroma при пересоздании (bulk_load.py).
+        """
+        source = normalize_source_type(source)
+        if collection_metadata and self.backend == "chroma":
+            self.shards[source].delete_collection()
+            cfg = dict(self.shard_config[source])
+            cfg["collection_metadata"] = {**cfg.get("collection_metadata", {}), **collection_metadata}
+            self.shards[source] = self._open_shard(cfg)
+        else:
+            self.shards[source].reset_collection()
+        if source in self.indexes:
+            self.indexes[source].clear()
+
+    # --- ПОИСК ---
+
+    def _exact_search(self, source: str, embedding: List[float], k: int, ids: List[str]) -> List[Tuple[Document, float]]:
+        """
+        Точный поиск по небольшому набору кандидатов: один матричный dot product вместо HNSW.
+        Только для шардов Chroma - кандидатов дает MetadataIndex, а он строится только для них.
+        """
+        store = self.shards[source]
+        data = store.get(ids=ids, include=["embeddings", "documents", "metadatas"])
+        matrix = np.asarray(data["embeddings"], dtype=np.float32)
+        query = np.asarray(embedding, dtype=np.float32)
+
+        # Дистанция в той же метрике, что и у коллекции, чтобы релевантность была сравнима с HNSW-шардами
+        space = self.shard_config[source].get("collection_metadata", {}).get("hnsw:space", "l2")
+        if space == "cosine":
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+            distances = 1.0 - matrix @ (query / (np.linalg.norm(query) + 1e-12))
+        elif space == "ip":
+            distances = 1.0 - matrix @ query
+        else:
+            distances = ((matrix - query) ** 2).sum(axis=1)
+
+        top = np.argsort(distances)[:k]
+        relevance_fn = store._select_relevance_score_fn()
+        return [
+            (
+                Document(page_content=data["documents"][i], metadata=data["metadatas"][i], id=data["ids"][i]),
+                relevance_fn(float(distances[i])),
+            )
+            for i in top
+        ]
+
+    def _search_shard(self, source: str, embedding: List[float], k: int, where: FilterResult) -> List[Tuple[Document, float]]:
+        store = self.shards[source]
+
+        # Селективный фильтр: кандидатов мало - считаем точно (HNSW с пост-фильтрацией может вернуть меньше k)
+        if where is not True and source in self.indexes:
+            candidates = self.indexes[source].candidates(where)
+            if candidates is not None and len(candidates) <= EXACT_SEARCH_THRESHOLD:
+                if not candidates:
+                    return []
+                return self._exact_search(source, embedding, k, candidates)
+
+        results = store.similarity_search_by_vector_with_relevance_scores(
+            embedding, k=k, filter=None if where is True else where
+        )
+        # Переводим дистанцию в релевантность [0, 1] с учетом метрики шарда (cosine/l2/ip)
+        relevance_fn = store._select_relevance_score_fn()
+        return [(doc, relevance_fn(distance)) for doc, distance in results]
+
+    def _search_by_vector(self, embedding: List[float], k: int, filter: Optional[Dict[str, Any]]) -> List[Tuple[Document, float]]:
+        """Fan-out в подходящие шарды параллельно и слияние по нормированной релевантности."""
+        filter = canonicalize_filter(filter)
+        plan = {source: specialize_filter(filter, source) for source in self.shards}
+        plan = {source: where for source, where in plan.items() if where is not False}
+        if not plan:
+            return []
+
+        try:
+            futures = [
+                self._pool.submit(self._search_shard, source, embedding, k, where)
+                for source, where in plan.items()
+            ]
+        except RuntimeError:
+            # Пул остановлен close(): версию заменили, пока шел этот запрос - дорабатываем в своем потоке
+            futures = None
+
+        merged: List[Tuple[Document, float]] = []
+        if futures is None:
+            for source, where in plan.items():
+                merged.extend(self._search_shard(source, embedding, k, where))
+        for future in futures or []:
+            merged.extend(future.result())
+        merged.sort(key=lambda pair: pair[1], reverse=True)
+        return merged[:k]
+
+    def similarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        # Запрос кодируем один раз на все шарды
+        embedding = self._embedding_function.embed_query(query)
+        return self._search_by_vector(embedding, k, filter)
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self._search_by_vector(embedding, k, filter)
+
+    def _candidate_embeddings(self, docs: List[Document]) -> np.ndarray:
+        """Эмбеддинги найденных документов (одним get() на шард)."""
+        by_source: Dict[str, List[str]] = {}
+        for doc in docs:
+            by_source.setdefault(normalize_source_type(doc.metadata.get("source_type", "")), []).append(doc.id)
+        vectors: Dict[str, Any] = {}
+        for source, ids in by_source.items():
+            data = self.shards[source].get(ids=ids, include=["embeddings"])
+            vectors.update(zip(data["ids"], data["embeddings"]))
+        return np.asarray([vectors[doc.id] for doc in docs], dtype=np.float32)
+
+    def max_marginal_relevance_search_with_relevance_scores(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = DEFAULT_FETCH_K,
+        lambda_mult: float = DEFAULT_LAMBDA,
+        filter: Optional[Dict[str, Any]] = None,
+        group_caps: Optional[Dict[str, int]] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        """
+        MMR поверх fetch_k лучших кандидатов из всех шардов: убирает почти одинаковые сегменты
+        и ограничивает число документов одной программы / одного спикера (group_caps).
+        """
+        embedding = self._embedding_function.embed_query(query)
+        candidates = self._search_by_vector(embedding, max(fetch_k, k), filter)
+        return self.mmr_rerank(embedding, candidates, k, lambda_mult, group_caps)
+
+    def mmr_rerank(
+        self,
+        embedding: List[float],
+        candidates: List[Tuple[Document, float]],
+        k: int,
+        lambda_mult: float = DEFAULT_LAMBDA,
+        group_caps: Optional[Dict[str, int]] = None,
+    ) -> List[Tuple[Document, float]]:
+        """MMR по уже найденным кандидатам (например, отфильтрованным локально в speculative_retriever)."""
+        if len(candidates) <= 1:
+            return candidates[:k]
+
+        docs = [doc for doc, _ in candidates]
+        caps = DEFAULT_GROUP_CAPS if group_caps is None else group_caps
+        picked = mmr_select(
+            np.asarray(embedding, dtype=np.float32),
+            self._candidate_embeddings(docs),
+            k,
+            lambda_mult=lambda_mult,
+            groups={field: [doc.metadata.get(field) for doc in docs] for field in caps},
+            caps=caps,
+        )
+        return [candidates[i] for i in picked]
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = DEFAULT_FETCH_K,
+        lambda_mult: float = DEFAULT_LAMBDA,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        results = self.max_marginal_relevance_search_with_relevance_scores(
+            query, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, filter=filter, **kwargs
+        )
+        return [doc for doc, _ in results]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        # Сырые дистанции разных шардов несравнимы, поэтому и здесь отдаем релевантность (больше = лучше)
+        return self.similarity_search_with_relevance_scores(query, k=k, filter=filter, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_relevance_scores(query, k=k, filter=filter, **kwargs)]
+
+    def get(self, limit: Optional[int] = None, **kwargs: Any) -> Dict[str, List[Any]]:
+        """Аналог Chroma.get(): склеивает ответы всех шардов."""
+        merged: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+        for store in self.shards.values():
+            remaining = None if limit is None else limit - len(merged["ids"])
+            if remaining is not None and remaining <= 0:
+                break
+            data = store.get(limit=remaining, **kwargs)
+            for key in merged:
+                if data.get(key) is not None:
+                    merged[key].extend(list(data[key]))
+        return merged
+
+
+def _copy_into(store: ShardedVectorStore, data: Dict[str, Any]) -> int:
+    """Раскладывает выгрузку вида Chroma.get() (с эмбеддингами) по шардам store."""
+    by_shard: Dict[str, Dict[str, list]] = {}
+    for doc_id, text, meta, emb in zip(data["ids"], data["documents"], data["metadatas"], data["embeddings"]):
+        meta = canonicalize_metadata(meta or {})
+        batch = by_shard.setdefault(meta.get("source_type", ""), {"ids": [], "texts": [], "metadatas": [], "embeddings": []})
+        batch["ids"].append(doc_id)
+        batch["texts"].append(text)
+        batch["metadatas"].append(meta)
+        batch["embeddings"].append(emb)
+
+    for source, batch in by_shard.items():
+        store.add_embeddings(source, **batch)
+        print(f"📦 Шард '{source}': записано {len(batch['ids'])} документов.")
+    return sum(len(b["ids"]) for b in by_shard.values())
+
+
+def migrate_legacy_collection(backend: str = VECTOR_BACKEND) -> int:
+    """
+    Переносит документы из старой общей коллекции Chroma в шарды выбранного бэкенда
+    (вместе с готовыми эмбеддингами, модель загружать не нужно). Возвращает число документов.
+    """
+    from langchain_chroma import Chroma
+    legacy = Chroma(collection_name=LEGACY_COLLECTION, persist_directory=CHROMA_PATH)
+    data = legacy.get(include=["documents", "metadatas", "embeddings"])
+    if not data["ids"]:
+        print(f"⚠️ Коллекция '{LEGACY_COLLECTION}' пуста или не найдена.")
+        return 0
+    return _copy_into(ShardedVectorStore(backend=backend), data)
+
+
+def convert_backend(source_backend: str = "chroma", target_backend: str = "numpy") -> int:
+    """Копирует все шарды из одного бэкенда в другой (например, Chroma -> NumPy) без пересчета эмбеддингов."""
+    source = ShardedVectorStore(backend=source_backend)
+    target = ShardedVectorStore(backend=target_backend)
+    total = 0
+    for name in source.shards:
+        target.reset_shard(name)
+        total += _copy_into(target, source.shards[name].get(include=["documents", "metadatas", "embeddings"]))
+    return total
+
+
+if __name__ == "__main__":
+    # python sharded_store.py --migrate   -> разложить старую общую коллекцию по шардам (бэкенд из VECTOR_BACKEND)
+    # python sharded_store.py --to-numpy  -> скопировать шарды Chroma в NumPy-бэкенд
+    if "--migrate" in sys.argv:
+        total = migrate_legacy_collection()
+        print(f"✅ Миграция завершена: {total} документов.")
+    elif "--to-numpy" in sys.argv:
+        total = convert_backend("chroma", "numpy")
+        print(f"✅ Скопировано в '{NUMPY_PATH}': {total} документов.")
+    else:
+        print("Использование: python sharded_store.py --migrate | --to-numpy")
@@ -0,0 +1,131 @@
+'''
+Спекулятивный поиск: векторный поиск не ждет, пока LLM построит фильтр.
+
+Обычный SelfQueryRetriever.invoke: LLM (фильтр) -> поиск, задержки складываются.
+Здесь LLM-запрос уходит в фоновый поток, а тем временем идет широкий поиск без фильтра
+(WIDE_K кандидатов). Дальше:
+- фильтр пришел, и после локальной проверки (matches_filter) осталось >= k кандидатов - ответ из них;
+- осталось мало (фильтр селективный) - повторный поиск уже с фильтром;
+- LLM не успела к дедлайну или упала (сеть, разбор ответа) - ответ из широкого поиска без фильтра LLM
+  (фильтр по экзаменам локальный и применяется все равно), с пометкой degraded; ошибка - в error.
+
+Если фильтр пережили хотя бы k кандидатов, это ровно те же k лучших, что дал бы поиск с фильтром
+по исходному вопросу (широкая выборка - префикс общей выдачи). Если LLM переписала текст запроса,
+ранжирование все равно по исходному вопросу; переписанный текст виден в search_query.
+
+Пример:
+    base = get_retriever()
+    retriever = SpeculativeRetriever(base, SubjectIndex.from_store(base.vectorstore))
+    result = retriever.retrieve("Бакалавриат дешевле 200 тысяч")
+    result.docs, result.degraded, result.path, result.timings_ms
+'''
+
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from metadata_index import canonicalize_filter, matches_filter
+from self_query_searcher import search_with_scores
+from subject_mask import merge_filters
+
+# --- НАСТРОЙКИ ---
+# Сколько кандидатов берет широкий поиск без фильтра
+WIDE_K = 60
+# Сколько секунд ждем фильтр от LLM (от начала запроса)
+LLM_DEADLINE = 4.0
+# Потоков для LLM-запросов (опоздавший запрос дорабатывает в фоне и занимает поток)
+LLM_WORKERS = 4
+
+
+@dataclass
+class SpeculativeResult:
+    docs: List[Document]
+    scores: List[float]
+    degraded: bool                     # LLM не успела или упала: фильтр не применен
+    path: str                          # "speculative" | "requery" | "degraded"
+    filter: Optional[Dict[str, Any]] = None
+    search_query: Optional[str] = None
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None        # Почему degraded: таймаут или исключение из LLM
+
+
+class SpeculativeRetriever:
+    def __init__(self, retriever: Any, subject_index: Any = None, wide_k: int = WIDE_K,
+                 llm_deadline: float = LLM_DEADLINE, min_survivors: Optional[int] = None):
+        self.retriever = retriever
+        self.vectorstore = retriever.vectorstore
+        self.subject_index = subject_index
+        self.wide_k = wide_k
+        self.llm_deadline = llm_deadline
+        self.k = retriever.search_kwargs.get("k", 4)
+        # Сколько кандидатов должно пережить фильтр, чтобы не делать повторный поиск
+        self.min_survivors = min_survivors or self.k
+        self._pool = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+
+    def _construct(self, query: str):
+        """Фоновая часть: LLM строит структурированный запрос -> (текст запроса, search_kwargs)."""
+        structured_query = self.retriever.query_constructor.invoke({"query": query})
+        new_query, search_kwargs = self.retriever._prepare_query(query, structured_query)
+        if self.subject_index is not None:
+            search_kwargs["filter"] = merge_filters(search_kwargs.get("filter"), self.subject_index.filter_for_query(query))
+        return new_query, search_kwargs
+
+    def _finish(self, embedding: List[float], candidates: list, k: int, search_kwargs: Dict[str, Any]) -> list:
+        """Итоговые k из кандидатов: MMR, если ретривер настроен на mmr, иначе просто лучшие по релевантности."""
+        if self.retriever.search_type == "mmr" and hasattr(self.vectorstore, "mmr_rerank"):
+            fetch_k = search_kwargs.get("fetch_k", len(candidates))
+            return self.vectorstore.mmr_rerank(embedding, candidates[:fetch_k], k, search_kwargs.get("lambda_mult", 0.6))
+        return candidates[:k]
+
+    def _degraded(self, query: str, embedding: List[float], wide: list, error: str, timings: Dict[str, float],
+                  start: float) -> SpeculativeResult:
+        where = self.subject_index.filter_for_query(query) if self.subject_index is not None else None
+        candidates = [(doc, score) for doc, score in wide if matches_filter(doc.metadata, where)] if where else wide
+        pairs = self._finish(embedding, candidates, self.k, self.retriever.search_kwargs)
+        timings["total"] = (time.perf_counter() - start) * 1000
+        return SpeculativeResult([d for d, _ in pairs], [s for _, s in pairs], True, "degraded",
+                                 filter=where, timings_ms=timings, error=error)
+
+    def retrieve(self, query: str) -> SpeculativeResult:
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        llm_future = self._pool.submit(self._construct, query)
+
+        # Пока LLM думает: эмбеддинг вопроса и широкий поиск по всем шардам без фильтра
+        embedding = self.vectorstore.embeddings.embed_query(query)
+        wide = self.vectorstore.similarity_search_by_vector_with_relevance_scores(embedding, k=self.wide_k)
+        timings["wide_search"] = (time.perf_counter() - start) * 1000
+
+        try:
+            new_query, search_kwargs = llm_future.result(timeout=max(self.llm_deadline - (time.perf_counter() - start), 0.0))
+        except FutureTimeout:
+            return self._degraded(query, embedding, wide, f"LLM не ответила за {self.llm_deadline:.1f} с", timings, start)
+        except Exception as e:
+            return self._degraded(query, embedding, wide, f"{type(e).__name__}: {e}", timings, start)
+        timings["llm"] = (time.perf_counter() - start) * 1000
+
+        k = search_kwargs.get("k", self.k)
+        where = canonicalize_filter(search_kwargs.get("filter"))
+        survivors = [(doc, score) for doc, score in wide if matches_filter(doc.metadata, where)]
+        if len(survivors) >= min(self.min_survivors, k):
+            path = "speculative"
+            pairs = self._finish(embedding, survivors, k, search_kwargs)
+        else:
+            # Фильтр слишком селективный для широкой выборки - честный поиск с фильтром
+            path = "requery"
+            requery_start = time.perf_counter()
+            pairs = search_with_scores(self.vectorstore, self.retriever.search_type, new_query, search_kwargs)
+            timings["requery"] = (time.perf_counter() - requery_start) * 1000
+        timings["total"] = (time.perf_counter() - start) * 1000
+        return SpeculativeResult([d for d, _ in pairs], [s for _, s in pairs], False, path,
+                                 filter=search_kwargs.get("filter"), search_query=new_query, timings_ms=timings)
+
+    def invoke(self, query: str) -> List[Document]:
+        """Тот же интерфейс, что у ретривера LangChain (для bot_handlers / load_test)."""
+        return self.retrieve(query).docs
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
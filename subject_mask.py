@@ -0,0 +1,239 @@
+'''
+Битовые маски вступительных экзаменов.
+
+В таблице приема экзамены записаны как "Р + М + И/Ф": слагаемые обязательны, через "/" - на выбор.
+При загрузке (create_db.py) это кодируется целыми числами в метаданных таблицы:
+    subj_required - маска обязательных предметов (слагаемые без альтернатив),
+    subj_choices  - группы "на выбор", по SUBJECT_BITS бит на группу (до MAX_CHOICE_GROUPS групп),
+    subj_any      - все упомянутые предметы.
+Chroma не умеет побитовые операции, поэтому вопросы "есть ли физика", "можно ли без физики",
+"куда поступить с моими ЕГЭ" считаются в SubjectIndex сразу по всем программам (NumPy),
+а в поиск уходит готовый фильтр по program_code. Он ограничивает только шард таблиц: страницы сайта,
+PDF и подкасты без program_code вопросом про экзамены не отсекаются.
+
+Пример:
+    index = SubjectIndex.from_store(vectorstore)
+    where = index.filter_for_query("Куда поступить без физики?")   # None, если про экзамены не спрашивали
+'''
+
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from metadata_index import normalize_program_code
+
+# --- НАСТРОЙКИ ---
+# Бит предмета (порядок менять нельзя: маски уже лежат в базе)
+SUBJECTS = ["Русский", "Математика", "Информатика", "Физика", "Химия",
+            "Обществознание", "Иностранный", "Биология", "География", "Литература"]
+SUBJECT_BITS = 16
+MAX_CHOICE_GROUPS = 3
+# Русский обязателен везде: если в вопросе перечислены ЕГЭ без него, считаем, что он сдан
+IMPLIED_SUBJECTS = ["Русский"]
+# Шард, к которому применяется фильтр по программам (у остальных шардов program_code может не быть)
+TABLE_SOURCE = "Таблица"
+
+# Сокращения из таблицы приема (как в table_parser.normalize_subjects)
+ABBREVIATIONS = {
+    "Р": "Русский", "М": "Математика", "И": "Информатика", "Ф": "Физика",
+    "Х": "Химия", "X": "Химия", "О": "Обществознание", "ИЯ": "Иностранный",
+    "Б": "Биология", "Г": "География", "Л": "Литература",
+}
+# Основы слов для поиска предметов в тексте вопроса ("физики", "информатику", "матан")
+STEMS = {
+    "русск": "Русский", "математ": "Математика", "матем": "Математика", "матан": "Математика",
+    "информат": "Информатика", "физик": "Физика", "хими": "Химия", "обществ": "Обществознание",
+    "иностран": "Иностранный", "английск": "Иностранный", "биолог": "Биология",
+    "географ": "География", "литератур": "Литература",
+}
+
+BIT = {name: 1 << i for i, name in enumerate(SUBJECTS)}
+_STEM_RE = re.compile(r"(?i)\b(" + "|".join(sorted(STEMS, key=len, reverse=True)) + r")\w*")
+# Предметы сразу после отрицания - до конца придаточного: "без физики, но с информатикой" исключает только физику.
+# Запятая заканчивает придаточное, только если дальше не следующий предмет: "без физики, химии" - перечисление
+_SUBJECT_AHEAD = r"(?:и\s+)?(?:" + "|".join(sorted(STEMS, key=len, reverse=True)) + r")"
+_CLAUSE_END = r"(?=\s*(?:,(?!\s*" + _SUBJECT_AHEAD + r")|[.;:!?()]|\b(?:но|а|зато|однако|с|со|не)\b|$))"
+_EXCLUDE_RE = re.compile(r"(?i)\b(?:без|кроме|не\s+сдавал\w*|нет)\s+(.+?)" + _CLAUSE_END)
+# Полный набор ЕГЭ - только явное "сдал(а) / сдавал(а) X и Y" ("нужно ли сдавать физику" - не набор)
+_PASSED_RE = re.compile(r"(?i)(?<!не )\b(?:сдал[аи]?|сдавал[аи]?)\s+(.+?)" + _CLAUSE_END)
+
+
+def subject_name(token: str) -> Optional[str]:
+    """'И' / 'Информатика' / 'физики' -> каноническое имя предмета."""
+    token = token.strip()
+    if token.upper() in ABBREVIATIONS:
+        return ABBREVIATIONS[token.upper()]
+    match = _STEM_RE.match(token)
+    return STEMS[match.group(1).lower()] if match else None
+
+
+def mask_of(subjects: Iterable[str]) -> int:
+    mask = 0
+    for name in subjects:
+        mask |= BIT[name]
+    return mask
+
+
+def subjects_in_text(text: str) -> Set[str]:
+    return {STEMS[m.group(1).lower()] for m in _STEM_RE.finditer(text)}
+
+
+@dataclass
+class ExamMask:
+    required: int
+    choices: List[int]
+
+    @property
+    def any(self) -> int:
+        mask = self.required
+        for group in self.choices:
+            mask |= group
+        return mask
+
+    @property
+    def packed_choices(self) -> int:
+        packed = 0
+        for i, group in enumerate(self.choices[:MAX_CHOICE_GROUPS]):
+            packed |= group << (i * SUBJECT_BITS)
+        return packed
+
+    def metadata(self) -> Dict[str, int]:
+        """Поля для метаданных документа (целые числа - их принимает любой бэкенд)."""
+        return {"subj_required": self.required, "subj_choices": self.packed_choices, "subj_any": self.any}
+
+
+def parse_exams(raw: str) -> ExamMask:
+    """'Р (min 40) + М (min 40) + И (min 46)/Ф (min 41)' -> обязательные Р|М и группа выбора И|Ф."""
+    required, choices = 0, []
+    clean = re.sub(r"\(.*?\)", "", raw or "")
+    for term in re.split(r"\s*\+\s*", clean):
+        names = [subject_name(t) for t in term.split("/") if t.strip()]
+        group = mask_of(name for name in names if name)
+        if not group:
+            continue
+        if len([name for name in names if name]) == 1:
+            required |= group
+        else:
+            choices.append(group)
+    return ExamMask(required, choices)
+
+
+def unpack_choices(packed: np.ndarray) -> np.ndarray:
+    """Столбец subj_choices -> матрица (программ x MAX_CHOICE_GROUPS) масок групп."""
+    shifts = np.arange(MAX_CHOICE_GROUPS, dtype=np.int64) * SUBJECT_BITS
+    return (packed[:, None] >> shifts) & ((1 << SUBJECT_BITS) - 1)
+
+
+class SubjectIndex:
+    """Маски экзаменов всех программ в массивах NumPy: каждый запрос - пара побитовых операций."""
+
+    def __init__(self, codes: List[str], required: np.ndarray, choices: np.ndarray):
+        self.codes = np.asarray(codes, dtype=object)
+        self.required = np.asarray(required, dtype=np.int64)
+        self.choices = unpack_choices(np.asarray(choices, dtype=np.int64))
+        self.any = self.required | np.bitwise_or.reduce(self.choices, axis=1)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @classmethod
+    def from_metadatas(cls, metadatas: Iterable[Dict[str, Any]]) -> "SubjectIndex":
+        codes, required, choices = [], [], []
+        for meta in metadatas:
+            if not meta or "subj_required" not in meta:
+                continue
+            codes.append(normalize_program_code(meta.get("program_code", "")))
+            required.append(int(meta["subj_required"]))
+            choices.append(int(meta.get("subj_choices", 0)))
+        return cls(codes, np.array(required, dtype=np.int64), np.array(choices, dtype=np.int64))
+
+    @classmethod
+    def from_store(cls, vectorstore: Any) -> "SubjectIndex":
+        """Маски из метаданных таблиц (у ShardedVectorStore читается только шард таблиц)."""
+        shards = getattr(vectorstore, "shards", None)
+        store = shards["Таблица"] if shards and "Таблица" in shards else vectorstore
+        index = cls.from_metadatas(store.get(include=["metadatas"])["metadatas"])
+        print(f"🧪 Индекс экзаменов: {len(index)} программ")
+        return index
+
+    # --- ЗАПРОСЫ (маска программ) ---
+
+    def has(self, subject: str) -> np.ndarray:
+        """Предмет упоминается (обязательный или на выбор)."""
+        return (self.any & BIT[subject]) != 0
+
+    def requires(self, subject: str) -> np.ndarray:
+        """Без этого предмета не поступить."""
+        return (self.required & BIT[subject]) != 0
+
+    def lacks(self, subject: str) -> np.ndarray:
+        return ~self.has(subject)
+
+    def avoidable(self, subjects: Iterable[str]) -> np.ndarray:
+        """Можно поступить, не сдавая ни одного из предметов: они не обязательны и в каждой группе есть другой вариант."""
+        banned = mask_of(subjects)
+        others = self.choices & ~banned
+        return ((self.required & banned) == 0) & np.all((self.choices == 0) | (others != 0), axis=1)
+
+    def satisfiable(self, exams: Iterable[str]) -> np.ndarray:
+        """Программы, куда можно подать с этим набором ЕГЭ: все обязательные есть и в каждой группе хоть один."""
+        mine = mask_of(exams)
+        return ((self.required & ~mine) == 0) & np.all((self.choices == 0) | ((self.choices & mine) != 0), axis=1)
+
+    # --- В ФИЛЬТР ПОИСКА ---
+
+    def programs(self, mask: np.ndarray) -> List[str]:
+        return sorted(set(self.codes[mask]))
+
+    def to_filter(self, mask: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Маска программ -> фильтр Chroma только для шарда таблиц: остальные шарды проходят по $ne
+        (ShardedVectorStore.specialize_filter снимает условие с них целиком). Пустая маска -> None.
+        """
+        codes = self.programs(mask)
+        if not codes:
+            return None
+        return {"$or": [{"source_type": {"$ne": TABLE_SOURCE}}, {"program_code": {"$in": codes}}]}
+
+    def mask_for_query(self, query: str) -> Optional[np.ndarray]:
+        """
+        Маска программ по вопросу или None, если вопрос не про набор экзаменов.
+        "без физики" / "кроме химии" -> avoidable; "сдал информатику и математику" -> satisfiable.
+        Вопросы о конкретном предмете ("баллы по математике", "нужно ли сдавать физику") фильтр не строят.
+        """
+        mask = None
+        excluded: Set[str] = set()
+        for match in _EXCLUDE_RE.finditer(query):
+            excluded |= subjects_in_text(match.group(1))
+        if excluded:
+            mask = self.avoidable(excluded)
+
+        passed: Set[str] = set()
+        for match in _PASSED_RE.finditer(query):
+            passed |= subjects_in_text(match.group(1))
+        passed -= excluded
+        if passed:
+            exams = passed | set(IMPLIED_SUBJECTS)
+            mask = self.satisfiable(exams) if mask is None else mask & self.satisfiable(exams)
+        return mask
+
+    def filter_for_query(self, query: str) -> Optional[Dict[str, Any]]:
+        """Фильтр для поиска или None: вопрос не про экзамены или ни одна программа не подходит (тогда ищем без него)."""
+        mask = self.mask_for_query(query)
+        return None if mask is None else self.to_filter(mask)
+
+
+def programs_in_filter(where: Dict[str, Any]) -> List[str]:
+    """Коды программ из фильтра to_filter (для журнала запросов)."""
+    return where["$or"][1]["program_code"]["$in"]
+
+
+def merge_filters(where: Optional[Dict[str, Any]], extra: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Фильтр LLM и фильтр по экзаменам через $and (любой может отсутствовать)."""
+    if not extra:
+        return where
+    if not where:
+        return extra
+    return {"$and": [where, extra]}
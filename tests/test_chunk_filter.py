@@ -0,0 +1,31 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunk_filter import ChunkFilter
+
+# Самые ценные чанки приема почти целиком из цифр - они не должны считаться мусором
+ADMISSION_CHUNKS = [
+    "Стоимость обучения 2025/2026: 09.03.01 — 320 000 руб., 09.03.02 — 310 000 руб., 15.03.01 — 290 000 руб.",
+    "Проходной балл 2021: 245, 2022: 251, 2023: 248, 2024: 255.",
+    "Контрольные цифры приема: 09.03.01 25 15 10; 09.03.03 20 10 5; 15.03.05 30 20 0.",
+]
+
+GARBAGE_CHUNKS = {
+    "code": ".menu{color:#fff;margin:0 auto}.nav>li{display:inline-block}.nav a{padding:4px}",
+    "long_token": "Скачать " + "QmFzZTY0IGVuY29kZWQgYmxvYg" * 8,
+    "symbols": "| --- | --- | --- | *** | ::: | ... | /// | --- |",
+}
+
+
+def test_numeric_admission_chunks_are_kept():
+    chunk_filter = ChunkFilter()
+    for chunk in ADMISSION_CHUNKS:
+        assert chunk_filter.check(chunk) is None, chunk
+
+
+def test_garbage_is_rejected_with_reason():
+    chunk_filter = ChunkFilter()
+    for reason, chunk in GARBAGE_CHUNKS.items():
+        assert chunk_filter.check(chunk) == reason
@@ -0,0 +1,39 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from subject_mask import SubjectIndex, parse_exams
+
+# Программа -> экзамены в записи таблицы приема
+PROGRAMS = {
+    "09.03.01": "Р + М + И/Ф",
+    "15.03.01": "Р + М + Ф",
+    "38.03.01": "Р + М",
+    "18.03.01": "Р + М + Х",
+}
+
+
+def make_index() -> SubjectIndex:
+    return SubjectIndex.from_metadatas(
+        {"program_code": code, **parse_exams(exams).metadata()} for code, exams in PROGRAMS.items()
+    )
+
+
+def programs_for(query: str):
+    index = make_index()
+    return index.programs(index.mask_for_query(query))
+
+
+def test_passed_subjects_listed_with_commas():
+    assert programs_for("Сдала математику, физику и русский, куда поступить?") == ["09.03.01", "15.03.01", "38.03.01"]
+    assert programs_for("сдал русский, математику, химию") == ["18.03.01", "38.03.01"]
+
+
+def test_excluded_subjects_listed_with_commas():
+    assert programs_for("Куда поступить без физики, химии?") == ["09.03.01", "38.03.01"]
+
+
+def test_comma_before_other_clause_ends_list():
+    assert programs_for("Без физики, но с химией") == ["09.03.01", "18.03.01", "38.03.01"]
+    assert programs_for("сдал математику и информатику, а физику не сдавал") == ["09.03.01", "38.03.01"]
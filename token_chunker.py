@@ -0,0 +1,202 @@
+'''
+Чанкер, который меряет длину настоящим токенизатором модели эмбеддингов (e5: окно 512 токенов).
+
+- Текст режется по предложениям; реплики "Вопрос:/Ответ:" и строки диалога (— ...) - предпочтительные
+  границы чанка. Перекрытие считается в токенах (целыми предложениями).
+- Все предложения всех документов токенизируются ОДНИМ батчевым вызовом быстрого (Rust) токенизатора.
+- Отчет "до/после": сколько текстов модель обрезала бы на 512 токенах, сколько токенов при этом выброшено,
+  сколько слотов батча уходит на паддинг и сколько крошечных чанков.
+
+Пример:
+    chunker = TokenChunker()
+    parts = chunker.split_with_prefix(["Источник: ...\\n"], [long_text])[0]
+'''
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Sequence, Tuple
+
+E5_MODEL_NAME = "intfloat/multilingual-e5-large"
+# Окно модели (вместе со служебными токенами <s> и </s>)
+MAX_TOKENS = 512
+SPECIAL_TOKENS = 2
+# Целевой размер чанка и перекрытие (в токенах текста)
+CHUNK_TOKENS = 384
+OVERLAP_TOKENS = 64
+# Чанки короче этого приклеиваются к соседу: отдельный вектор для пары слов - пустая трата слота батча
+MIN_TOKENS = 24
+# Батч, с которым считается паддинг в отчете (как batch_size у sentence-transformers)
+REPORT_BATCH_SIZE = 32
+
+# Начало реплики: "Вопрос:", "Ответ:", "В:", "О:" или строка диалога с тире
+_TURN_RE = re.compile(r"^\s*(?:(?:Вопрос|Ответ|В|О)\s*[:.)]|[-—–]\s)")
+# Конец предложения: знак препинания + пробел + заглавная буква/цифра/кавычка/тире
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+(?=[«\"(\[A-ZА-ЯЁ0-9—–-])")
+
+
+@lru_cache(maxsize=4)
+def load_tokenizer(model_name: str = E5_MODEL_NAME):
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name, use_fast=True)
+
+
+def split_units(text: str) -> List[Tuple[str, bool]]:
+    """Текст -> [(предложение, начинает ли оно новую реплику/абзац)]."""
+    units = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        starts_turn = bool(_TURN_RE.match(line))
+        for j, sentence in enumerate(_SENTENCE_RE.split(line.strip())):
+            if sentence.strip():
+                units.append((sentence.strip(), starts_turn and j == 0))
+    return units
+
+
+@dataclass
+class TokenReport:
+    texts: int
+    total_tokens: int
+    truncated: int           # текстов длиннее окна модели
+    truncated_tokens: int    # токенов, которые модель выбросила бы
+    tiny: int                # текстов короче MIN_TOKENS
+    padding_ratio: float     # доля слотов батча, занятых паддингом
+    max_len: int
+
+    def line(self) -> str:
+        return (f"текстов {self.texts}, токенов {self.total_tokens}, обрезано {self.truncated} "
+                f"(-{self.truncated_tokens} ток.), крошечных {self.tiny}, паддинг {self.padding_ratio:.1%}, макс. {self.max_len}")
+
+
+class TokenChunker:
+    def __init__(
+        self,
+        model_name: str = E5_MODEL_NAME,
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = OVERLAP_TOKENS,
+        max_tokens: int = MAX_TOKENS,
+        min_tokens: int = MIN_TOKENS,
+    ):
+        self.tokenizer = load_tokenizer(model_name)
+        self.max_tokens = max_tokens
+        self.chunk_tokens = min(chunk_tokens, max_tokens - SPECIAL_TOKENS)
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = min_tokens
+
+    # --- ТОКЕНЫ ---
+
+    def lengths(self, texts: Sequence[str]) -> List[int]:
+        """Длины в токенах (без служебных) для всего списка одним батчевым вызовом."""
+        if not texts:
+            return []
+        encoded = self.tokenizer(list(texts), add_special_tokens=False,
+                                 return_attention_mask=False, return_token_type_ids=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _hard_split(self, text: str, budget: int) -> List[str]:
+        """Предложение длиннее бюджета режем по границам токенов (через offset mapping)."""
+        offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        step = max(budget - self.overlap_tokens, 1)
+        pieces = []
+        for start in range(0, len(offsets), step):
+            window = offsets[start:start + budget]
+            pieces.append(text[window[0][0]:window[-1][1]].strip())
+            if start + budget >= len(offsets):
+                break
+        return pieces
+
+    # --- ЧАНКИНГ ---
+
+    def _pack(self, units: List[Tuple[str, bool, int]], budget: int) -> List[str]:
+        """Жадно набирает предложения до бюджета, перенося хвост предыдущего чанка как перекрытие."""
+        chunks: List[str] = []
+        current: List[Tuple[str, bool, int]] = []
+        size = 0
+
+        def flush():
+            chunks.append(" ".join(("\n" if turn and i else "") + text for i, (text, turn, _) in enumerate(current)).replace(" \n", "\n"))
+
+        for unit in units:
+            text, turn, n = unit
+            # Новая реплика - удобное место для разреза, если чанк уже наполовину полон
+            boundary = turn and size >= budget // 2
+            if current and (size + n > budget or boundary):
+                flush()
+                overlap, carried = [], 0
+                for prev in reversed(current):
+                    if carried + prev[2] > self.overlap_tokens or len(overlap) + 1 >= len(current):
+                        break
+                    overlap.insert(0, prev)
+                    carried += prev[2]
+                # Перекрытие не тянем через границу реплики: новый вопрос начинается с чистого листа
+                current, size = ([], 0) if boundary else (overlap, carried)
+                while current and size + n > budget:
+                    size -= current.pop(0)[2]
+            current.append(unit)
+            size += n
+        if current:
+            flush()
+
+        # Крошечный хвост приклеиваем к предыдущему чанку, если влезает в окно
+        if len(chunks) > 1:
+            tail_len = self.lengths([chunks[-1], chunks[-2]])
+            if tail_len[0] < self.min_tokens and sum(tail_len) <= self.max_tokens - SPECIAL_TOKENS:
+                chunks[-2:] = [chunks[-2] + " " + chunks[-1]]
+        return chunks
+
+    def split_with_prefix(self, prefixes: Sequence[str], texts: Sequence[str]) -> List[List[str]]:
+        """
+        Для каждого текста - список чанков вида prefix + кусок текста, каждый влезает в окно модели.
+        Префикс (шапка с контекстом) повторяется в каждом чанке и входит в бюджет.
+        """
+        per_text = [split_units(t) for t in texts]
+        flat = [u[0] for units in per_text for u in units]
+        # Одним вызовом: все предложения всех текстов + все префиксы
+        lens = self.lengths(flat + list(prefixes))
+        unit_lens, prefix_lens = lens[:len(flat)], lens[len(flat):]
+
+        result: List[List[str]] = []
+        pos = 0
+        for prefix, prefix_len, units in zip(prefixes, prefix_lens, per_text):
+            budget = max(self.chunk_tokens - prefix_len, self.min_tokens)
+            measured = []
+            for text, turn in units:
+                n = unit_lens[pos]
+                pos += 1
+                if n > budget:
+                    pieces = self._hard_split(text, budget)
+                    measured.extend((p, turn and i == 0, m) for i, (p, m) in enumerate(zip(pieces, self.lengths(pieces))))
+                else:
+                    measured.append((text, turn, n))
+            result.append([prefix + chunk for chunk in self._pack(measured, budget)] or [prefix.rstrip()])
+        return result
+
+    def split_texts(self, texts: Sequence[str]) -> List[List[str]]:
+        return self.split_with_prefix([""] * len(texts), texts)
+
+    def split_text(self, text: str) -> List[str]:
+        return self.split_texts([text])[0]
+
+    # --- ОТЧЕТ ---
+
+    def report(self, texts: Sequence[str], batch_size: int = REPORT_BATCH_SIZE) -> TokenReport:
+        """Что произойдет при кодировании texts: обрезка на окне и паддинг в батчах (сортировка по длине, как в sentence-transformers)."""
+        lens = [n + SPECIAL_TOKENS for n in self.lengths(texts)]
+        window = [min(n, self.max_tokens) for n in lens]
+        ordered = sorted(window, reverse=True)
+        slots = sum(max(ordered[i:i + batch_size]) * len(ordered[i:i + batch_size]) for i in range(0, len(ordered), batch_size))
+        return TokenReport(
+            texts=len(lens),
+            total_tokens=sum(lens),
+            truncated=sum(n > self.max_tokens for n in lens),
+            truncated_tokens=sum(max(n - self.max_tokens, 0) for n in lens),
+            tiny=sum(n - SPECIAL_TOKENS < self.min_tokens for n in lens),
+            padding_ratio=1 - sum(window) / slots if slots else 0.0,
+            max_len=max(lens, default=0),
+        )
+
+
+def print_reports(before: TokenReport, after: TokenReport, title: str = "Токены") -> None:
+    print(f"📏 {title} ДО:    {before.line()}")
+    print(f"📏 {title} ПОСЛЕ: {after.line()}")